@@ -0,0 +1,298 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from evaluation import EVAL_CASES
+from index_config import INDEX_CONFIG_PATH, load_index_config, save_index_config
+
+CHROMA_PATH = "chroma"
+REPORT_PATH = "ann_tuning.json"
+DEFAULT_K = 5
+DEFAULT_QUERIES = 200
+# Smallest recall@k a configuration needs before latency decides.
+TARGET_RECALL = 0.95
+SPACES = ["l2", "cosine"]
+MAX_NEIGHBORS = [8, 16, 32]
+EF_CONSTRUCTION = [64, 128, 256]
+EF_SEARCH = [10, 25, 50, 100, 200]
+# Words taken from a chunk to form an in-domain query.
+QUERY_WORDS = 12
+
+# Questions the library should answer, phrased the way students ask them. The
+# sampled chunk windows are verbatim excerpts and sit much closer to their
+# chunk than a real question does, so calibrating on them gives a threshold
+# that rejects most real traffic; these (plus the evaluation.py questions)
+# are held out from the sweep and used for the threshold only.
+IN_DOMAIN_QUESTIONS = [
+    "Why do I get so anxious before exams?",
+    "How can I stop procrastinating on my assignments?",
+    "What can I do when I can't fall asleep because of stress?",
+    "How do I deal with feeling homesick at university?",
+    "Is it normal to feel overwhelmed in my first year?",
+    "How do I make friends when I feel socially anxious?",
+    "What is burnout and how do I know if I have it?",
+    "How can I calm down during a panic attack?",
+    "Why do I keep comparing myself to other students?",
+    "How do I talk to someone about how I'm feeling?",
+    "What helps with low motivation and feeling down?",
+    "How do I cope after a breakup?",
+    "How can I manage perfectionism?",
+    "What are signs that I should see a counsellor?",
+    "How do I handle pressure from my parents about grades?",
+    "Why do I feel lonely even when I'm around people?",
+] + [case["question"] for case in EVAL_CASES]
+
+# Questions the library has nothing to say about; their top-1 distances show
+# what "irrelevant" looks like when calibrating the relevance threshold.
+OFF_TOPIC_QUERIES = [
+    "What is the capital of Australia?",
+    "How do I change a flat tyre on my bike?",
+    "Give me a recipe for banana bread.",
+    "Who won the football world cup in 2010?",
+    "How many moons does Jupiter have?",
+    "What is the best laptop for gaming?",
+    "Explain how a car engine works.",
+    "How do I install Python on Windows?",
+    "What's the weather like in Tokyo in April?",
+    "How do I convert Celsius to Fahrenheit?",
+    "Recommend a good science fiction movie.",
+    "What is the price of bitcoin today?",
+    "How long should I boil an egg?",
+    "How do I fix a leaking kitchen tap?",
+    "What are the rules of cricket?",
+    "Translate 'good morning' into Spanish.",
+]
+
+
+def load_vectors(db, page_size=5000):
+    """(ids, texts, float32 matrix) for the whole collection."""
+    ids, texts, vectors = [], [], []
+    offset = 0
+    while True:
+        page = db.get(include=["embeddings", "documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    return ids, texts, np.concatenate(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+
+def sample_queries(texts, n, rng):
+    """Short word windows cut from random chunks, standing in for student questions."""
+    queries = []
+    for text in rng.sample(texts, min(n, len(texts))):
+        words = text.split()
+        start = rng.randint(0, max(0, len(words) - QUERY_WORDS))
+        queries.append(" ".join(words[start:start + QUERY_WORDS]))
+    return queries
+
+
+def exact_distances(space, vectors, queries):
+    """Brute-force distance matrix (queries x vectors), using Chroma's definitions."""
+    dots = queries @ vectors.T
+    if space == "cosine":
+        norms = np.linalg.norm(queries, axis=1)[:, None] * np.linalg.norm(vectors, axis=1)[None, :]
+        return 1.0 - dots / np.maximum(norms, 1e-12)
+    if space == "ip":
+        return 1.0 - dots
+    return (queries ** 2).sum(axis=1)[:, None] - 2 * dots + (vectors ** 2).sum(axis=1)[None, :]
+
+
+def exact_top_k(space, vectors, queries, k, block=256):
+    """Ground truth: index sets of the k nearest vectors for each query."""
+    truth = []
+    for start in range(0, len(queries), block):
+        distances = exact_distances(space, vectors, queries[start:start + block])
+        top = np.argpartition(distances, min(k, distances.shape[1] - 1), axis=1)[:, :k]
+        truth.extend(set(row.tolist()) for row in top)
+    return truth
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _dirs, files in os.walk(path) for name in files)
+
+
+def evaluate_index(vectors, query_vectors, truth, space, max_neighbors, ef_construction, ef_searches, k):
+    """Build one HNSW index and measure every ef_search against the ground truth."""
+    import chromadb
+
+    workdir = tempfile.mkdtemp(prefix="ann-tuning-")
+    try:
+        client = chromadb.PersistentClient(path=workdir)
+        collection = client.create_collection(
+            "tuning",
+            configuration={"hnsw": {"space": space, "max_neighbors": max_neighbors,
+                                    "ef_construction": ef_construction, "ef_search": ef_searches[0]}},
+        )
+        batch_size = client.get_max_batch_size()
+        start = time.perf_counter()
+        for i in range(0, len(vectors), batch_size):
+            collection.add(ids=[str(j) for j in range(i, min(i + batch_size, len(vectors)))],
+                           embeddings=vectors[i:i + batch_size])
+        build_seconds = time.perf_counter() - start
+        index_bytes = dir_size(workdir)
+
+        results = []
+        for ef_search in ef_searches:
+            collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+            # The loaded HNSW segment keeps the ef it was opened with, so
+            # reopen the client to search with the new value.
+            client._system.stop()
+            client.clear_system_cache()
+            client = chromadb.PersistentClient(path=workdir)
+            collection = client.get_collection("tuning")
+            collection.query(query_embeddings=[query_vectors[0]], n_results=k, include=[])  # load the index
+            latencies, found = [], 0
+            for query, expected in zip(query_vectors, truth):
+                started = time.perf_counter()
+                hits = collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0]
+                latencies.append(time.perf_counter() - started)
+                found += len({int(hit) for hit in hits} & expected)
+            latencies.sort()
+            results.append({
+                "space": space,
+                "max_neighbors": max_neighbors,
+                "ef_construction": ef_construction,
+                "ef_search": ef_search,
+                f"recall@{k}": found / (k * len(truth)) if truth else 0.0,
+                "p50_ms": 1000 * latencies[len(latencies) // 2],
+                "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+                "build_s": build_seconds,
+                "index_mb": index_bytes / 2 ** 20,
+            })
+        client._system.stop()
+        client.clear_system_cache()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def choose(results, k, target_recall=TARGET_RECALL):
+    """Fastest configuration that reaches the target recall (else the most accurate one)."""
+    recall = f"recall@{k}"
+    good = [r for r in results if r[recall] >= target_recall]
+    if good:
+        return min(good, key=lambda r: (r["p50_ms"], r["index_mb"]))
+    return max(results, key=lambda r: (r[recall], -r["p50_ms"]))
+
+
+def calibrate_threshold(space, vectors, in_domain, off_topic):
+    """Relevance threshold that best separates in-domain from off-topic top-1 distances.
+
+    Maximizes Youden's J (accepted in-domain rate minus accepted off-topic
+    rate) over the observed distances, taking the widest cut that does, and
+    then places the threshold halfway to the next observed distance so
+    questions slightly further out than the calibration set still pass.
+    """
+    relevant = exact_distances(space, vectors, in_domain).min(axis=1)
+    irrelevant = exact_distances(space, vectors, off_topic).min(axis=1)
+    candidates = np.unique(np.concatenate([relevant, irrelevant]))
+    best = None
+    for i, candidate in enumerate(candidates):
+        accepted = float((relevant <= candidate).mean())
+        false_accepted = float((irrelevant <= candidate).mean())
+        if best is None or accepted - false_accepted >= best[2] - best[3]:
+            best = (i, float(candidate), accepted, false_accepted)
+    i, threshold, accepted, false_accepted = best
+    if i + 1 < len(candidates):
+        threshold = (threshold + float(candidates[i + 1])) / 2
+    return {
+        "relevance_threshold": threshold,
+        "in_domain_accepted": accepted,
+        "off_topic_accepted": false_accepted,
+        "in_domain_p50": float(np.median(relevant)),
+        "off_topic_p50": float(np.median(irrelevant)),
+    }
+
+
+def tune(db, embedding_function, queries=DEFAULT_QUERIES, k=DEFAULT_K, spaces=SPACES, max_neighbors=MAX_NEIGHBORS,
+         ef_construction=EF_CONSTRUCTION, ef_search=EF_SEARCH, target_recall=TARGET_RECALL, seed=0):
+    rng = random.Random(seed)
+    _ids, texts, vectors = load_vectors(db)
+    if not len(vectors):
+        raise ValueError("The collection is empty; run populate_dataset.py first.")
+    query_texts = sample_queries(texts, queries, rng)
+    query_vectors = np.asarray(embedding_function.embed_documents(query_texts), dtype=np.float32)
+    in_domain_vectors = np.asarray(embedding_function.embed_documents(IN_DOMAIN_QUESTIONS), dtype=np.float32)
+    off_topic_vectors = np.asarray(embedding_function.embed_documents(OFF_TOPIC_QUERIES), dtype=np.float32)
+    print(f"📐 {len(vectors)} vectors, {len(query_texts)} sampled queries, k={k}")
+
+    results = []
+    for space in spaces:
+        truth = exact_top_k(space, vectors, query_vectors, k)
+        for m, efc in itertools.product(max_neighbors, ef_construction):
+            for row in evaluate_index(vectors, query_vectors, truth, space, m, efc, sorted(ef_search), k):
+                results.append(row)
+                print(f"  {row['space']:<7} M={row['max_neighbors']:<3} efC={row['ef_construction']:<4} "
+                      f"efS={row['ef_search']:<4} recall={row[f'recall@{k}']:.3f} "
+                      f"p50={row['p50_ms']:.2f}ms build={row['build_s']:.1f}s size={row['index_mb']:.1f}MB")
+
+    chosen = choose(results, k, target_recall)
+    # One threshold per swept space: the running collection keeps its current
+    # space until it is rebuilt, and needs a threshold on that scale meanwhile.
+    calibrations = {space: calibrate_threshold(space, vectors, in_domain_vectors, off_topic_vectors)
+                    for space in spaces}
+    return {"k": k, "target_recall": target_recall, "results": results, "chosen": chosen,
+            "calibration": calibrations[chosen["space"]], "calibrations": calibrations}
+
+
+def apply(report, path=INDEX_CONFIG_PATH):
+    chosen = report["chosen"]
+    config = load_index_config(path)
+    config["hnsw"] = {key: chosen[key] for key in ("space", "max_neighbors", "ef_construction", "ef_search")}
+    config.pop("relevance_threshold", None)
+    thresholds = config.setdefault("relevance_thresholds", {})
+    for space, calibration in report["calibrations"].items():
+        thresholds[space] = calibration["relevance_threshold"]
+    config["calibration"] = report["calibrations"]
+    save_index_config(config, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep HNSW settings against exact search and recalibrate the relevance threshold.")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries sampled from chunk text.")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--spaces", nargs="+", default=SPACES, choices=["l2", "cosine", "ip"])
+    parser.add_argument("--max-neighbors", nargs="+", type=int, default=MAX_NEIGHBORS, help="HNSW M values.")
+    parser.add_argument("--ef-construction", nargs="+", type=int, default=EF_CONSTRUCTION)
+    parser.add_argument("--ef-search", nargs="+", type=int, default=EF_SEARCH)
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=REPORT_PATH, help="Where to write the full sweep as JSON.")
+    parser.add_argument("--apply", action="store_true",
+                        help=f"Save the chosen settings and threshold to {INDEX_CONFIG_PATH}.")
+    args = parser.parse_args()
+
+    from chroma_client import open_chroma
+    from get_embedding_function import get_embedding_function
+
+    embedding_function = get_embedding_function()
+    db = open_chroma(embedding_function, CHROMA_PATH)
+    report = tune(db, embedding_function, queries=args.queries, k=args.k, spaces=args.spaces,
+                  max_neighbors=args.max_neighbors, ef_construction=args.ef_construction, ef_search=args.ef_search,
+                  target_recall=args.target_recall, seed=args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    chosen, calibration = report["chosen"], report["calibration"]
+    print(f"🏁 Chosen: space={chosen['space']} M={chosen['max_neighbors']} efC={chosen['ef_construction']} "
+          f"efS={chosen['ef_search']} (recall@{args.k} {chosen[f'recall@{args.k}']:.3f}, p50 {chosen['p50_ms']:.2f}ms)")
+    print(f"🎯 Relevance threshold for {chosen['space']}: {calibration['relevance_threshold']:.3f} "
+          f"(accepts {calibration['in_domain_accepted']:.0%} in-domain, "
+          f"{calibration['off_topic_accepted']:.0%} off-topic)")
+    if args.apply:
+        apply(report)
+        print(f"✅ Saved to {INDEX_CONFIG_PATH}. Rebuild with `python populate_dataset.py --reset` to use it.")
+
+
+if __name__ == "__main__":
+    main()
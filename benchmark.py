@@ -0,0 +1,298 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+
+from conversation_memory import count_tokens
+
+# Offline, deterministic benchmark: synthetic corpus -> the real ingestion path
+# -> concurrent query_rag sessions against a stub LLM. No Ollama, GPU or network.
+
+EMBEDDING_SIZE = 384  # same width as all-MiniLM-L6-v2
+
+TOPICS = [
+    "anxiety", "exam stress", "procrastination", "loneliness", "sleep", "motivation", "self-esteem",
+    "perfectionism", "burnout", "homesickness", "grief", "social anxiety", "time management", "resilience",
+]
+CONCEPTS = [
+    "cognitive behavioural therapy", "learned helplessness", "growth mindset", "cognitive reframing",
+    "mindfulness", "attachment theory", "the fight-or-flight response", "behavioural activation",
+    "self-compassion", "rumination", "catastrophizing", "social support", "sleep hygiene", "avoidance",
+]
+SENTENCES = [
+    "Research on {topic} suggests that {concept} can reduce distress in college students.",
+    "Many students experience {topic} during their first year, and {concept} offers a useful lens.",
+    "{Concept} describes how people respond when {topic} becomes overwhelming.",
+    "Clinicians often discuss {topic} together with {concept} because the two reinforce each other.",
+    "A practical exercise for {topic} is to notice patterns of {concept} and write them down.",
+    "Studies comparing groups found that {concept} predicted lower levels of {topic} over a semester.",
+]
+QUESTIONS = [
+    "How can I deal with {topic}?",
+    "What is {concept}?",
+    "Does {concept} help with {topic}?",
+    "I keep struggling with {topic}, what should I try?",
+    "Why does {topic} get worse before exams?",
+]
+RESPONSE = (
+    "It makes sense that this feels heavy. Many students go through something similar, and small steps "
+    "like naming the feeling, talking to someone you trust and keeping a steady routine can help."
+)
+
+
+class StubLLM(LLM):
+    """Stands in for Mistral: fixed answer after a configurable first-token delay and per-token pace.
+
+    Like Ollama, it keeps the previous prompt "evaluated": prefill_token_seconds
+    is only charged for tokens after the prefix shared with it. Every prompt and
+    the tokens it reused are recorded in `prompts` / `cached_tokens`.
+    """
+
+    first_token_seconds: float = 0.2
+    token_seconds: float = 0.005
+    prefill_token_seconds: float = 0.0
+    response: str = RESPONSE
+    prompts: List[str] = []
+    cached_tokens: List[int] = []
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-stub"
+
+    def _tokens(self):
+        return self.response.split(" ")
+
+    def _prefill(self, prompt):
+        with self._lock:
+            previous = self.prompts[-1] if self.prompts else ""
+            cached = count_tokens(os.path.commonprefix([previous, prompt]))
+            self.prompts.append(prompt)
+            self.cached_tokens.append(cached)
+        time.sleep(self.prefill_token_seconds * (count_tokens(prompt) - cached))
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        self._prefill(prompt)
+        time.sleep(self.first_token_seconds + self.token_seconds * (len(self._tokens()) - 1))
+        return self.response
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        self._prefill(prompt)
+        time.sleep(self.first_token_seconds)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_seconds)
+            yield GenerationChunk(text=token if i == 0 else " " + token)
+
+
+def fill(template, rng):
+    concept = rng.choice(CONCEPTS)
+    return template.format(topic=rng.choice(TOPICS), concept=concept, Concept=concept.capitalize())
+
+
+def generate_corpus(data_path, files, rows_per_file, rng):
+    """CSV files of synthetic textbook paragraphs (tabular_loaders streams each row as one Document)."""
+    os.makedirs(data_path, exist_ok=True)
+    total_chars = 0
+    for i in range(files):
+        with open(os.path.join(data_path, f"synthetic_{i:04d}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["chapter", "text"])
+            for row in range(rows_per_file):
+                text = " ".join(fill(rng.choice(SENTENCES), rng) for _ in range(rng.randint(4, 10)))
+                total_chars += len(text)
+                writer.writerow([f"{i}.{row}", text])
+    return total_chars
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(files, rows_per_file, sessions, turns, first_token_ms, token_ms, seed, workdir, prefill_token_ms=0.0):
+    # The ingestion and query code uses the repo's relative "data"/"chroma"
+    # paths (retrieval cache, lexical index, manifest), so the run works inside
+    # a scratch directory and never touches the real database. The working
+    # directory is process-wide, so it is restored however the run ends.
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return _run_in_workdir(files, rows_per_file, sessions, turns, first_token_ms, token_ms, seed,
+                               prefill_token_ms)
+    finally:
+        os.chdir(cwd)
+
+
+def _run_in_workdir(files, rows_per_file, sessions, turns, first_token_ms, token_ms, seed, prefill_token_ms):
+    import dataset
+    from conversation_memory import ConversationMemory, is_summary_prompt, llm_summarizer
+    from interactive_chat import PROMPT_TEMPLATE, query_rag
+    from langchain_chroma import Chroma
+    from metrics import metrics
+
+    rng = random.Random(seed)
+    corpus_chars = generate_corpus("data", files, rows_per_file, rng)
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_SIZE)
+
+    # --- Ingestion: load_documents -> split_documents -> calculate_chunk_ids -> add_to_chroma ---
+    timings = {}
+    start = time.perf_counter()
+    documents = dataset.load_documents(["data"])
+    timings["load_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks = dataset.split_documents(documents)
+    timings["split_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    dataset.calculate_chunk_ids(chunks)
+    timings["ids_s"] = time.perf_counter() - start
+    db = Chroma(persist_directory=dataset.CHROMA_PATH, embedding_function=embeddings)
+    start = time.perf_counter()
+    dataset.add_to_chroma(chunks, db=db, existing_ids=set())
+    timings["add_to_chroma_s"] = time.perf_counter() - start
+    ingest_seconds = sum(timings.values())
+    ingestion = {
+        "documents": len(documents),
+        "chunks": len(chunks),
+        "corpus_chars": corpus_chars,
+        "seconds": ingest_seconds,
+        "chunks_per_second": len(chunks) / ingest_seconds if ingest_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        **timings,
+    }
+
+    # --- Queries: concurrent sessions, each with its own short history ---
+    model = StubLLM(first_token_seconds=first_token_ms / 1000, token_seconds=token_ms / 1000,
+                    prefill_token_seconds=prefill_token_ms / 1000)
+    question_sets = [[fill(rng.choice(QUESTIONS), rng) for _ in range(turns)] for _ in range(sessions)]
+    metrics.reset()
+
+    def session(questions):
+        # Same memory as the CLI, so long sessions include summarization.
+        history = ConversationMemory(summarize=llm_summarizer(lambda: model, PROMPT_TEMPLATE.prefix))
+        latencies = []
+        for question in questions:
+            started = time.perf_counter()
+            response, _sources, _is_relevant = query_rag(question, history, db, model)
+            latencies.append(time.perf_counter() - started)
+            history.append(question, response)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        latencies = sorted(latency for result in executor.map(session, question_sets) for latency in result)
+    wall = time.perf_counter() - start
+    # Summaries share the model (and its prompt cache) but are not turns.
+    turn_prompts = [(prompt, cached) for prompt, cached in zip(model.prompts, model.cached_tokens)
+                    if not is_summary_prompt(prompt)]
+    queries = {
+        "sessions": sessions,
+        "turns_per_session": turns,
+        "queries": len(latencies),
+        "seconds": wall,
+        "throughput_qps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": 1000 * percentile(latencies, 0.5),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+        "max_ms": 1000 * latencies[-1] if latencies else 0.0,
+        "stages": metrics.snapshot()["stages"],
+        # Prompt tokens the stub (like Ollama) could skip because the previous prompt shared them.
+        "prompt_tokens_per_turn": (sum(count_tokens(prompt) for prompt, _cached in turn_prompts) / len(turn_prompts)
+                                   if turn_prompts else 0.0),
+        "prefill_tokens_saved_per_turn": (sum(cached for _prompt, cached in turn_prompts) / len(turn_prompts)
+                                          if turn_prompts else 0.0),
+        "summaries": len(model.prompts) - len(turn_prompts),
+    }
+    return {"ingestion": ingestion, "queries": queries, "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion + query benchmark (no Ollama, GPU or network).")
+    parser.add_argument("--files", type=int, default=20, help="Synthetic CSV files to generate.")
+    parser.add_argument("--rows-per-file", type=int, default=200, help="Paragraphs per file.")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent chat sessions.")
+    parser.add_argument("--turns", type=int, default=10, help="Questions asked per session.")
+    parser.add_argument("--llm-first-token-ms", type=float, default=200, help="Stub LLM delay before the first token.")
+    parser.add_argument("--llm-token-ms", type=float, default=5, help="Stub LLM delay per following token.")
+    parser.add_argument("--llm-prefill-token-ms", type=float, default=0,
+                        help="Stub LLM delay per prompt token not shared with the previous prompt.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory (corpus + Chroma).")
+    args = parser.parse_args()
+
+    # Retrieval results are cached per process; a shared on-disk tier would
+    # leak between runs, so the benchmark always runs without one.
+    os.environ.pop("RETRIEVAL_CACHE_PATH", None)
+    output = os.path.abspath(args.output)
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    workdir = tempfile.mkdtemp(prefix="mentor-bench-")
+    try:
+        results = run_benchmark(args.files, args.rows_per_file, args.sessions, args.turns,
+                                args.llm_first_token_ms, args.llm_token_ms, args.seed, workdir,
+                                prefill_token_ms=args.llm_prefill_token_ms)
+    finally:
+        if args.keep:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        **results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    ingestion, queries = results["ingestion"], results["queries"]
+    print(f"📥 Ingestion: {ingestion['chunks']} chunks in {ingestion['seconds']:.2f}s "
+          f"({ingestion['chunks_per_second']:.0f} chunks/s)")
+    print(f"💬 Queries: {queries['queries']} over {queries['sessions']} sessions, "
+          f"{queries['throughput_qps']:.1f} q/s, p50 {queries['p50_ms']:.0f} ms, p99 {queries['p99_ms']:.0f} ms")
+    print(f"♻️  Prefill: {queries['prefill_tokens_saved_per_turn']:.0f} of "
+          f"{queries['prompt_tokens_per_turn']:.0f} prompt tokens reused per turn")
+    print(f"🧠 Peak RSS: {results['peak_rss_mb']:.0f} MB")
+    print(f"✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import logging
+import os
+import resource
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from urllib.parse import urlparse
+
+import httpx
+from langchain_chroma import Chroma
+
+CHROMA_PATH = "chroma"
+# Set to a Chroma server (`chroma run --path chroma_server --port 8000`) to have every
+# entry point share it over HTTP instead of opening its own embedded copy of
+# the collection: one HNSW index in memory for all workers, one writer.
+CHROMA_SERVER_URL = os.environ.get("CHROMA_SERVER_URL", "")
+# langchain_chroma's default, so a server started on a copy of an embedded
+# directory serves the collection that is already there.
+COLLECTION_NAME = "langchain"
+# A pooled client is heartbeat-checked again when handed out this long after
+# its last successful check.
+HEALTH_CHECK_INTERVAL = float(os.environ.get("CHROMA_HEALTH_CHECK_SECONDS", "30"))
+RETRIES = 3
+RETRY_BACKOFF = 0.2
+# Connection failures (server restarting, socket reset): worth another try.
+# Anything else is an answer from the server and is raised as is.
+TRANSIENT_ERRORS = (httpx.TransportError,)
+
+
+def with_retry(call, what="request"):
+    """call(), retried with exponential backoff on transport errors."""
+    for attempt in range(RETRIES):
+        try:
+            return call()
+        except TRANSIENT_ERRORS as e:
+            if attempt == RETRIES - 1:
+                raise
+            logging.warning(f"Chroma {what} failed ({e}); retrying")
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+class ClientPool:
+    """One HTTP client per Chroma server, shared by every store in the process.
+
+    chromadb's HttpClient keeps a pool of keep-alive connections, so reusing
+    a single client avoids a TCP handshake per query and per store. Clients
+    are heartbeat-checked on connect and again after HEALTH_CHECK_INTERVAL;
+    a server that doesn't answer is retried before giving up.
+    """
+
+    def __init__(self, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.health_check_interval = health_check_interval
+        self._clients = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            client = self._clients.get(url)
+            if client is None or time.monotonic() - self._checked[url] > self.health_check_interval:
+                client = self._connect(url, client)
+            return client
+
+    def _connect(self, url, client):
+        last_error = None
+        for attempt in range(RETRIES):
+            try:
+                if client is None:
+                    import chromadb
+                    parsed = urlparse(url)
+                    client = chromadb.HttpClient(host=parsed.hostname, port=parsed.port or 8000,
+                                                 ssl=parsed.scheme == "https")
+                client.heartbeat()
+                self._clients[url] = client
+                self._checked[url] = time.monotonic()
+                return client
+            # HttpClient() itself heartbeats and raises ValueError when the server is down.
+            except (ValueError, *TRANSIENT_ERRORS) as e:
+                last_error = e
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+        self._clients.pop(url, None)
+        raise ConnectionError(f"Chroma server at {url} is not reachable: {last_error}")
+
+    def invalidate(self, url):
+        """Force a health check on the next get()."""
+        with self._lock:
+            self._checked[url] = float("-inf")
+
+
+client_pool = ClientPool()
+
+
+class PooledChroma(Chroma):
+    """Chroma over a pooled HTTP client; reads and idempotent writes retry on connection errors."""
+
+    def __init__(self, url, **kwargs):
+        self.server_url = url
+        super().__init__(client=client_pool.get(url), **kwargs)
+
+    def _retry(self, call, what):
+        try:
+            return with_retry(call, what)
+        except TRANSIENT_ERRORS:
+            client_pool.invalidate(self.server_url)
+            raise
+
+    def similarity_search_with_score(self, *args, **kwargs):
+        return self._retry(lambda: super(PooledChroma, self).similarity_search_with_score(*args, **kwargs), "search")
+
+    def similarity_search_by_vector_with_relevance_scores(self, *args, **kwargs):
+        return self._retry(
+            lambda: super(PooledChroma, self).similarity_search_by_vector_with_relevance_scores(*args, **kwargs),
+            "search",
+        )
+
+    def get(self, *args, **kwargs):
+        return self._retry(lambda: super(PooledChroma, self).get(*args, **kwargs), "get")
+
+    # langchain_chroma writes with upsert, so a retried batch can't duplicate chunks.
+    def add_documents(self, *args, **kwargs):
+        return self._retry(lambda: super(PooledChroma, self).add_documents(*args, **kwargs), "write")
+
+    def delete(self, *args, **kwargs):
+        return self._retry(lambda: super(PooledChroma, self).delete(*args, **kwargs), "delete")
+
+
+def open_chroma(embedding_function, persist_directory=CHROMA_PATH, collection_configuration=None,
+                server_url=None):
+    """The Chroma collection every entry point reads and writes.
+
+    Embedded (a PersistentClient on persist_directory) unless CHROMA_SERVER_URL
+    or server_url names a Chroma server, in which case the store goes through
+    the process-wide client pool.
+    """
+    server_url = CHROMA_SERVER_URL if server_url is None else server_url
+    if server_url:
+        return PooledChroma(server_url, collection_name=COLLECTION_NAME, embedding_function=embedding_function,
+                            collection_configuration=collection_configuration)
+    # Absolute, because chromadb caches clients by path string.
+    return Chroma(persist_directory=os.path.abspath(persist_directory), embedding_function=embedding_function,
+                  collection_configuration=collection_configuration)
+
+
+def collection(db):
+    """The chromadb Collection behind a vector store (or a ShardedVectorStore's routed stand-in).
+
+    langchain_chroma only writes texts it embeds itself and has no public
+    accessor for its collection. Ingestion needs one to upsert precomputed
+    embeddings, update metadata and count, so every such call goes through
+    here rather than reaching into the private attribute.
+    """
+    return db._collection
+
+
+def max_batch_size(db):
+    """Largest upsert the store's client accepts, or None when it has no single client (shards)."""
+    client = getattr(db, "_client", None)
+    return client.get_max_batch_size() if client is not None else None
+
+
+def reset_server_collection(server_url=None):
+    """Drop the collection on the Chroma server, if one is configured."""
+    server_url = CHROMA_SERVER_URL if server_url is None else server_url
+    if not server_url:
+        return False
+    client = client_pool.get(server_url)
+    if COLLECTION_NAME in [getattr(c, "name", c) for c in client.list_collections()]:
+        client.delete_collection(COLLECTION_NAME)
+    return True
+
+
+def start_server(path, port=None):
+    """`chroma run` on path in a child process; returns (process, url) once it answers."""
+    if port is None:
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            port = s.getsockname()[1]
+    process = subprocess.Popen(["chroma", "run", "--path", os.path.abspath(path), "--port", str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://localhost:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{url}/api/v2/heartbeat", timeout=1).raise_for_status()
+            return process, url
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f"Chroma server on port {port} did not start")
+            time.sleep(0.2)
+
+
+def _query_worker(persist_directory, server_url, vectors, k):
+    # Runs in a fresh (spawned) process, so its RSS is only what this mode costs.
+    start = time.perf_counter()
+    db = open_chroma(None, persist_directory, server_url=server_url)
+    collection(db).count()
+    open_seconds = time.perf_counter() - start
+    latencies = []
+    for vector in vectors:
+        start = time.perf_counter()
+        db.similarity_search_by_vector_with_relevance_scores(vector, k=k)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "open_ms": 1000 * open_seconds,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def compare_modes(persist_directory=CHROMA_PATH, workers=4, queries=100, k=5):
+    """Run the same queries from `workers` processes against the embedded
+    collection, then against a local Chroma server on the same directory."""
+    db = Chroma(persist_directory=os.path.abspath(persist_directory), embedding_function=None)
+    vectors = [list(map(float, v)) for v in db.get(limit=queries, include=["embeddings"])["embeddings"]]
+    if not vectors:
+        raise ValueError(f"No chunks in {persist_directory}; ingest something first.")
+    # Let the server be the only process with the database open.
+    db._client._system.stop()
+    db._client.clear_system_cache()
+
+    report = {}
+    process, url = None, None
+    try:
+        for mode in ["embedded", "server"]:
+            if mode == "server":
+                process, url = start_server(persist_directory)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+                results = list(pool.map(_query_worker, [persist_directory] * workers, [url or ""] * workers,
+                                        [vectors] * workers, [k] * workers))
+            report[mode] = {
+                "workers": results,
+                "rss_mb_per_worker": sum(r["peak_rss_mb"] for r in results) / workers,
+                "p50_ms": sorted(r["p50_ms"] for r in results)[workers // 2],
+                "p95_ms": max(r["p95_ms"] for r in results),
+            }
+        if process is not None:
+            report["server"]["server_rss_mb"] = _rss_mb(process.pid)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return report
+
+
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare per-worker memory and query latency: embedded Chroma vs one shared Chroma server.")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes querying at once.")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per worker (stored chunk vectors).")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    report = compare_modes(CHROMA_PATH, args.workers, args.queries, args.k)
+    for mode, stats in report.items():
+        print(f"{'🗄️ ' if mode == 'embedded' else '🌐'} {mode:8s} RSS/worker {stats['rss_mb_per_worker']:.0f} MB, "
+              f"query p50 {stats['p50_ms']:.2f}ms p95 {stats['p95_ms']:.2f}ms")
+    if report["server"].get("server_rss_mb") is not None:
+        print(f"   (+ one server process: {report['server']['server_rss_mb']:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
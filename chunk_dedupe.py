@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+CHROMA_PATH = "chroma"
+# Lives next to the vectors so clear_database() removes both together.
+CHUNK_REGISTRY_FILE = "chunk_registry.sqlite"
+# MinHash near-dedupe (off unless asked for): estimated Jaccard similarity of
+# 3-word shingles above which two chunks count as the same passage. One
+# misread word changes 3 shingles, so an OCR'd copy of a 350-character chunk
+# with a couple of errors still scores ~0.8.
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_WORDS = 3
+# 16 bands of 4 rows: pairs at the threshold collide in some band with
+# probability ~1, pairs at Jaccard 0.5 in about 64% of cases (then rejected
+# by the full signature check).
+NUM_BANDS = 16
+BAND_ROWS = 4
+_PRIME = 4294967311  # Smallest prime above 2**32.
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 1 << 31, NUM_BANDS * BAND_ROWS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_BANDS * BAND_ROWS, dtype=np.uint64)
+# SQLite caps the number of "?" placeholders per statement.
+_LOOKUP_BATCH = 500
+
+
+def normalize_text(text):
+    """Text as compared for dedupe: Unicode-normalized, whitespace collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def minhash(text):
+    words = normalize_text(text).lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def bands(signature):
+    return [f"{band}:{signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes().hex()}"
+            for band in range(NUM_BANDS)]
+
+
+def locations(metadata):
+    """The other chunk IDs whose text a stored chunk stands in for."""
+    return json.loads(metadata.get("also_in") or "[]")
+
+
+class ChunkRegistry:
+    """Which stored chunk holds each piece of text, and every location it came from.
+
+    Every ingested chunk is registered under the hash of its normalized text.
+    The first location seen for a text is stored in Chroma (the canonical
+    chunk); later copies, from reprints, other editions or OCR'd scans, become
+    aliases that are never embedded or stored. The canonical chunk's
+    "also_in" metadata lists its aliases, so citations still name every copy.
+    """
+
+    def __init__(self, path=os.path.join(CHROMA_PATH, CHUNK_REGISTRY_FILE), near_duplicates=False,
+                 threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.path = path
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY, source TEXT NOT NULL, content_hash TEXT NOT NULL,
+                canonical_id TEXT NOT NULL, metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_hash ON chunks (content_hash);
+            CREATE INDEX IF NOT EXISTS chunks_by_canonical ON chunks (canonical_id);
+            CREATE INDEX IF NOT EXISTS chunks_by_source ON chunks (source);
+            CREATE TABLE IF NOT EXISTS signatures (canonical_id TEXT PRIMARY KEY, signature BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS buckets (bucket TEXT NOT NULL, canonical_id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS buckets_by_bucket ON buckets (bucket);
+            CREATE INDEX IF NOT EXISTS buckets_by_canonical ON buckets (canonical_id);
+        """)
+        self._conn.commit()
+        # Canonical chunks assigned but not yet written: later batches (and
+        # later chunks of the same batch) must still find them.
+        self._pending_hashes = {}
+        self._pending_signatures = {}
+
+    def _canonical_for_hash(self, content_hash):
+        if content_hash in self._pending_hashes:
+            return self._pending_hashes[content_hash]
+        row = self._conn.execute("SELECT canonical_id FROM chunks WHERE content_hash = ? LIMIT 1",
+                                 (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def _canonical_for_signature(self, signature):
+        candidates = set()
+        for bucket in bands(signature):
+            candidates.update(chunk_id for chunk_id, pending in self._pending_signatures.items()
+                              if bucket in pending[1])
+            candidates.update(chunk_id for (chunk_id,) in self._conn.execute(
+                "SELECT canonical_id FROM buckets WHERE bucket = ?", (bucket,)))
+        best, best_similarity = None, self.threshold
+        for chunk_id in sorted(candidates):
+            if chunk_id in self._pending_signatures:
+                other = self._pending_signatures[chunk_id][0]
+            else:
+                row = self._conn.execute("SELECT signature FROM signatures WHERE canonical_id = ?",
+                                         (chunk_id,)).fetchone()
+                other = np.frombuffer(row[0], dtype=np.uint64)
+            similarity = float(np.mean(signature == other))
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        return best
+
+    def aliases_among(self, chunk_ids):
+        """The chunk_ids already registered as copies of another chunk."""
+        found = set()
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            for i in range(0, len(chunk_ids), _LOOKUP_BATCH):
+                batch = chunk_ids[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(chunk_id for (chunk_id,) in self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders}) AND chunk_id != canonical_id",
+                    batch))
+        return found
+
+    def assign(self, chunks):
+        """Split new chunks into (unique chunks to embed and store, registry rows).
+
+        Pass the rows to commit() once the unique chunks are written.
+        """
+        unique, rows = [], []
+        with self._lock:
+            for chunk in chunks:
+                chunk_id = chunk.metadata["id"]
+                content_hash = text_hash(chunk.page_content)
+                chunk.metadata["content_hash"] = content_hash
+                canonical_id = self._canonical_for_hash(content_hash)
+                signature = None
+                if canonical_id is None and self.near_duplicates:
+                    signature = minhash(chunk.page_content)
+                    canonical_id = self._canonical_for_signature(signature)
+                if canonical_id is None:
+                    canonical_id = chunk_id
+                    self._pending_hashes[content_hash] = chunk_id
+                    if signature is not None:
+                        self._pending_signatures[chunk_id] = (signature, set(bands(signature)))
+                    unique.append(chunk)
+                rows.append((chunk_id, chunk.metadata.get("source", ""), content_hash, canonical_id,
+                             json.dumps(chunk.metadata, default=str)))
+        return unique, rows
+
+    def commit(self, rows):
+        """Record assigned rows; returns the canonical IDs that gained aliases."""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+            for chunk_id, _source, content_hash, canonical_id, _metadata in rows:
+                if chunk_id != canonical_id:
+                    continue
+                self._pending_hashes.pop(content_hash, None)
+                pending = self._pending_signatures.pop(chunk_id, None)
+                if pending is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?)",
+                                       (chunk_id, pending[0].tobytes()))
+                    self._conn.executemany("INSERT INTO buckets VALUES (?, ?)",
+                                           [(bucket, chunk_id) for bucket in pending[1]])
+            self._conn.commit()
+        return {canonical_id for chunk_id, _s, _h, canonical_id, _m in rows if chunk_id != canonical_id}
+
+    def aliases(self, canonical_ids):
+        """canonical ID -> IDs of its copies, in the order they were ingested."""
+        with self._lock:
+            return {canonical_id: [chunk_id for (chunk_id,) in self._conn.execute(
+                        "SELECT chunk_id FROM chunks WHERE canonical_id = ? AND chunk_id != canonical_id "
+                        "ORDER BY rowid", (canonical_id,))]
+                    for canonical_id in canonical_ids}
+
+    def remove_source(self, source):
+        """Forget every location in source.
+
+        Returns (promotions, touched). promotions maps each canonical chunk of
+        source that still has copies elsewhere to (new canonical ID, its
+        metadata): the caller re-stores the vector under that ID. touched are
+        the canonical IDs whose alias lists changed.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id, canonical_id FROM chunks WHERE source = ?",
+                                      (source,)).fetchall()
+            own = {chunk_id for chunk_id, _canonical_id in rows}
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            touched = {canonical_id for chunk_id, canonical_id in rows if canonical_id not in own}
+            promotions = {}
+            for old_id in sorted(chunk_id for chunk_id, canonical_id in rows if chunk_id == canonical_id):
+                survivor = self._conn.execute(
+                    "SELECT chunk_id, metadata FROM chunks WHERE canonical_id = ? ORDER BY rowid LIMIT 1",
+                    (old_id,)).fetchone()
+                if survivor is None:
+                    self._conn.execute("DELETE FROM signatures WHERE canonical_id = ?", (old_id,))
+                    self._conn.execute("DELETE FROM buckets WHERE canonical_id = ?", (old_id,))
+                    continue
+                new_id = survivor[0]
+                self._conn.execute("UPDATE chunks SET canonical_id = ? WHERE canonical_id = ?", (new_id, old_id))
+                self._conn.execute("UPDATE signatures SET canonical_id = ? WHERE canonical_id = ?", (new_id, old_id))
+                self._conn.execute("UPDATE buckets SET canonical_id = ? WHERE canonical_id = ?", (new_id, old_id))
+                promotions[old_id] = (new_id, json.loads(survivor[1]))
+                touched.add(new_id)
+            self._conn.commit()
+        return promotions, touched
+
+    def stats(self):
+        with self._lock:
+            total, unique = self._conn.execute(
+                "SELECT COUNT(*), SUM(chunk_id = canonical_id) FROM chunks").fetchone()
+        return {"chunks": total, "unique": unique or 0, "duplicates": total - (unique or 0)}
+
+
+def sync_locations(collection, registry, canonical_ids):
+    """Write each canonical chunk's current alias list to its "also_in" metadata."""
+    canonical_ids = sorted(canonical_ids)
+    if not canonical_ids:
+        return
+    aliases = registry.aliases(canonical_ids)
+    collection.update(ids=canonical_ids,
+                      metadatas=[{"also_in": json.dumps(aliases[chunk_id])} for chunk_id in canonical_ids])
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+from langchain_core.documents import Document
+
+from chunk_dedupe import locations
+
+# --- CONTEXT COMPRESSION ---
+# Retrieval fetches this many times k candidates, so the slots freed by
+# merging and dedupe are filled with other evidence instead of left empty.
+CANDIDATE_MULTIPLIER = 2
+# Cosine similarity above which a lower-ranked chunk is treated as a repeat of
+# one already in the context (same passage in another edition or file).
+DUPLICATE_SIMILARITY = 0.95
+# The splitter overlaps neighbours by up to 80 characters; shorter common
+# runs are coincidence, not overlap.
+MIN_OVERLAP = 10
+MAX_OVERLAP = 200
+
+
+def split_chunk_id(chunk_id):
+    """"data/book.pdf:6:2" -> ("data/book.pdf:6", 2), or None if it isn't a chunk ID."""
+    page_id, _, index = (chunk_id or "").rpartition(":")
+    if not page_id or not index.isdigit():
+        return None
+    return page_id, int(index)
+
+
+def source_ids(doc):
+    """Every chunk ID behind a (possibly merged) context document, then the
+    other files and pages the same text was deduplicated from."""
+    if doc.metadata.get("span_ids"):
+        ids = list(doc.metadata["span_ids"])
+    else:
+        ids = [doc.metadata["id"]] if doc.metadata.get("id") else []
+    return ids + [chunk_id for chunk_id in locations(doc.metadata) if chunk_id not in ids]
+
+
+def strip_overlap(previous, following):
+    """`following` without the prefix it shares with the end of `previous`."""
+    for size in range(min(MAX_OVERLAP, len(previous), len(following)), MIN_OVERLAP - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def drop_near_duplicates(results, embeddings, threshold=DUPLICATE_SIMILARITY):
+    """Keep results in rank order, skipping any too similar to one already kept.
+
+    `embeddings` maps chunk ID -> vector; results without one are always kept.
+    """
+    kept, kept_vectors = [], []
+    for result in results:
+        vector = embeddings.get(result[0].metadata.get("id"))
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+            if kept_vectors and max(float(vector @ other) for other in kept_vectors) >= threshold:
+                continue
+            kept_vectors.append(vector)
+        kept.append(result)
+    return kept
+
+
+def merge_adjacent(results):
+    """Stitch consecutive chunks of the same page into one span, removing the overlap.
+
+    A span takes the rank and score of its best chunk. Its metadata is the
+    first chunk's, plus "span_ids" listing every chunk it covers.
+    """
+    runs = {}
+    for rank, (doc, score) in enumerate(results):
+        parsed = split_chunk_id(doc.metadata.get("id"))
+        key = parsed[0] if parsed else ("", rank)
+        runs.setdefault(key, []).append((parsed[1] if parsed else 0, rank, doc, score))
+
+    spans = []
+    for members in runs.values():
+        members.sort()
+        run = [members[0]]
+        for member in members[1:]:
+            if member[0] == run[-1][0] + 1:
+                run.append(member)
+            else:
+                spans.append(_span(run))
+                run = [member]
+        spans.append(_span(run))
+    spans.sort()
+    return [(doc, score) for _rank, doc, score in spans]
+
+
+def _span(run):
+    best_rank = min(rank for _index, rank, _doc, _score in run)
+    best_score = next(score for _index, rank, _doc, score in run if rank == best_rank)
+    if len(run) == 1:
+        return best_rank, run[0][2], best_score
+    text = run[0][2].page_content
+    for _index, _rank, doc, _score in run[1:]:
+        rest = strip_overlap(text, doc.page_content)
+        # No shared text (the splitter cut at a separator): keep the words apart.
+        text += rest if len(rest) < len(doc.page_content) else " " + rest
+    metadata = dict(run[0][2].metadata, span_ids=[doc.metadata["id"] for _index, _rank, doc, _score in run],
+                    also_in=json.dumps([chunk_id for _index, _rank, doc, _score in run
+                                        for chunk_id in locations(doc.metadata)]))
+    return best_rank, Document(page_content=text, metadata=metadata), best_score
+
+
+def compress_results(db, results, k):
+    """Distinct evidence for the prompt: near-duplicates dropped, neighbours merged, at most k spans.
+
+    Dedupe reuses the embeddings already stored with the chunks, so nothing
+    is embedded again.
+    """
+    ids = [doc.metadata["id"] for doc, _score in results if doc.metadata.get("id")]
+    embeddings = {}
+    if ids:
+        stored = db.get(ids=ids, include=["embeddings"])
+        if stored.get("embeddings") is not None:
+            embeddings = dict(zip(stored["ids"], stored["embeddings"]))
+    return merge_adjacent(drop_near_duplicates(results, embeddings))[:k]
@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- TOKEN BUDGET ---
+# Mistral's tokenizer isn't available offline, so token counts are estimated
+# from characters (~4 per token for English prose). Good enough for a budget.
+CHARS_PER_TOKEN = 4
+# Whole prompt: instructions + context + history + question. Leaves room for
+# the answer inside Ollama's default 2048-token context window.
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 1400))
+# The history section's share of it (running summary + recent turns).
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 400))
+# Turns kept verbatim; older ones are folded into the running summary.
+RECENT_TURNS = 2
+SUMMARY_TOKEN_LIMIT = 150
+
+# Sent after the chat prompt's static guidelines (see llm_summarizer), so a
+# summary doesn't evict them from the model's prompt cache between turns.
+SUMMARY_PROMPT = """
+TASK: Do not answer the student. Keep short notes on this conversation between a student and you, their mentor.
+
+CURRENT NOTES:
+{summary}
+
+NEW EXCHANGES:
+{turns}
+
+---
+
+Rewrite the notes to include the new exchanges in at most {words} words. Keep what the student
+is going through, how they feel and what has already been suggested. Reply with the notes only.
+"""
+
+# One background worker for every session: summaries are cheap to delay and
+# should never compete with each other for the LLM.
+SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+
+
+def count_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, budget):
+    """Cut text to roughly `budget` tokens, at a word boundary."""
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+def format_turn(question, answer):
+    return f"Student: {question}\nMentor: {answer}"
+
+
+def llm_summarizer(get_model, prefix="", tracker=None, session=None):
+    """Summarizer that asks the LLM returned by `get_model()` to update the notes.
+
+    Pass the chat prompt's static prefix when the summaries go to the same
+    model as the turns: Ollama only caches the last prompt, so a summary that
+    started differently would make the next turn re-read the guidelines.
+    `tracker` (a PrefillTracker) sees the summary prompts too, as part of `session`.
+    """
+    def summarize(summary, turns):
+        prompt = prefix + SUMMARY_PROMPT.lstrip("\n").format(
+            summary=summary or "(none yet)",
+            turns="\n\n".join(format_turn(q, a) for q, a in turns),
+            words=SUMMARY_TOKEN_LIMIT * 3 // 4,
+        )
+        if tracker is not None:
+            tracker.record(prompt, summary=True, session=session)
+        return str(get_model().invoke(prompt)).strip()
+    return summarize
+
+
+def is_summary_prompt(prompt):
+    """True for prompts built by llm_summarizer, whatever prefix they carry."""
+    return SUMMARY_PROMPT.lstrip("\n").split("\n", 1)[0] in prompt
+
+
+def extractive_summary(summary, turns):
+    """LLM-free fallback: remember the first sentence of each student message."""
+    lines = summary.splitlines() if summary else []
+    for question, _answer in turns:
+        first = question.strip().split(". ")[0].rstrip(".")
+        lines.append(f"- The student said: {first}.")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > SUMMARY_TOKEN_LIMIT:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """Recent turns verbatim plus a running summary of everything older.
+
+    Turns that scroll out of the verbatim window are summarized on a
+    background thread, so the next prompt never waits for the LLM to
+    summarize. Until the summary catches up, they are shown verbatim if the
+    history budget allows.
+    """
+
+    def __init__(self, summarize=extractive_summary, recent_turns=RECENT_TURNS, executor=SUMMARY_EXECUTOR):
+        self.summary = ""
+        self._summarize = summarize
+        self._recent_turns = recent_turns
+        self._executor = executor
+        self._turns = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._turns) + len(self._pending)
+
+    def append(self, question, answer):
+        with self._lock:
+            self._turns.append((question, answer))
+            if len(self._turns) <= self._recent_turns:
+                return
+            self._pending.append(self._turns.pop(0))
+            if not self._idle.is_set():
+                return  # the running job picks the new turn up
+            self._idle.clear()
+        self._executor.submit(self._summarize_pending)
+
+    def _summarize_pending(self):
+        while True:
+            with self._lock:
+                turns = list(self._pending)
+                summary = self.summary
+                if not turns:
+                    self._idle.set()
+                    return
+            try:
+                summary = self._summarize(summary, turns)
+            except Exception:
+                # Keep the old summary; the turns are retried with the next batch.
+                logging.exception("Conversation summary failed")
+                with self._lock:
+                    self._idle.set()
+                return
+            with self._lock:
+                self.summary = truncate_to_tokens(summary, SUMMARY_TOKEN_LIMIT)
+                del self._pending[:len(turns)]
+
+    def wait(self, timeout=None):
+        """Block until the summary includes every scrolled-out turn (tests and shutdown)."""
+        return self._idle.wait(timeout)
+
+    def render(self, budget=HISTORY_TOKEN_BUDGET):
+        """History text within `budget` tokens: summary, then the newest turns that fit."""
+        with self._lock:
+            summary = self.summary
+            turns = self._pending + self._turns
+        parts = []
+        if summary:
+            summary = truncate_to_tokens(f"Earlier in this conversation:\n{summary}", budget)
+            parts.append(summary)
+            budget -= count_tokens(summary)
+        return "\n".join(parts + take_newest([format_turn(q, a) for q, a in turns], budget))
+
+
+def take_newest(items, budget):
+    """The newest items (in original order) whose total stays within `budget` tokens."""
+    kept = []
+    for item in reversed(items):
+        cost = count_tokens(item) + 1
+        if cost > budget:
+            break
+        kept.append(item)
+        budget -= cost
+    return kept[::-1]
+
+
+def render_history(history, budget=HISTORY_TOKEN_BUDGET):
+    """History section for any caller: a ConversationMemory, strings, or (question, answer) pairs."""
+    if hasattr(history, "render"):
+        return history.render(budget)
+    items = [item if isinstance(item, str) else format_turn(*item) for item in history]
+    return "\n".join(take_newest(items, budget))
+
+
+def fit_sections(template, results, history, question, budget=PROMPT_TOKEN_BUDGET,
+                 history_budget=HISTORY_TOKEN_BUDGET, separator="\n\n---\n\n"):
+    """Context and history texts that keep `template` within `budget` tokens.
+
+    The instructions and the question are always kept. History gets up to
+    `history_budget`; the remaining tokens go to retrieved chunks in rank
+    order (the best chunk is truncated rather than dropped). Returns
+    (context_text, history_text, used_results).
+    """
+    fixed = count_tokens(template.format(context="", history="", question=question))
+    history_text = render_history(history, max(0, min(history_budget, budget - fixed)))
+    remaining = budget - fixed - count_tokens(history_text)
+
+    chunks, used = [], []
+    for result in results:
+        text = result[0].page_content
+        cost = count_tokens(text) + count_tokens(separator)
+        if cost > remaining:
+            if not chunks and remaining > 0:
+                chunks.append(truncate_to_tokens(text, remaining))
+                used.append(result)
+            break
+        chunks.append(text)
+        used.append(result)
+        remaining -= cost
+    return separator.join(chunks), history_text, used
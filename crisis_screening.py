@@ -0,0 +1,208 @@
+import argparse
+import os
+import re
+
+import numpy as np
+
+from index_config import INDEX_CONFIG_PATH, load_index_config, save_index_config
+from metrics import metrics
+
+# --- SEMANTIC CRISIS SCREENING ---
+# Paraphrases the keyword list misses. Each group is averaged into one
+# centroid, so screening a turn is a handful of dot products against the
+# query embedding that retrieval computes anyway.
+CRISIS_EXEMPLARS = {
+    "suicidal_ideation": [
+        "I don't want to be alive anymore",
+        "I've been thinking about ending my life",
+        "There is no reason for me to keep living",
+        "Everyone would be better off without me",
+        "I wish I could go to sleep and never wake up",
+        "I have a plan to take my own life",
+    ],
+    "self_harm": [
+        "I keep hurting myself on purpose",
+        "I cut my arms when I feel overwhelmed",
+        "I burn myself to feel something",
+        "I hit myself until it bruises",
+    ],
+    "overdose": [
+        "I took a whole bottle of pills",
+        "I swallowed all of my medication at once",
+        "I'm going to take all my pills tonight",
+    ],
+}
+# Labelled messages kept apart from the exemplars, for calibrate_threshold:
+# crisis paraphrases (many without any crisis keyword) and ordinary student
+# messages, including the venting that shares words with a crisis.
+HELD_OUT_CRISIS = [
+    "I can't see the point of being here anymore",
+    "I've started writing goodbye letters to my friends",
+    "Nobody would even notice if I disappeared for good",
+    "I just want everything to stop, permanently",
+    "I keep imagining jumping off the parking garage",
+    "I looked up how many pills it would take",
+    "I don't think I'll be around by the end of the semester",
+    "My family would be happier if I was gone",
+    "I've been scratching my wrists with a razor again",
+    "Hurting myself is the only thing that helps lately",
+    "I punched the wall until my knuckles bled, on purpose",
+    "I've been burning my skin with a lighter",
+    "I took way more of my prescription than I should have tonight",
+    "I mixed my sleeping pills with vodka",
+    "I'm saving up my meds so I can take them all at once",
+    "Living feels like too much and I want out",
+]
+HELD_OUT_BENIGN = [
+    "This exam is going to be the death of me",
+    "I'm dead tired after pulling an all-nighter",
+    "Organic chemistry is killing me",
+    "I want to quit my part-time job",
+    "I keep cutting class to catch up on sleep",
+    "I'm so stressed about finals I can't think",
+    "I feel lonely since my friends transferred",
+    "I failed my midterm and I feel like a failure",
+    "How do I stop overthinking everything?",
+    "I can't sleep before big presentations",
+    "My parents are disappointed in my grades",
+    "What is learned helplessness?",
+    "I forgot to take my allergy pills this morning",
+    "I'm burned out from working and studying",
+    "I hurt my ankle at practice and I'm behind on everything",
+    "Sometimes I wish I could disappear from group chats",
+    "I feel like giving up on this essay",
+    "How can I be less anxious when I talk to professors?",
+    "I don't want to go back home for the holidays",
+    "Everyone in my program seems smarter than me",
+]
+# A missed crisis costs far more than a false alarm (which still gets a
+# caring reply with helpline numbers), so calibration keeps recall first.
+TARGET_RECALL = 0.95
+# Used until `python crisis_screening.py --apply` has recorded a
+# threshold for the embedding model; CRISIS_SEMANTIC_THRESHOLD overrides both.
+DEFAULT_SEMANTIC_THRESHOLD = 0.6
+
+
+def semantic_threshold(path=INDEX_CONFIG_PATH):
+    """Cosine similarity to a centroid above which a turn is treated as a crisis."""
+    if "CRISIS_SEMANTIC_THRESHOLD" in os.environ:
+        return float(os.environ["CRISIS_SEMANTIC_THRESHOLD"])
+    calibration = load_index_config(path).get("crisis_screening", {})
+    return calibration.get("threshold", DEFAULT_SEMANTIC_THRESHOLD)
+
+def _phrase(text):
+    # Spaces and hyphens match any run of whitespace or hyphens.
+    return r"[\s-]+".join(re.escape(word) for word in re.split(r"[\s-]+", text.strip()))
+
+
+def build_crisis_pattern(keywords, exceptions=None):
+    """One precompiled regex for all keywords, anchored on word boundaries.
+
+    Spaces and hyphens inside a keyword match any run of whitespace or
+    hyphens, so "self-harm", "self harm" and "self  harm" all match.
+    exceptions maps a keyword to the words that make it benign when they
+    follow it ("cutting" + "class"); every other use still matches.
+    """
+    exceptions = exceptions or {}
+    alternatives = []
+    for keyword in sorted(keywords, key=len, reverse=True):
+        alternative = _phrase(keyword)
+        if exceptions.get(keyword):
+            benign = "|".join(_phrase(phrase) for phrase in sorted(exceptions[keyword], key=len, reverse=True))
+            alternative += r"(?![\s-]+(?:" + benign + r")\b)"
+        alternatives.append(alternative)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+class CrisisScreener:
+    """Semantic crisis check against precomputed exemplar centroids."""
+
+    def __init__(self, embedding_function, exemplars=CRISIS_EXEMPLARS, threshold=None):
+        self.threshold = semantic_threshold() if threshold is None else threshold
+        self.labels = list(exemplars)
+        # One batched forward pass at startup; never on the per-turn path.
+        texts = [text for label in self.labels for text in exemplars[label]]
+        vectors = _unit(embedding_function.embed_documents(texts))
+        centroids = []
+        start = 0
+        for label in self.labels:
+            end = start + len(exemplars[label])
+            centroids.append(vectors[start:end].mean(axis=0))
+            start = end
+        self.centroids = _unit(centroids)
+
+    def similarities(self, embeddings):
+        """Best centroid similarity of each embedding."""
+        return (_unit(embeddings) @ self.centroids.T).max(axis=1)
+
+    def screen(self, query_embedding):
+        """Return the matching crisis label, or None."""
+        with metrics.timer("crisis_screen"):
+            similarities = self.centroids @ _unit(query_embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self.labels[best]
+            return None
+
+
+def calibrate_threshold(screener, embedding_function, crisis=HELD_OUT_CRISIS, benign=HELD_OUT_BENIGN,
+                        target_recall=TARGET_RECALL):
+    """Highest threshold that still flags `target_recall` of the held-out crisis messages.
+
+    Like ann_tuning.calibrate_threshold, the cut is placed halfway to the
+    next observed similarity below it, so messages slightly further from the
+    exemplars than the held-out ones are still flagged. Returns the threshold
+    with the precision and recall it reaches on the held-out set.
+    """
+    flagged = screener.similarities(embedding_function.embed_documents(crisis))
+    ordinary = screener.similarities(embedding_function.embed_documents(benign))
+    candidates = np.unique(np.concatenate([flagged, ordinary]))[::-1]
+    for i, candidate in enumerate(candidates):
+        if (flagged >= candidate).mean() >= target_recall:
+            break
+    threshold = float(candidate)
+    if i + 1 < len(candidates):
+        threshold = (threshold + float(candidates[i + 1])) / 2
+    true_positives = int((flagged >= threshold).sum())
+    false_positives = int((ordinary >= threshold).sum())
+    return {
+        "threshold": threshold,
+        "precision": true_positives / (true_positives + false_positives) if true_positives + false_positives else 1.0,
+        "recall": true_positives / len(flagged),
+        "crisis_p50": float(np.median(flagged)),
+        "benign_p50": float(np.median(ordinary)),
+        "benign_max": float(ordinary.max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the semantic crisis threshold on the held-out messages.")
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    parser.add_argument("--apply", action="store_true",
+                        help=f"Save the threshold (with its precision and recall) to {INDEX_CONFIG_PATH}.")
+    args = parser.parse_args()
+
+    from get_embedding_function import EMBEDDING_MODEL, get_embedding_function
+
+    embedding_function = get_embedding_function()
+    calibration = calibrate_threshold(CrisisScreener(embedding_function, threshold=0.0), embedding_function,
+                                      target_recall=args.target_recall)
+    print(f"🎯 Threshold {calibration['threshold']:.3f}: precision {calibration['precision']:.2f}, "
+          f"recall {calibration['recall']:.2f} on {len(HELD_OUT_CRISIS)} crisis / "
+          f"{len(HELD_OUT_BENIGN)} ordinary messages")
+    print(f"   Median similarity: crisis {calibration['crisis_p50']:.3f}, ordinary {calibration['benign_p50']:.3f} "
+          f"(highest ordinary {calibration['benign_max']:.3f})")
+    if args.apply:
+        config = load_index_config()
+        config["crisis_screening"] = dict(calibration, model=EMBEDDING_MODEL)
+        save_index_config(config)
+        print(f"✅ Saved to {INDEX_CONFIG_PATH}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,27 @@
 import argparse
 import os
-import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFDirectoryLoader, CSVLoader, JSONLoader
+from langchain_community.document_loaders import PyPDFDirectoryLoader, PyPDFLoader
 from langchain_core.documents import Document
 
 from get_embedding_function import get_embedding_function
-from langchain_chroma import Chroma
-import json
-
-def load_ndjson(file_path):
-    docs = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data = json.loads(line)
-                docs.append(Document(page_content=str(data), metadata={"source": file_path}))
-    return docs
-# ...existing c
-
+from index_config import collection_configuration
+from chroma_client import collection, open_chroma
+from chunk_dedupe import CHUNK_REGISTRY_FILE, ChunkRegistry, sync_locations
+from tabular_loaders import is_tabular, iter_rows
 from populate_dataset import clear_database
+from ingest_manifest import MANIFEST_PATH, IngestManifest
+from ingest_pipeline import DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_SIZE, run_pipeline
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex, rebuild as rebuild_lexical_index
+from metrics import format_snapshot, metrics, start_from_env
+from mmap_store import refresh_export
+from retrieval_cache import bump_collection_version
+from sharded_store import (SHARD_BY, ShardedLexicalIndex, ShardedVectorStore, open_shard, shard_of, shard_path,
+                           write_layout)
 
 CHROMA_PATH = "chroma"
 DATA_PATH="data"
@@ -34,78 +35,457 @@ def main():
         default=["data"],
         help="List of folders or PDF files to load.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse and split files (1 = serial).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Chunks per embed/upsert batch.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Batches buffered between pipeline stages. Memory use is bounded by batch size x queue size.",
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Always run the embedding model instead of reusing vectors from the on-disk cache.",
+    )
+    parser.add_argument(
+        "--ocr-paths",
+        nargs="*",
+        default=[],
+        help="Folders or files of scanned PDFs to OCR straight into the index (e.g. image_pdf).",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Split the collection into this many shards (searched in parallel at query time).",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=SHARD_BY,
+        default="source",
+        help="Route chunks to shards by source file or by a hash of the chunk ID.",
+    )
+    parser.add_argument(
+        "--only-shard",
+        type=int,
+        help="Build just this shard (with --shard-by source), so shards can be built by separate workers.",
+    )
+    parser.add_argument(
+        "--no-dedupe",
+        action="store_true",
+        help="Store every chunk, even if the same text is already stored from another file.",
+    )
+    parser.add_argument(
+        "--near-dedupe",
+        action="store_true",
+        help="Also treat near-identical chunks (MinHash, e.g. OCR'd copies) as duplicates.",
+    )
     args = parser.parse_args()
+    start_from_env()
     if args.reset:
         print("✨ Clearing Database")
         clear_database()
 
     # Create (or update) the data store.
-    documents = load_documents(args.data_paths)
-    chunks = split_documents(documents)
-    add_to_chroma(chunks)
-    
+    ingest(
+        args.data_paths,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        embedding_cache=not args.no_embedding_cache,
+        ocr_paths=args.ocr_paths,
+        shards=args.shards,
+        shard_by=args.shard_by,
+        only_shard=args.only_shard,
+        dedupe=not args.no_dedupe,
+        near_dedupe=args.near_dedupe,
+    )
+
+
 def load_documents(data_paths):
     all_docs = []
     for path in data_paths:
         # Load all PDFs in the directory
         loader = PyPDFDirectoryLoader(path)
         all_docs.extend(loader.load())
-        # Load all CSV files in the directory
-        for filename in os.listdir(path):
+        # Load all CSV, NDJSON and Parquet files in the directory
+        for filename in sorted(os.listdir(path)):
             file_path = os.path.join(path, filename)
-            if filename.endswith(".csv"):
-                csv_loader = CSVLoader(file_path)
-                all_docs.extend(csv_loader.load())
+            if is_tabular(filename):
+                all_docs.extend(iter_rows(file_path))
     return all_docs
 
 
-def split_documents(documents: list[Document]):
-    text_splitter = RecursiveCharacterTextSplitter(
+def list_source_files(data_paths):
+    """Expand data paths into the same PDF and tabular files that load_documents reads."""
+    files = []
+    for path in data_paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        # Mirror PyPDFDirectoryLoader's defaults: "**/[!.]*.pdf", skipping hidden folders.
+        root = Path(path)
+        for pdf_path in sorted(root.glob("**/[!.]*.pdf")):
+            relative_parts = pdf_path.relative_to(root).parts
+            if pdf_path.is_file() and not any(part.startswith(".") for part in relative_parts):
+                files.append(str(pdf_path))
+        for filename in sorted(os.listdir(path)):
+            if is_tabular(filename):
+                files.append(os.path.join(path, filename))
+    return files
+
+
+def lazy_load_file(file_path, scanned=False, ocr_workers=None):
+    """Yield a single PDF or tabular file's Documents one page (or row) at a time.
+
+    Scanned PDFs are OCR'd page range by page range (see pdf_2_text.py)
+    instead of being read for their (missing) text layer.
+    """
+    if scanned:
+        from pdf_2_text import ocr_documents
+        yield from ocr_documents(file_path, workers=ocr_workers)
+        return
+    if is_tabular(file_path):
+        yield from iter_rows(file_path)
+        return
+    for doc in PyPDFLoader(file_path).lazy_load():
+        doc.metadata["source"] = file_path
+        yield doc
+
+
+def load_file(file_path, scanned=False, ocr_workers=None):
+    """Load a single PDF or tabular file into Documents."""
+    return list(lazy_load_file(file_path, scanned, ocr_workers))
+
+
+def load_ndjson(file_path):
+    """Stream an NDJSON/JSONL file as one Document per line (see tabular_loaders.py for choosing fields)."""
+    return iter_rows(file_path)
+
+
+def iter_file_chunks(file_path, scanned=False):
+    """Stream load -> split -> ID over one file without holding all of it in memory."""
+    text_splitter = make_text_splitter()
+    docs = lazy_load_file(file_path, scanned)
+    chunks = (chunk for doc in docs for chunk in text_splitter.split_documents([doc]))
+    return assign_chunk_ids(chunks)
+
+
+def process_file(file_path, scanned=False):
+    """Parse, split and ID one file. Runs inside a worker process."""
+    start = time.perf_counter()
+    # The outer pool already keeps every core busy, so OCR runs in-process here.
+    chunks = calculate_chunk_ids(split_documents(load_file(file_path, scanned, ocr_workers=1)))
+    return file_path, chunks, time.perf_counter() - start
+
+
+def iter_processed_files(file_paths, workers, scanned_files=frozenset()):
+    """Yield (file_path, chunks, seconds) for each file as soon as a worker finishes it."""
+    if workers <= 1:
+        for file_path in file_paths:
+            yield process_file(file_path, file_path in scanned_files)
+        return
+
+    file_iter = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep only a couple of files per worker in flight so finished chunks
+        # are written out instead of piling up in the parent process.
+        pending = {
+            executor.submit(process_file, f, f in scanned_files) for f in islice(file_iter, workers * 2)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                next_file = next(file_iter, None)
+                if next_file is not None:
+                    pending.add(executor.submit(process_file, next_file, next_file in scanned_files))
+
+
+def delete_source(db, file_path, lexical_index=None, registry=None):
+    """Remove every chunk that came from file_path.
+
+    With a dedupe registry, a stored chunk whose text also appears in other
+    files is re-stored under the next of those locations instead of lost.
+    """
+    with metrics.timer("ingest_purge"):
+        ids = db.get(where={"source": file_path}, include=[])["ids"]
+        touched = set()
+        if registry is not None:
+            promotions, touched = registry.remove_source(file_path)
+            promoted = [old_id for old_id in ids if old_id in promotions]
+            if promoted:
+                stored = db.get(ids=promoted, include=["embeddings", "documents"])
+                new_ids = [promotions[old_id][0] for old_id in stored["ids"]]
+                collection(db).upsert(
+                    ids=new_ids,
+                    embeddings=list(stored["embeddings"]),
+                    metadatas=[promotions[old_id][1] for old_id in stored["ids"]],
+                    documents=list(stored["documents"]),
+                )
+                if lexical_index is not None:
+                    lexical_index.add(new_ids, list(stored["documents"]))
+        if ids:
+            db.delete(ids=ids)
+            if lexical_index is not None:
+                lexical_index.remove(ids)
+        sync_locations(collection(db), registry, touched)
+    return ids
+
+
+def stored_sources(db, page_size=5000):
+    """Every source file with chunks in the collection."""
+    sources = set()
+    offset = 0
+    while True:
+        page = db.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return sorted(sources)
+        sources.update(metadata["source"] for metadata in page["metadatas"] if metadata.get("source"))
+        offset += len(page["ids"])
+
+
+def iter_chunk_batches(file_paths, batch_size, workers=1, scanned_files=frozenset()):
+    """Yield (chunks, finished_files) batches of at most batch_size chunks.
+
+    With one worker, files are streamed page by page. With more, whole PDFs
+    are parsed on a process pool and only a couple per worker are in flight;
+    tabular files (which can hold millions of rows) are still streamed row
+    by row, after the PDFs.
+    finished_files lists the (file_path, num_chunks) completed in each batch.
+    """
+    if workers > 1:
+        def per_file():
+            pooled = [f for f in file_paths if not is_tabular(f)]
+            yield from iter_processed_files(pooled, workers, scanned_files)
+            for file_path in file_paths:
+                if is_tabular(file_path):
+                    yield file_path, iter_file_chunks(file_path), 0.0
+    else:
+        def per_file():
+            for file_path in file_paths:
+                yield file_path, iter_file_chunks(file_path, file_path in scanned_files), 0.0
+
+    batch, finished_files = [], []
+    # Each file's parse time is whatever a worker already spent on it plus
+    # the time spent pulling its chunks here.
+    for file_path, chunks, seconds in per_file():
+        num_chunks = 0
+        start = time.perf_counter()
+        waited = 0.0
+        for chunk in chunks:
+            batch.append(chunk)
+            num_chunks += 1
+            if len(batch) >= batch_size:
+                paused = time.perf_counter()
+                yield batch, finished_files
+                # Don't count time blocked on a full queue as parse time.
+                waited += time.perf_counter() - paused
+                batch, finished_files = [], []
+        finished_files.append((file_path, num_chunks))
+        seconds += time.perf_counter() - start - waited
+        print(f"⏱️  {file_path}: {num_chunks} chunks in {seconds:.2f}s")
+        metrics.observe("ingest_parse_file", seconds)
+    if batch or finished_files:
+        yield batch, finished_files
+
+
+def ingest(
+    data_paths,
+    workers=1,
+    batch_size=DEFAULT_BATCH_SIZE,
+    queue_size=DEFAULT_QUEUE_SIZE,
+    embedding_cache=True,
+    ocr_paths=(),
+    shards=None,
+    shard_by="source",
+    only_shard=None,
+    dedupe=True,
+    near_dedupe=False,
+):
+    """Incrementally sync the data folders into Chroma.
+
+    Files whose content hash matches the manifest are skipped before parsing,
+    edited files have their old chunks replaced, and files that disappeared
+    from disk have their chunks purged. Everything else streams through the
+    bounded load -> embed -> upsert pipeline in ingest_pipeline.py.
+    With embedding_cache, vectors for text that was embedded before (e.g.
+    before a --reset) come from embedding_cache.sqlite instead of the model.
+    PDFs under ocr_paths are OCR'd directly into Documents.
+    The BM25 lexical index used by hybrid retrieval is kept in step with
+    every chunk written or purged.
+    With shards, chunks are routed to that many Chroma collections, each
+    with its own lexical index (see sharded_store.py). only_shard builds a single source-routed shard with
+    its own manifest and lexical index, for one worker per shard.
+    With dedupe, chunks whose normalized text is already stored (another
+    edition, reprint or OCR'd copy) are embedded and stored once, with every
+    location kept in the stored chunk's "also_in" metadata; near_dedupe
+    extends that to near-identical text via MinHash. A shard built by its own
+    worker only dedupes against itself.
+    """
+    scanned_files = frozenset(f for f in list_source_files(ocr_paths) if f.endswith(".pdf"))
+    file_paths = [f for f in list_source_files(data_paths) if f not in scanned_files] + sorted(scanned_files)
+    embedding_function = get_embedding_function(cache=embedding_cache)
+    index_root = CHROMA_PATH
+    if shards:
+        write_layout(CHROMA_PATH, shards, shard_by)
+    if only_shard is not None:
+        if not shards or shard_by != "source":
+            raise ValueError("--only-shard needs --shards N --shard-by source")
+        # This worker only ever sees its own files, so everything it tracks lives in the shard.
+        index_root = shard_path(CHROMA_PATH, only_shard)
+        file_paths = [f for f in file_paths if shard_of(f, shards) == only_shard]
+        db = open_shard(embedding_function, CHROMA_PATH, only_shard,
+                        collection_configuration=collection_configuration())
+    elif shards:
+        db = ShardedVectorStore(embedding_function, CHROMA_PATH, num_shards=shards, shard_by=shard_by,
+                                collection_configuration=collection_configuration(), create=True)
+    else:
+        db = open_chroma(embedding_function, CHROMA_PATH, collection_configuration())
+
+    manifest = IngestManifest(
+        MANIFEST_PATH if only_shard is None else os.path.join(index_root, os.path.basename(MANIFEST_PATH))
+    )
+    if not manifest.files and collection(db).count():
+        # Collection built before the manifest existed (or with add_to_chroma):
+        # its chunks must be replaced, not added to.
+        manifest.seed(stored_sources(db))
+    changed, removed = manifest.plan(file_paths)
+    print(f"📂 {len(file_paths)} files: {len(changed)} new or changed, "
+          f"{len(file_paths) - len(changed)} unchanged, {len(removed)} removed")
+    print(f"Number of existing documents in DB: {collection(db).count()}")
+    if shards and only_shard is None:
+        # Each shard keeps its own index, exactly as a --only-shard worker builds it.
+        lexical_index = ShardedLexicalIndex(CHROMA_PATH, shards, shard_by, create=True)
+    else:
+        lexical_index = LexicalIndex(os.path.join(index_root, LEXICAL_INDEX_FILE))
+    registry = (ChunkRegistry(os.path.join(index_root, CHUNK_REGISTRY_FILE), near_duplicates=near_dedupe)
+                if dedupe else None)
+    if len(lexical_index) == 0 and collection(db).count():
+        # Collection built before the lexical index existed.
+        print("🔤 Building lexical index from existing chunks")
+        rebuild_lexical_index(db, lexical_index)
+
+    for file_path in removed:
+        purged = delete_source(db, file_path, lexical_index, registry)
+        manifest.forget(file_path)
+        print(f"🗑️  {file_path}: purged {len(purged)} chunks")
+    for file_path in changed:
+        if manifest.needs_reset(file_path):
+            # The file was edited in place: positional IDs may now point at
+            # different text, so drop the old chunks before writing fresh ones.
+            delete_source(db, file_path, lexical_index, registry)
+        manifest.start(file_path)
+    manifest.save()
+
+    def commit(finished_files):
+        # Files are only recorded once their last chunk is in the database.
+        for file_path, num_chunks in finished_files:
+            manifest.record(file_path, num_chunks)
+        if finished_files:
+            manifest.save()
+
+    start = time.perf_counter()
+    stats = run_pipeline(
+        iter_chunk_batches(changed, batch_size, workers, scanned_files),
+        db,
+        db.embeddings,
+        queue_size=queue_size,
+        on_commit=commit,
+        lexical_index=lexical_index,
+        registry=registry,
+    )
+    elapsed = time.perf_counter() - start
+    if changed or removed:
+        # (A single-shard worker can't refresh the export: it covers every shard.)
+        collection_changed(db, refresh=only_shard is None)
+    print(f"👉 Added {stats['written']} chunks ({stats['skipped']} already stored, "
+          f"{stats['duplicates']} duplicates of stored text) "
+          f"from {len(changed)} files in {elapsed:.1f}s "
+          f"(embed {stats['embed_seconds']:.1f}s, write {stats['write_seconds']:.1f}s)")
+    if stats["repeated_ids"]:
+        print(f"⚠️  {stats['repeated_ids']} chunks dropped: their ID was already used in the same batch")
+    print(format_snapshot(metrics.snapshot()))
+    if hasattr(db.embeddings, "stats"):
+        cache_stats = db.embeddings.stats()
+        print(f"🗄️  Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_ratio']:.0%}), {cache_stats['entries']} entries")
+
+
+def make_text_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=350,
         chunk_overlap=80,
         length_function=len,
         is_separator_regex=False,
     )
+
+
+def split_documents(documents: list[Document]):
+    text_splitter = make_text_splitter()
     return text_splitter.split_documents(documents)
 
 
-def add_to_chroma(chunks: list[Document]):
-    db = Chroma(
-        persist_directory=CHROMA_PATH, embedding_function=get_embedding_function()
-    )
+def collection_changed(db, refresh=True):
+    """Commit hook for every ingest path, run after chunks were written or purged."""
+    # Invalidate cached retrieval results in every running front-end.
+    bump_collection_version(CHROMA_PATH)
+    # Replicas serving the memory-mapped export remap it on their next query.
+    if refresh and refresh_export(db, CHROMA_PATH) is not None:
+        print("🗺️  Refreshed memory-mapped vector export")
+
+
+def add_to_chroma(chunks: list[Document], db=None, existing_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Write already-split chunks through the same pipeline (and commit hook) as ingest().
+
+    Chunks whose IDs are stored are skipped. Pass existing_ids to skip those
+    without asking the database; it is updated with the new IDs.
+    """
+    if db is None:
+        db = open_chroma(get_embedding_function(), CHROMA_PATH, collection_configuration())
     chunks_with_ids = calculate_chunk_ids(chunks)
-    existing_items = db.get(include=[])
-    existing_ids = set(existing_items["ids"])
-    print(f"Number of existing documents in DB: {len(existing_ids)}")
-
-    new_chunks = []
-    new_chunk_ids = []
-    for chunk in chunks_with_ids:
-        if chunk.metadata["id"] not in existing_ids:
-            new_chunks.append(chunk)
-            new_chunk_ids.append(chunk.metadata["id"])
-
-    if len(new_chunks):
-        print(f"👉 Adding new documents: {len(new_chunks)}")
-        # Add in batches
-        batch_size = 5000
-        for i in range(0, len(new_chunks), batch_size):
-            batch = new_chunks[i:i+batch_size]
-            batch_ids = new_chunk_ids[i:i+batch_size]
-            db.add_documents(batch, ids=batch_ids)
+    if existing_ids is not None:
+        chunks_with_ids = [chunk for chunk in chunks_with_ids if chunk.metadata["id"] not in existing_ids]
+    batches = ((chunks_with_ids[i:i + batch_size], []) for i in range(0, len(chunks_with_ids), batch_size))
+    lexical_index = LexicalIndex(os.path.join(CHROMA_PATH, LEXICAL_INDEX_FILE))
+    stats = run_pipeline(batches, db, db.embeddings, lexical_index=lexical_index)
+    if existing_ids is not None:
+        existing_ids.update(chunk.metadata["id"] for chunk in chunks_with_ids)
+    if stats["written"]:
+        print(f"👉 Added {stats['written']} chunks ({stats['skipped']} already stored)")
+        collection_changed(db)
     else:
         print("No new documents to add.")
 def calculate_chunk_ids(chunks):
+    for _chunk in assign_chunk_ids(chunks):
+        pass
+    return chunks
+
+
+def assign_chunk_ids(chunks):
 
     # This will create IDs like "data/monopoly.pdf:6:2"
     # Page Source : Page Number : Chunk Index
+    # Works on any iterable and yields each chunk once it has its ID, so it can
+    # sit in a streaming pipeline as well as run over a full list.
 
     last_page_id = None
     current_chunk_index = 0
 
     for chunk in chunks:
         source = chunk.metadata.get("source")
-        page = chunk.metadata.get("page")
+        # Rows of tabular files stand in for pages: "data/qa.csv:1234:0".
+        page = chunk.metadata.get("page", chunk.metadata.get("row"))
         current_page_id = f"{source}:{page}"
 
         # If the page ID is the same as the last one, increment the index.
@@ -120,8 +500,7 @@ def calculate_chunk_ids(chunks):
 
         # Add it to the page meta-data.
         chunk.metadata["id"] = chunk_id
-
-    return chunks
+        yield chunk
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+# A lone query waits at most this long for company before it is encoded.
+DEFAULT_WINDOW_MS = 5
+DEFAULT_MAX_BATCH_SIZE = 32
+
+
+class BatchingEmbeddings(Embeddings):
+    """Coalesces concurrent embed_query calls into one batched forward pass.
+
+    Callers block as usual; a background thread gathers queries for up to
+    window_ms (or max_batch_size queries), runs a single embed_documents and
+    hands each caller its own vector. For sentence-transformers models such as
+    all-MiniLM-L6-v2, embed_query(text) is embed_documents([text])[0], so the
+    vectors are unchanged.
+    """
+
+    def __init__(self, embeddings, max_batch_size=DEFAULT_MAX_BATCH_SIZE, window_ms=DEFAULT_WINDOW_MS):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self.batch_sizes = Counter()
+        self.total_queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed_query(self, text):
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def embed_documents(self, texts):
+        # Document embedding is already batched by the caller.
+        return self.embeddings.embed_documents(texts)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _future, _queued in batch])
+            except Exception as e:
+                for _text, future, _queued in batch:
+                    future.set_exception(e)
+                continue
+            for (_text, future, queued), vector in zip(batch, vectors):
+                waited = started - queued
+                self.total_queue_seconds += waited
+                self.max_queue_seconds = max(self.max_queue_seconds, waited)
+                future.set_result(vector)
+            self.batch_sizes[len(batch)] += 1
+            self.requests += len(batch)
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        return {
+            "requests": self.requests,
+            "batches": batches,
+            "mean_batch_size": self.requests / batches if batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "mean_queue_ms": 1000 * self.total_queue_seconds / self.requests if self.requests else 0.0,
+            "max_queue_ms": 1000 * self.max_queue_seconds,
+        }
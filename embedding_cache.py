@@ -0,0 +1,132 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+# Kept outside the Chroma directory on purpose: clear_database() wipes
+# chroma/, and a --reset rebuild is exactly when the cache pays off.
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"
+# Roughly 1.5 KB per all-MiniLM-L6-v2 vector, so ~3 GB at the default cap.
+DEFAULT_MAX_ENTRIES = 2_000_000
+# SQLite caps the number of "?" placeholders per statement.
+_LOOKUP_BATCH = 500
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model with a persistent sqlite cache of document vectors.
+
+    Keys are sha256(model name + text), so switching models never returns a
+    stale vector. Entries are evicted least-recently-used once the cache holds
+    more than max_entries vectors.
+    """
+
+    def __init__(self, embeddings, model_name, path=EMBEDDING_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def _lookup(self, keys):
+        found = {}
+        for i in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        return found
+
+    def _store(self, new_entries, hit_keys):
+        now = time.time()
+        with self._conn:
+            before = self._conn.total_changes
+            # A key can already be there if another process embedded the same
+            # text meanwhile; its vector is the same, so keep that row.
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in new_entries.items()],
+            )
+            inserted = self._conn.total_changes - before
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in hit_keys]
+            )
+            # Counting rows is a full scan, so track the size ourselves (only
+            # rows actually inserted) and only re-count after evicting.
+            self._entries += inserted
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+        self._entries = min(count, self.max_entries)
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        with self._lock:
+            found = self._lookup(keys)
+
+        # Embed each missing text once, even if it repeats within the batch.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        new_entries = {}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_entries = dict(zip(missing.keys(), vectors))
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            self._store(new_entries, found.keys())
+        found.update(new_entries)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        # Queries are short and rarely repeat word for word, so they go
+        # straight to the model.
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": self._entries,
+        }
+
+    def close(self):
+        self._conn.close()
+
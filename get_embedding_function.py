@@ -1,8 +1,37 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-
-def get_embedding_function():
-    # CRITIQUE FIX: Switched to Sentence-Transformer model.
-    # 'all-MiniLM-L6-v2' is better at capturing semantic nuance and intent 
-    # than pure keyword matching, which is crucial for understanding emotional context.
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    return embeddings
\ No newline at end of file
+import os
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "huggingface" (PyTorch via sentence-transformers), "onnx" (ONNX Runtime,
+# same vectors, faster on CPU) or "onnx-int8" (quantized: faster still,
+# vectors differ slightly, so rebuild the index when switching to or from it).
+# See onnx_embeddings.py.
+EMBEDDINGS_PROVIDER = os.environ.get("EMBEDDINGS_PROVIDER", "huggingface")
+PROVIDERS = ["huggingface", "onnx", "onnx-int8"]
+
+def get_embedding_function(cache=False, provider=None):
+    provider = provider or EMBEDDINGS_PROVIDER
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDINGS_PROVIDER {provider!r}; expected one of {', '.join(PROVIDERS)}")
+    if provider == "huggingface":
+        # Imported here: loading sentence-transformers (and torch) is the slowest
+        # part of CLI startup, so callers can do it off the main thread.
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        # CRITIQUE FIX: Switched to Sentence-Transformer model.
+        # 'all-MiniLM-L6-v2' is better at capturing semantic nuance and intent 
+        # than pure keyword matching, which is crucial for understanding emotional context.
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    else:
+        from onnx_embeddings import OnnxEmbeddings
+        embeddings = OnnxEmbeddings(quantized=provider == "onnx-int8")
+
+    # Optionally put a persistent on-disk cache in front of the model, so
+    # rebuilding the index never re-encodes text it has already seen.
+    # EMBEDDING_CACHE_PATH can point the cache somewhere other than the default.
+    if cache:
+        from embedding_cache import EMBEDDING_CACHE_PATH, CachedEmbeddings
+        path = os.environ.get("EMBEDDING_CACHE_PATH", EMBEDDING_CACHE_PATH)
+        # fp32 ONNX reproduces the PyTorch vectors, so only int8 needs its own cache entries.
+        model_name = f"{EMBEDDING_MODEL}:int8" if provider == "onnx-int8" else EMBEDDING_MODEL
+        return CachedEmbeddings(embeddings, model_name=model_name, path=path)
+    return embeddings
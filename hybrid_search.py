@@ -0,0 +1,70 @@
+import numpy as np
+from langchain_core.documents import Document
+
+# Reciprocal rank fusion constant from Cormack et al.; damps the head of each
+# ranking so neither retriever can dominate on its own.
+RRF_K = 60
+# Each retriever contributes this many candidates per requested result.
+CANDIDATE_MULTIPLIER = 4
+
+
+def collection_space(db):
+    """The distance Chroma's HNSW index uses for this collection ("l2", "cosine" or "ip")."""
+    if hasattr(db, "space"):
+        # MmapVectorStore records the space of the collection it was exported from.
+        return db.space
+    from chroma_client import collection
+
+    try:
+        return collection(db).configuration["hnsw"]["space"]
+    except (AttributeError, KeyError, TypeError):
+        return (collection(db).metadata or {}).get("hnsw:space", "l2")
+
+
+def distances(space, query_embedding, vectors):
+    """Same numbers Chroma reports as scores, so relevance thresholds keep working."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+    if space == "ip":
+        return 1.0 - vectors @ query
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Fuse ranked ID lists into one, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search(db, lexical_index, query_text, query_embedding, k):
+    """Top-k [(Document, distance), ...] from fused BM25 and vector rankings.
+
+    Exact terms ("CBT", "learned helplessness", author names) are found by
+    the lexical index even when the embedding ranks them low. Results keep
+    the shape of similarity_search_with_score: the distance of a chunk that
+    only BM25 found is computed from its stored embedding.
+    """
+    candidates = k * CANDIDATE_MULTIPLIER
+    dense = db.similarity_search_by_vector_with_relevance_scores(query_embedding, k=candidates)
+    lexical = lexical_index.search(query_text, k=candidates)
+
+    found = {doc.id or doc.metadata.get("id"): (doc, score) for doc, score in dense}
+    fused = reciprocal_rank_fusion(list(found), [chunk_id for chunk_id, _score in lexical])[:k]
+
+    missing = [chunk_id for chunk_id in fused if chunk_id not in found]
+    if missing:
+        stored = db.get(ids=missing, include=["embeddings", "documents", "metadatas"])
+        if stored["ids"]:
+            scores = distances(collection_space(db), query_embedding, stored["embeddings"])
+            for chunk_id, text, metadata, score in zip(
+                stored["ids"], stored["documents"], stored["metadatas"], scores
+            ):
+                found[chunk_id] = (Document(page_content=text, metadata=metadata or {}, id=chunk_id), float(score))
+    # An ID can be in the lexical index but gone from Chroma mid re-ingest.
+    return [found[chunk_id] for chunk_id in fused if chunk_id in found]
@@ -0,0 +1,51 @@
+import json
+import os
+
+# Written by ann_tuning.py. Lives outside chroma/ so a --reset rebuild is
+# created with the tuned settings instead of Chroma's defaults.
+INDEX_CONFIG_PATH = "index_config.json"
+# Used until ann_tuning.py has calibrated a space. 0.7 was hand-picked for
+# Chroma's default L2 space; all-MiniLM-L6-v2 vectors are unit length, so
+# squared L2 is twice the cosine (and inner-product) distance.
+DEFAULT_RELEVANCE_THRESHOLDS = {"l2": 0.7, "cosine": 0.35, "ip": 0.35}
+
+
+def load_index_config(path=INDEX_CONFIG_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def collection_configuration(path=INDEX_CONFIG_PATH):
+    """HNSW settings for Chroma(collection_configuration=...), or None for Chroma's defaults.
+
+    Only applied when the collection is created; changing the space of an
+    existing collection needs `--reset`.
+    """
+    hnsw = load_index_config(path).get("hnsw")
+    return {"hnsw": hnsw} if hnsw else None
+
+
+def relevance_threshold(space="l2", path=INDEX_CONFIG_PATH):
+    """Largest top-1 distance still treated as relevant in the given distance space.
+
+    Pass the space the collection actually uses: after `ann_tuning.py --apply`
+    switches spaces, the existing collection keeps its old one until `--reset`.
+    """
+    config = load_index_config(path)
+    thresholds = config.get("relevance_thresholds", {})
+    if space in thresholds:
+        return thresholds[space]
+    # Older configs hold a single threshold, calibrated for the tuned space.
+    if "relevance_threshold" in config and config.get("hnsw", {}).get("space", "l2") == space:
+        return config["relevance_threshold"]
+    return DEFAULT_RELEVANCE_THRESHOLDS.get(space, DEFAULT_RELEVANCE_THRESHOLDS["l2"])
+
+
+def save_index_config(config, path=INDEX_CONFIG_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
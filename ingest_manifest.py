@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+# The manifest lives inside the Chroma directory so that clear_database()
+# (rm -rf chroma) also forgets what was ingested.
+MANIFEST_PATH = os.path.join("chroma", "ingest_manifest.json")
+# Bumped when unchanged files start getting different chunk IDs. Entries from
+# an older manifest are treated like seeded ones (see seed()), so the old
+# chunks are purged instead of sitting next to the new ones.
+# 1: unversioned. 2: tabular rows use their row ID ("source:row:i", not "source:None:i").
+MANIFEST_VERSION = 2
+
+
+def file_hash(file_path):
+    """SHA-256 of a file's bytes, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """Persistent record of every ingested file: path -> content hash, size, mtime, chunk count.
+
+    A file that is being ingested has "chunks": None until its last chunk is
+    committed, so an interrupted run can tell "resume this file" apart from
+    "this file was edited again".
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.files = {}
+        self._pending = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            version = data.get("version", 1) if isinstance(data.get("files"), dict) else 1
+            self.files = data["files"] if version > 1 else data
+            if version < MANIFEST_VERSION:
+                for entry in self.files.values():
+                    entry.update(sha256=None, size=None, mtime=None)
+
+    def plan(self, file_paths):
+        """Split file_paths into (changed, removed); files that are unchanged are left out.
+
+        Size + mtime is checked first so untouched files are never re-read;
+        only files whose stat changed are hashed.
+        """
+        changed = []
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            entry = self.files.get(file_path)
+            complete = entry is not None and entry["chunks"] is not None
+            if complete and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            content_hash = file_hash(file_path)
+            if complete and entry["sha256"] == content_hash:
+                # Touched but not edited: refresh the stat so we skip the hash next time.
+                entry["mtime"] = stat.st_mtime
+                continue
+            self._pending[file_path] = {
+                "sha256": content_hash,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+            changed.append(file_path)
+
+        seen = set(file_paths)
+        removed = [file_path for file_path in self.files if file_path not in seen]
+        return changed, removed
+
+    def needs_reset(self, file_path):
+        """True if the database may hold chunks of an older version of file_path."""
+        entry = self.files.get(file_path)
+        if entry is None:
+            return False
+        resuming = entry["chunks"] is None and entry["sha256"] == self._pending[file_path]["sha256"]
+        return not resuming
+
+    def seed(self, sources):
+        """Track sources already in the database but missing from the manifest.
+
+        They are treated as an older version of the file: the next plan()
+        re-ingests them after purging their chunks, or purges them if they
+        are gone from disk.
+        """
+        for source in sources:
+            self.files.setdefault(source, {"sha256": None, "size": None, "mtime": None, "chunks": 0})
+
+    def start(self, file_path):
+        """Mark a file from the last plan() as in progress."""
+        self.files[file_path] = dict(self._pending[file_path], chunks=None)
+
+    def record(self, file_path, num_chunks):
+        """Mark a file from the last plan() as fully written to the database."""
+        entry = self._pending.pop(file_path)
+        entry["chunks"] = num_chunks
+        self.files[file_path] = entry
+
+    def forget(self, file_path):
+        self.files.pop(file_path, None)
+
+    def save(self):
+        # Write-then-rename so a crash mid-save never leaves a truncated manifest.
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
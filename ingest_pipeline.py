@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+from chroma_client import collection, max_batch_size, with_retry
+from chunk_dedupe import sync_locations
+from metrics import metrics
+
+# Stages are connected by bounded queues, so at most
+# (2 * queue_size + 3) batches of chunks are alive at once no matter how big
+# the corpus is. A slow stage blocks the ones feeding it (backpressure).
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    """Blocking put that gives up once another stage has failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(batches, db, embedding_function, queue_size=DEFAULT_QUEUE_SIZE, on_commit=None, lexical_index=None,
+                 registry=None):
+    """Embed and upsert chunk batches while the next ones are still being loaded.
+
+    `batches` yields (chunks, finished_files) where every chunk already has
+    metadata["id"] and finished_files lists the (file_path, num_chunks) whose
+    last chunk is in this batch. Three stages run concurrently:
+
+        load/split/ID (thread) -> embed (thread) -> upsert (calling thread)
+
+    Chunks whose IDs are already in the collection are not re-embedded, so
+    re-running after a crash resumes from the last committed batch.
+    on_commit(finished_files) is called after each batch is durably written.
+    With lexical_index set, every chunk of the batch (including ones already in
+    Chroma, so a resumed run repairs the index) is also added to it.
+    With registry set (a chunk_dedupe.ChunkRegistry), chunks whose text is
+    already stored are recorded as extra locations of that chunk instead of
+    being embedded and written again.
+    """
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_write = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    stats = {"batches": 0, "chunks": 0, "written": 0, "skipped": 0, "duplicates": 0, "repeated_ids": 0,
+             "embed_seconds": 0.0, "write_seconds": 0.0}
+    # Over a Chroma server every upsert is one HTTP request: send whole batches,
+    # split only where the client's limit requires it.
+    write_size = max_batch_size(db)
+
+    def produce():
+        try:
+            started = time.perf_counter()
+            for batch in batches:
+                # Time to load, split and ID one batch (excludes waiting on the embed stage).
+                metrics.observe("ingest_load", time.perf_counter() - started)
+                if not _put(to_embed, batch, stop):
+                    return
+                started = time.perf_counter()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if hasattr(batches, "close"):
+                # Shuts down any worker pool the generator owns if we bailed out early.
+                batches.close()
+            _put(to_embed, _DONE, stop)
+
+    def embed():
+        try:
+            while (item := _get(to_embed, stop)) is not _DONE:
+                chunks, finished_files = item
+                num_chunks = len(chunks)
+                # tabular_loaders gives repeated row IDs a suffix, so this only
+                # catches chunks that still share an ID. Keep the first (as a
+                # repeat in a later batch is skipped as stored) and count the rest.
+                first = {}
+                for chunk in chunks:
+                    first.setdefault(chunk.metadata["id"], chunk)
+                stats["repeated_ids"] += num_chunks - len(first)
+                chunks = list(first.values())
+                ids = list(first)
+                existing = set(with_retry(lambda: db.get(ids=ids, include=[]), "get")["ids"]) if ids else set()
+                # Copies recorded by an earlier (interrupted) run count as done.
+                aliases = registry.aliases_among(ids) if registry is not None else set()
+                new_chunks = [chunk for chunk in chunks if chunk.metadata["id"] not in existing | aliases]
+                stats["skipped"] += len(chunks) - len(new_chunks)
+                rows = []
+                if registry is not None:
+                    unique, rows = registry.assign(new_chunks)
+                    unique_ids = {chunk.metadata["id"] for chunk in unique}
+                    aliases |= {chunk.metadata["id"] for chunk in new_chunks} - unique_ids
+                    stats["duplicates"] += len(new_chunks) - len(unique)
+                    new_chunks = unique
+                    # Copies are never stored, so BM25 must not return them either.
+                    chunks = [chunk for chunk in chunks if chunk.metadata["id"] not in aliases]
+                start = time.perf_counter()
+                embeddings = (
+                    embedding_function.embed_documents([chunk.page_content for chunk in new_chunks])
+                    if new_chunks else []
+                )
+                elapsed = time.perf_counter() - start
+                stats["embed_seconds"] += elapsed
+                if new_chunks:
+                    metrics.observe("ingest_embed", elapsed)
+                if not _put(to_write, (chunks, num_chunks, new_chunks, embeddings, rows, finished_files), stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            _put(to_write, _DONE, stop)
+
+    threads = [
+        threading.Thread(target=produce, name="ingest-load", daemon=True),
+        threading.Thread(target=embed, name="ingest-embed", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while (item := _get(to_write, stop)) is not _DONE:
+            chunks, num_chunks, new_chunks, embeddings, rows, finished_files = item
+            start = time.perf_counter()
+            step = write_size or len(new_chunks)
+            for i in range(0, len(new_chunks), step):
+                part = new_chunks[i:i + step]
+                # Upserts are idempotent, so a write cut off by a dropped connection is retried.
+                with_retry(lambda part=part, i=i: collection(db).upsert(
+                    ids=[chunk.metadata["id"] for chunk in part],
+                    embeddings=embeddings[i:i + step],
+                    metadatas=[chunk.metadata for chunk in part],
+                    documents=[chunk.page_content for chunk in part],
+                ), "write")
+            if rows:
+                touched = registry.commit(rows)
+                with_retry(lambda: sync_locations(collection(db), registry, touched), "write")
+            if lexical_index is not None and chunks:
+                lexical_index.add([chunk.metadata["id"] for chunk in chunks], [chunk.page_content for chunk in chunks])
+            elapsed = time.perf_counter() - start
+            stats["write_seconds"] += elapsed
+            metrics.observe("ingest_write", elapsed)
+            stats["batches"] += 1
+            stats["chunks"] += num_chunks
+            stats["written"] += len(new_chunks)
+            if on_commit is not None:
+                on_commit(finished_files)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return stats
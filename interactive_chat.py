@@ -2,28 +2,43 @@ import argparse
 import sys
 import logging
 import time
-from collections import deque
-from langchain_chroma import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaLLM
-from get_embedding_function import get_embedding_function
+from retrieval_cache import retrieval_cache
+from llm_streaming import TimedStream
+from crisis_screening import build_crisis_pattern
+from metrics import format_snapshot, metrics, start_from_env
+from index_config import DEFAULT_RELEVANCE_THRESHOLDS, relevance_threshold
+from hybrid_search import collection_space
+from context_compression import source_ids
+from conversation_memory import ConversationMemory, fit_sections, llm_summarizer
+from prompt_cache import CachedPrompt, prefill_tracker
+from warm_start import Startup
 
 # --- CONFIGURATION ---
 CHROMA_PATH = "chroma"
-# Relevance Threshold: 
-# Chroma uses "L2 Distance" by default. 
-# Lower distance = More similar. 
-# 0.0 is an exact match. ~0.3-0.5 is usually good. > 1.0 is often irrelevant.
-RELEVANCE_THRESHOLD = 0.7 
+# Relevance Threshold: largest distance of the closest hit still treated as
+# on-topic. Lower distance = More similar. 0.0 is an exact match.
+# The scale depends on the index's distance space, so there is one per space
+# (calibrated by ann_tuning.py) and each turn uses the collection's own.
+RELEVANCE_THRESHOLDS = {space: relevance_threshold(space) for space in DEFAULT_RELEVANCE_THRESHOLDS}
 LOG_FILE = "chatbot_interaction.log"
 
 # --- SAFETY & CRISIS CONFIGURATION ---
-# Simple keyword matching for immediate safety interception.
-# In production, use a dedicated classifier model (e.g., BERT-based sentiment analysis).
+# Keyword matching for immediate safety interception. This is the hard floor:
+# one precompiled, word-boundary regex. It must never get weaker, so everyday
+# phrases are carved out as exceptions ("cutting class") rather than by
+# narrowing a keyword ("I started cutting again" is still caught).
+# Paraphrases are caught by the semantic layer in crisis_screening.py.
 CRISIS_KEYWORDS = [
-    "suicide", "kill myself", "want to die", "end it all", "hurt myself", 
-    "self-harm", "cutting", "overdose", "better off dead"
+    "suicide", "suicidal", "kill myself", "killing myself", "want to die", "end it all",
+    "hurt myself", "hurting myself", "self-harm", "cutting", "cut myself",
+    "cut my wrist", "cut my wrists", "cut my arm", "cut my arms", "cut my legs", "cut my skin",
+    "overdose", "better off dead"
 ]
+CRISIS_EXCEPTIONS = {
+    "cutting": ["class", "classes", "school", "lectures", "the curve", "corners", "back on", "down on",
+                "costs", "my hair", "it close", "in line"],
+}
+CRISIS_PATTERN = build_crisis_pattern(CRISIS_KEYWORDS, CRISIS_EXCEPTIONS)
 
 CRISIS_RESPONSE = """
 ⚠️ IMPORTANT: I hear that you are going through a very difficult time, but I am an AI, not a mental health professional. 
@@ -47,28 +62,34 @@ LEGAL_DISCLAIMER = """
 """
 
 # --- UPDATED PROMPT WITH BOUNDARIES ---
-PROMPT_TEMPLATE = """
-You are a warm, empathetic college mentor AI. 
-You are NOT a therapist, psychologist, or doctor. 
+# The guidelines come first and never change, so Ollama can reuse them from
+# the previous turn. History goes before context because it mostly grows by
+# appending, which keeps even more of the prompt reusable.
+PROMPT_TEMPLATE = CachedPrompt(
+    instructions="""
+You are a warm, empathetic college mentor AI.
+You are NOT a therapist, psychologist, or doctor.
 
 YOUR ROLE:
 1. Provide supportive, non-medical advice based on the context provided.
 2. Translate academic/textbook concepts into warm, human language.
 3. MAINTAIN BOUNDARIES: If the user seems overly dependent or asks for a diagnosis, gently remind them you are an AI and suggest professional help.
 4. IGNORE context if it is irrelevant to the user's feelings.
+""",
+    sections="""
+CHAT HISTORY:
+{history}
 
 CONTEXT FROM BOOKS:
 {context}
 
-CHAT HISTORY:
-{history}
-
 ---
 
 USER'S QUESTION: {question}
 
 MENTOR'S RESPONSE:
-"""
+""",
+)
 
 def setup_logging():
     logging.basicConfig(
@@ -79,18 +100,18 @@ def setup_logging():
 
 def main():
     setup_logging()
+    # Optional /metrics endpoint or periodic dump (METRICS_PORT / METRICS_DUMP_PATH).
+    start_from_env()
+    # 1. Initialize components in the background (embedding model, vector
+    # store, warmed-up Mistral) while the student reads and types.
+    startup = Startup(CHROMA_PATH, screener=True, warmup_prompt=PROMPT_TEMPLATE.prefix)
     print(LEGAL_DISCLAIMER)
     print("--- Psychology Mentor CLI (Type 'quit' to stop) ---")
-    print("--- Loading Brain (this may take a moment)... ---")
-    
-    # 1. Initialize components
-    embedding_function = get_embedding_function()
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-    model = OllamaLLM(model="mistral")
     
     # 2. Memory Setup
-    # Increased history to 5 to allow for longer context retention as per critique
-    history = deque(maxlen=5)
+    # The last few exchanges stay verbatim; older ones are folded into a running
+    # summary by Mistral between turns, so long sessions keep a flat prompt size.
+    history = ConversationMemory(summarize=llm_summarizer(startup.model, PROMPT_TEMPLATE.prefix, prefill_tracker))
     
     print("Mentor: Hello! I'm here to listen and offer perspective from your library. How are you feeling?")
 
@@ -102,6 +123,10 @@ def main():
             # Handle exit commands
             if query_text.lower() in ['quit', 'exit', 'q']:
                 print("Mentor: Take care of yourself. Remember to seek support if you need it. Bye.")
+                logging.info(startup.summary())
+                logging.info(f"Retrieval cache: {retrieval_cache.stats()}")
+                logging.info(f"Prompt prefix reuse: {prefill_tracker.stats()}")
+                logging.info(f"Stage latencies:\n{format_snapshot(metrics.snapshot())}")
                 break
             
             if not query_text.strip():
@@ -116,22 +141,36 @@ def main():
                 print(f"\nMentor: {CRISIS_RESPONSE}")
                 logging.warning(f"Crisis Keyword Detected: {query_text}")
                 continue
+            
+            # Blocks only if a component is still loading.
+            db, model, screener = startup.db(), startup.model(), startup.screener()
+
+            # Semantic layer: compares the query embedding (which retrieval
+            # reuses below) with crisis exemplars to catch paraphrases.
+            query_embedding = retrieval_cache.embed_query(db.embeddings, query_text)
+            crisis_label = screener.screen(query_embedding)
+            if crisis_label:
+                print(f"\nMentor: {CRISIS_RESPONSE}")
+                logging.warning(f"Crisis Paraphrase Detected ({crisis_label}): {query_text}")
+                continue
             # --------------------------
 
-            # 4. Run the RAG pipeline
-            response_text, sources, is_relevant = query_rag(query_text, history, db, model)
+            # 4. Run the RAG pipeline, printing the answer as Mistral writes it
+            stream, sources, is_relevant = stream_rag(query_text, history, db, model)
+            print("\nMentor: ", end="", flush=True)
+            for token in stream:
+                print(token, end="", flush=True)
+            print()
+            response_text = stream.text
             
             # Log the response
             logging.info(f"Mentor Response: {response_text}")
             logging.info(f"Sources: {sources}")
             
             # 5. Update Memory
-            history.append(f"Student: {query_text}\nMentor: {response_text}")
-
-            # 6. Output Result
-            print(f"\nMentor: {response_text}")
+            history.append(query_text, response_text)
             
-            # 7. Display Sources & Warnings
+            # 6. Display Sources & Warnings
             if sources:
                 print("\nSources:")
                 for source in sources:
@@ -142,47 +181,58 @@ def main():
             
         except KeyboardInterrupt:
             print("\nMentor: Take care! Bye.")
+            logging.info(f"Retrieval cache: {retrieval_cache.stats()}")
             break
 
 def check_for_crisis(text):
-    """Simple keyword detection for crisis situations."""
-    text_lower = text.lower()
-    for keyword in CRISIS_KEYWORDS:
-        if keyword in text_lower:
-            return True
-    return False
+    """Keyword detection for crisis situations (whole words and phrases only)."""
+    with metrics.timer("crisis_check"):
+        return CRISIS_PATTERN.search(text) is not None
+
+def build_prompt(query_text: str, history, db, session=None):
+    """Retrieval and prompt assembly shared by query_rag and stream_rag.
 
-def query_rag(query_text: str, history: deque, db, model):
-    # A. Search the DB with scores
-    results = db.similarity_search_with_score(query_text, k=4)
+    `history` is a ConversationMemory or a list of "Student: ...\nMentor: ..." turns.
+    `session` identifies the conversation to the prefill tracker.
+    """
+    # A. Search the DB with scores (repeated questions are served from the cache)
+    results = retrieval_cache.search(db, query_text, k=4)
 
     # B. Relevance Check
+    # On the closest hit, not the first: the top fused hit may have come from
+    # BM25 alone and sit far away in embedding space.
+    threshold = RELEVANCE_THRESHOLDS.get(collection_space(db), RELEVANCE_THRESHOLDS["l2"])
     is_relevant = True
-    if not results or results[0][1] > RELEVANCE_THRESHOLD:
+    if not results or min(score for _doc, score in results) > threshold:
         is_relevant = False
 
-    # C. Prepare Context
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-    
-    # D. Prepare History
-    history_text = "\n".join(history)
-    
-    # E. Format Prompt
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, history=history_text, question=query_text)
+    with metrics.timer("prompt"):
+        # C + D. Context and history, trimmed to the prompt token budget
+        context_text, history_text, results = fit_sections(PROMPT_TEMPLATE, results, history, query_text)
 
-    # F. Generate Response
-    response_text = model.invoke(prompt)
-    
-    # G. Extract unique sources
+        # E. Format Prompt (static guidelines first, then this turn's sections)
+        prompt = PROMPT_TEMPLATE.format(context=context_text, history=history_text, question=query_text)
+    prefill_tracker.record(prompt, session=session)
+
+    # F. Extract unique sources
     sources = []
     if is_relevant:
         for doc, _score in results:
-            source_id = doc.metadata.get("id", None)
-            if source_id:
-                sources.append(source_id)
+            # Merged spans list every chunk they cover.
+            sources.extend(source_ids(doc))
     
-    return response_text, list(set(sources)), is_relevant
+    return prompt, list(set(sources)), is_relevant
+
+def query_rag(query_text: str, history, db, model):
+    prompt, sources, is_relevant = build_prompt(query_text, history, db)
+    with metrics.timer("llm_total"):
+        response_text = model.invoke(prompt)
+    return response_text, sources, is_relevant
+
+def stream_rag(query_text: str, history, db, model):
+    """Like query_rag, but returns a TimedStream of tokens instead of the full text."""
+    prompt, sources, is_relevant = build_prompt(query_text, history, db)
+    return TimedStream(model, prompt), sources, is_relevant
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
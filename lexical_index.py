@@ -0,0 +1,292 @@
+import argparse
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+CHROMA_PATH = "chroma"
+# Lives next to the vectors so clear_database() removes both together.
+LEXICAL_INDEX_FILE = "lexical_index.sqlite"
+
+# Standard Okapi BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Postings are read in blocks of this many, highest impact first.
+POSTINGS_BLOCK = 256
+# Most postings read for one query term. Search usually stops well before
+# (see search()). When several very common words ("students stress anxiety")
+# reach it, chunks that match all of them only weakly can be missed.
+MAX_POSTINGS_PER_TERM = 2048
+
+# Words too common to say anything about a passage. Kept short on purpose:
+# domain terms like "self", "fear" or "help" must stay searchable.
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its me my of on or so
+that the their then there these they this to was we were what when which who will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens; keeps acronyms (CBT) and digits (DSM-5 -> dsm, 5)."""
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOP_WORDS]
+
+
+class LexicalIndex:
+    """Persistent BM25 inverted index over chunk IDs, stored in sqlite.
+
+    Terms and chunks are mapped to integers; postings are (term, doc, tf,
+    doc length, impact) rows. Each term's postings are also indexed by
+    impact (its BM25 term-frequency factor when written), so a query can
+    read the strongest matches first and stop early (see search()). Chunks
+    can be added and removed incrementally, mirroring what ingestion does to
+    Chroma.
+    """
+
+    def __init__(self, path=os.path.join(CHROMA_PATH, LEXICAL_INDEX_FILE)):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS terms (term INTEGER PRIMARY KEY, text TEXT UNIQUE NOT NULL, df INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                term INTEGER NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, length INTEGER NOT NULL,
+                impact REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_by_doc ON postings (doc);
+            INSERT OR IGNORE INTO meta VALUES ('num_docs', 0), ('total_length', 0);
+        """)
+        self._conn.commit()
+        with self._conn:
+            if "impact" not in [column[1] for column in self._conn.execute("PRAGMA table_info(postings)")]:
+                # Index written before postings carried their impact.
+                self._conn.execute("ALTER TABLE postings ADD COLUMN impact REAL NOT NULL DEFAULT 0")
+                meta = self._meta()
+                avg_length = meta["total_length"] / meta["num_docs"] if meta["num_docs"] else 1.0
+                self._conn.create_function("tf_factor", 3, _tf_factor, deterministic=True)
+                self._conn.execute("UPDATE postings SET impact = tf_factor(tf, length, ?)", (avg_length,))
+                self._record_impact_avg_length(avg_length)
+            # Covering, so the impact-ordered scans in search() never touch the table.
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_by_impact "
+                               "ON postings (term, impact DESC, tf, length)")
+
+    def _meta(self):
+        return dict(self._conn.execute("SELECT key, value FROM meta"))
+
+    def _record_impact_avg_length(self, avg_length):
+        # The smallest average any stored impact was computed with bounds how
+        # far impacts can understate today's factors.
+        self._conn.execute("INSERT INTO meta VALUES ('impact_avg_length', ?) "
+                           "ON CONFLICT (key) DO UPDATE SET value = min(value, excluded.value)", (avg_length,))
+
+    def _remove(self, chunk_ids):
+        docs = []
+        for chunk_id in chunk_ids:
+            row = self._conn.execute("SELECT doc, length FROM docs WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row:
+                docs.append(row)
+        if not docs:
+            return 0
+        df_drop = Counter()
+        for doc, _length in docs:
+            df_drop.update(term for (term,) in self._conn.execute("SELECT term FROM postings WHERE doc = ?", (doc,)))
+        self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, t) for t, n in df_drop.items()])
+        self._conn.executemany("DELETE FROM postings WHERE doc = ?", [(doc,) for doc, _length in docs])
+        self._conn.executemany("DELETE FROM docs WHERE doc = ?", [(doc,) for doc, _length in docs])
+        self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'num_docs'", (len(docs),))
+        self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'total_length'",
+                           (sum(length for _doc, length in docs),))
+        return len(docs)
+
+    def remove(self, chunk_ids):
+        with self._lock, self._conn:
+            return self._remove(chunk_ids)
+
+    def add(self, chunk_ids, texts):
+        """Index (or re-index) chunks. If an ID repeats, its last text wins."""
+        latest = dict(zip(chunk_ids, texts))
+        chunk_ids, texts = list(latest), list(latest.values())
+        with self._lock, self._conn:
+            self._remove(chunk_ids)
+            term_counts = [Counter(tokenize(text)) for text in texts]
+            vocabulary = set().union(*term_counts) if term_counts else set()
+            self._conn.executemany("INSERT OR IGNORE INTO terms (text, df) VALUES (?, 0)", [(t,) for t in vocabulary])
+            term_ids = {}
+            vocabulary = list(vocabulary)
+            for i in range(0, len(vocabulary), 500):
+                batch = vocabulary[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                term_ids.update(
+                    (text, term) for term, text in
+                    self._conn.execute(f"SELECT term, text FROM terms WHERE text IN ({placeholders})", batch)
+                )
+
+            postings = []
+            df_add = Counter()
+            lengths = [sum(counts.values()) for counts in term_counts]
+            total_length = sum(lengths)
+            meta = self._meta()
+            # Impacts use the average length as of this batch; search() scores
+            # with the current one and bounds the difference.
+            avg_length = (meta["total_length"] + total_length) / max(1, meta["num_docs"] + len(chunk_ids))
+            self._record_impact_avg_length(avg_length)
+            for chunk_id, counts, length in zip(chunk_ids, term_counts, lengths):
+                doc = self._conn.execute(
+                    "INSERT INTO docs (chunk_id, length) VALUES (?, ?)", (chunk_id, length)
+                ).lastrowid
+                for text, tf in counts.items():
+                    postings.append((term_ids[text], doc, tf, length, _tf_factor(tf, length, avg_length)))
+                df_add.update(counts.keys())
+            self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?)", postings)
+            self._conn.executemany("UPDATE terms SET df = df + ? WHERE term = ?",
+                                   [(n, term_ids[t]) for t, n in df_add.items()])
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'num_docs'", (len(chunk_ids),))
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_length'", (total_length,))
+
+    def search(self, query_text, k=10):
+        """Top-k (chunk_id, bm25 score) for the query.
+
+        Each term's postings are read best impact first, a block at a time,
+        from whichever term could still add the most to an unseen chunk.
+        Every chunk met this way is scored exactly. Reading stops as soon as
+        no unseen chunk can beat the k-th score, so common words are rarely
+        read far; MAX_POSTINGS_PER_TERM caps the rest.
+        """
+        query_terms = set(tokenize(query_text))
+        if not query_terms or k <= 0:
+            return []
+        with self._lock:
+            meta = self._meta()
+            num_docs = meta["num_docs"]
+            if num_docs == 0:
+                return []
+            avg_length = meta["total_length"] / num_docs
+            placeholders = ",".join("?" * len(query_terms))
+            idf = {
+                term: math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for term, df in self._conn.execute(
+                    f"SELECT term, df FROM terms WHERE text IN ({placeholders}) AND df > 0", list(query_terms)
+                )
+            }
+            if not idf:
+                return []
+            # Impacts were computed with the average length of their day; an
+            # average that has grown since can lift a posting's factor.
+            scale = max(1.0, avg_length / meta.get("impact_avg_length", avg_length))
+            cursors = {term: self._conn.execute(
+                "SELECT doc, impact FROM postings WHERE term = ? ORDER BY impact DESC", (term,)
+            ) for term in idf}
+            # Upper bound on the factor of each term's next unread posting (0 once done).
+            bounds = dict.fromkeys(idf, BM25_K1 + 1)
+            read = Counter()
+            seen = set()
+            top = []
+            term_list = ",".join(str(term) for term in idf)
+            while True:
+                remaining = sum(idf[term] * bound for term, bound in bounds.items())
+                if remaining == 0 or (len(top) == k and top[0][0] >= remaining):
+                    break
+                term = max(bounds, key=lambda t: idf[t] * bounds[t])
+                block = cursors[term].fetchmany(POSTINGS_BLOCK)
+                read[term] += len(block)
+                if len(block) < POSTINGS_BLOCK or read[term] >= MAX_POSTINGS_PER_TERM:
+                    bounds[term] = 0.0
+                else:
+                    bounds[term] = _impact_bound(block[-1][1], scale)
+                new_docs = [doc for doc, _impact in block if doc not in seen]
+                if not new_docs:
+                    continue
+                seen.update(new_docs)
+                scores = dict.fromkeys(new_docs, 0.0)
+                for doc, term_id, tf, length in self._conn.execute(
+                    f"SELECT doc, term, tf, length FROM postings WHERE term IN ({term_list}) "
+                    f"AND doc IN ({','.join(str(doc) for doc in new_docs)})"
+                ):
+                    scores[doc] += idf[term_id] * _tf_factor(tf, length, avg_length)
+                for doc, score in scores.items():
+                    if len(top) < k:
+                        heapq.heappush(top, (score, doc))
+                    elif score > top[0][0]:
+                        heapq.heapreplace(top, (score, doc))
+            for cursor in cursors.values():
+                cursor.close()
+            chunk_ids = dict(self._conn.execute(
+                f"SELECT doc, chunk_id FROM docs WHERE doc IN ({','.join(str(doc) for _score, doc in top)})"
+            )) if top else {}
+        results = [(chunk_ids[doc], score) for score, doc in top]
+        return sorted(results, key=lambda hit: (-hit[1], hit[0]))
+
+    def __len__(self):
+        with self._lock:
+            return self._meta()["num_docs"]
+
+    def close(self):
+        self._conn.close()
+
+
+def _tf_factor(tf, length, avg_length):
+    """BM25's saturated term-frequency factor: a term's score without its idf."""
+    return tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+
+
+def _impact_bound(impact, scale):
+    """Largest factor a posting stored with `impact` can have once the average length grew by `scale`."""
+    saturation = BM25_K1 * impact / (BM25_K1 + 1 - impact)  # tf over the length norm it was written with
+    return (BM25_K1 + 1) * saturation * scale / (saturation * scale + BM25_K1)
+
+
+def rebuild(db, index, page_size=5000):
+    """Index every chunk already stored in Chroma (e.g. a DB built before this index existed)."""
+    offset = 0
+    while True:
+        page = db.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return offset
+        index.add(page["ids"], page["documents"])
+        offset += len(page["ids"])
+        print(f"Indexed {offset} chunks")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the lexical index from the Chroma collection.")
+    parser.add_argument("query", nargs="*", help="Run a BM25 query against the index.")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from chroma_client import open_chroma
+        from get_embedding_function import get_embedding_function
+        from sharded_store import ShardedLexicalIndex, ShardedVectorStore, read_layout, shard_path
+
+        layout = read_layout(CHROMA_PATH)
+        roots = [shard_path(CHROMA_PATH, shard) for shard in range(layout["num_shards"])] if layout else [CHROMA_PATH]
+        for root in roots:
+            path = os.path.join(root, LEXICAL_INDEX_FILE)
+            for stale in [path, f"{path}-wal", f"{path}-shm"]:
+                if os.path.exists(stale):
+                    os.remove(stale)
+        if layout is not None:
+            # One index per shard, as ingestion maintains them.
+            db = ShardedVectorStore(get_embedding_function(), CHROMA_PATH)
+            index = ShardedLexicalIndex(CHROMA_PATH, layout["num_shards"], layout["shard_by"], create=True)
+        else:
+            db = open_chroma(get_embedding_function(), CHROMA_PATH)
+            index = LexicalIndex(os.path.join(CHROMA_PATH, LEXICAL_INDEX_FILE))
+        print(f"✅ Indexed {rebuild(db, index)} chunks")
+    if args.query:
+        from retrieval_cache import open_lexical_index
+
+        index = open_lexical_index(CHROMA_PATH)
+        for chunk_id, score in index.search(" ".join(args.query)) if index is not None else []:
+            print(f"{score:6.2f}  {chunk_id}")
+
+if __name__ == "__main__":
+    main()
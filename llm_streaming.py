@@ -0,0 +1,54 @@
+import logging
+import time
+
+from metrics import metrics
+
+
+class TimedStream:
+    """Iterates model.stream(prompt), timing the first token and the full response.
+
+    Front-ends print or render tokens as they arrive and read .text, .ttft and
+    .total once iteration is finished. Time-to-first-token is what a student
+    actually waits for, so it is logged next to the total. Works with both
+    `for` (model.stream) and `async for` (model.astream).
+    """
+
+    def __init__(self, model, prompt):
+        self.model = model
+        self.prompt = prompt
+        self.ttft = None
+        self.total = None
+        self._parts = []
+        self._start = None
+
+    def _on_token(self, token):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._start
+            metrics.observe("llm_first_token", self.ttft)
+        self._parts.append(token)
+
+    def _finish(self):
+        self.total = time.perf_counter() - self._start
+        if self.ttft is None:
+            self.ttft = self.total
+            metrics.observe("llm_first_token", self.ttft)
+        metrics.observe("llm_total", self.total)
+        logging.info(f"LLM latency: first token {self.ttft:.2f}s, total {self.total:.2f}s")
+
+    def __iter__(self):
+        self._start = time.perf_counter()
+        for token in self.model.stream(self.prompt):
+            self._on_token(token)
+            yield token
+        self._finish()
+
+    async def __aiter__(self):
+        self._start = time.perf_counter()
+        async for token in self.model.astream(self.prompt):
+            self._on_token(token)
+            yield token
+        self._finish()
+
+    @property
+    def text(self):
+        return "".join(self._parts)
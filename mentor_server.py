@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict
+
+from aiohttp import web
+
+from conversation_memory import ConversationMemory, llm_summarizer
+from crisis_screening import CrisisScreener
+from embedding_batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_WINDOW_MS, BatchingEmbeddings
+from get_embedding_function import get_embedding_function
+from interactive_chat import (CHROMA_PATH, CRISIS_RESPONSE, PROMPT_TEMPLATE, build_prompt, check_for_crisis,
+                              setup_logging)
+from llm_streaming import TimedStream
+from metrics import metrics, start_from_env
+from mmap_store import open_vector_store
+from prompt_cache import prefill_tracker
+from retrieval_cache import retrieval_cache
+from warm_start import load_warm_llm
+
+# --- CONFIGURATION ---
+# Ollama generates one answer per CPU-bound model instance; letting more than
+# a couple of requests hit it at once only makes all of them slower.
+MAX_CONCURRENCY = 2
+# Requests allowed to wait for a generation slot (or still retrieving)
+# before we answer 429.
+MAX_QUEUE = 32
+# Retrievals (query embedding + search) allowed to run at once. Wider than
+# MAX_CONCURRENCY so concurrent sessions' embeddings can still be batched.
+MAX_RETRIEVALS = 16
+MAX_SESSIONS = 10_000
+
+
+class MentorService:
+    """Shared state for the HTTP mode: one vector store handle, one LLM, per-session history."""
+
+    def __init__(self, db, model, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, max_sessions=MAX_SESSIONS,
+                 screener=None, max_retrievals=MAX_RETRIEVALS):
+        self.db = db
+        self.model = model
+        self.screener = screener
+        self.max_queue = max_queue
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._retrievals = asyncio.Semaphore(max_retrievals)
+        self._waiting = 0
+
+    def history(self, session_id):
+        history = self.sessions.get(session_id)
+        if history is None:
+            # Same memory as the CLI: recent turns plus a background summary.
+            summarize = llm_summarizer(lambda: self.model, PROMPT_TEMPLATE.prefix, prefill_tracker, session_id)
+            history = self.sessions[session_id] = ConversationMemory(
+                summarize=self._holding_slot(summarize, asyncio.get_running_loop()))
+            while len(self.sessions) > self.max_sessions:
+                evicted, _history = self.sessions.popitem(last=False)
+                prefill_tracker.forget(evicted)
+        self.sessions.move_to_end(session_id)
+        return history
+
+    def _holding_slot(self, summarize, loop):
+        """`summarize`, run under a generation slot like any answer.
+
+        Summaries go to the same model, so they count against max_concurrency.
+        They run on a worker thread, hence the trip through the event loop.
+        """
+        def summarize_in_slot(summary, turns):
+            asyncio.run_coroutine_threadsafe(self._slots.acquire(), loop).result()
+            try:
+                return summarize(summary, turns)
+            finally:
+                loop.call_soon_threadsafe(self._slots.release)
+        return summarize_in_slot
+
+    def is_saturated(self):
+        return self._slots.locked() and self._waiting >= self.max_queue
+
+    async def retrieve(self, func, *args):
+        """Run blocking retrieval work off the event loop, at most max_retrievals at once."""
+        async with self._retrievals:
+            return await asyncio.to_thread(func, *args)
+
+    async def acquire(self, prepare, *args):
+        """Run prepare(*args) via retrieve(), then wait for a generation slot.
+
+        The request counts against the queue from the start, so requests
+        still retrieving are seen by is_saturated().
+        """
+        self._waiting += 1
+        try:
+            prepared = await self.retrieve(prepare, *args)
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        return prepared
+
+    def release(self):
+        self._slots.release()
+
+
+SERVICE = web.AppKey("service", MentorService)
+
+
+def _busy_response():
+    return web.json_response(
+        {"error": "The mentor is busy right now. Please try again in a moment."},
+        status=429,
+        headers={"Retry-After": "2"},
+    )
+
+
+async def chat(request):
+    service = request.app[SERVICE]
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Expected a JSON body.")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Expected a JSON object.")
+    query_text = str(body.get("message", "")).strip()
+    if not query_text:
+        raise web.HTTPBadRequest(text='"message" is required.')
+    session_id = body.get("session_id")
+    if session_id is not None and not isinstance(session_id, str):
+        raise web.HTTPBadRequest(text='"session_id" must be a string.')
+    session_id = session_id or uuid.uuid4().hex
+    history = service.history(session_id)
+    logging.info(f"User Query: {query_text}")
+
+    # --- SAFETY CHECK LAYER ---
+    # Same hard floor as the CLI: never reach retrieval or the LLM.
+    crisis = check_for_crisis(query_text)
+    if crisis:
+        logging.warning(f"Crisis Keyword Detected: {query_text}")
+    elif service.screener is not None:
+        # The embedding is cached, so retrieval below reuses it.
+        query_embedding = await service.retrieve(retrieval_cache.embed_query, service.db.embeddings, query_text)
+        crisis_label = service.screener.screen(query_embedding)
+        if crisis_label:
+            crisis = True
+            logging.warning(f"Crisis Paraphrase Detected ({crisis_label}): {query_text}")
+    if crisis:
+        result = {"session_id": session_id, "sources": [], "is_relevant": False, "crisis": True}
+        if body.get("stream"):
+            # Same shape as a streamed answer, so streaming clients parse it unchanged.
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            await response.write(json.dumps({"token": CRISIS_RESPONSE}).encode() + b"\n")
+            await response.write(json.dumps(dict(result, done=True)).encode() + b"\n")
+            await response.write_eof()
+            return response
+        return web.json_response(dict(result, response=CRISIS_RESPONSE))
+
+    if service.is_saturated():
+        return _busy_response()
+
+    # Retrieval is blocking (embedding + vector search), so it runs off the event loop.
+    prompt, sources, is_relevant = await service.acquire(build_prompt, query_text, history, service.db, session_id)
+    stream = TimedStream(service.model, prompt)
+    try:
+        if body.get("stream"):
+            # Newline-delimited JSON: {"token": ...} lines, then a final summary line.
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            async for token in stream:
+                await response.write(json.dumps({"token": token}).encode() + b"\n")
+        else:
+            async for _token in stream:
+                pass
+    finally:
+        service.release()
+
+    response_text = stream.text
+    logging.info(f"Mentor Response: {response_text}")
+    logging.info(f"Sources: {sources}")
+    history.append(query_text, response_text)
+
+    result = {"session_id": session_id, "sources": sources, "is_relevant": is_relevant, "crisis": False,
+              "ttft": stream.ttft, "total": stream.total}
+    if body.get("stream"):
+        await response.write(json.dumps(dict(result, done=True)).encode() + b"\n")
+        await response.write_eof()
+        return response
+    return web.json_response(dict(result, response=response_text))
+
+
+async def end_session(request):
+    request.app[SERVICE].sessions.pop(request.match_info["session_id"], None)
+    prefill_tracker.forget(request.match_info["session_id"])
+    return web.json_response({"ok": True})
+
+
+async def health(request):
+    return web.json_response({"ok": True})
+
+
+async def metrics_endpoint(request):
+    """Per-stage latency histograms (p50/p95/p99) for this process."""
+    return web.json_response(metrics.snapshot())
+
+
+async def stats(request):
+    service = request.app[SERVICE]
+    body = {"sessions": len(service.sessions), "retrieval_cache": retrieval_cache.stats(),
+            "prefill": prefill_tracker.stats()}
+    if hasattr(service.db.embeddings, "stats"):
+        body["embeddings"] = service.db.embeddings.stats()
+    return web.json_response(body)
+
+
+def create_app(db, model, **service_kwargs):
+    """Build the aiohttp app around an already-loaded vector store and LLM."""
+    app = web.Application()
+    app[SERVICE] = MentorService(db, model, **service_kwargs)
+    app.router.add_post("/chat", chat)
+    app.router.add_delete("/sessions/{session_id}", end_session)
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/stats", stats)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
+
+
+def serve():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="Generations allowed to run against Ollama at once.")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help="Requests allowed to wait for a slot before getting 429.")
+    parser.add_argument("--max-retrievals", type=int, default=MAX_RETRIEVALS,
+                        help="Retrievals (query embedding + search) allowed to run at once.")
+    parser.add_argument("--embed-window-ms", type=float, default=DEFAULT_WINDOW_MS,
+                        help="How long a query embedding waits to be batched with others.")
+    parser.add_argument("--embed-max-batch", type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Most query embeddings computed in one forward pass.")
+    args = parser.parse_args()
+
+    setup_logging()
+    start_from_env()
+    # Loaded once and shared by every request. Concurrent sessions' query
+    # embeddings are coalesced into batched forward passes.
+    embedding_function = BatchingEmbeddings(
+        get_embedding_function(), max_batch_size=args.embed_max_batch, window_ms=args.embed_window_ms
+    )
+    db = open_vector_store(embedding_function, CHROMA_PATH)
+    # Every session's prompt starts with the same guidelines; evaluate them now.
+    model = load_warm_llm("mistral", PROMPT_TEMPLATE.prefix)
+    app = create_app(
+        db,
+        model,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        max_retrievals=args.max_retrievals,
+        screener=CrisisScreener(embedding_function),
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    serve()
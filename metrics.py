@@ -0,0 +1,180 @@
+import argparse
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets grow by 10% from 10 microseconds to ~20 minutes, so a
+# reported percentile is within 10% of the true value whatever the stage.
+BUCKET_GROWTH = 1.1
+SMALLEST_BUCKET = 1e-5
+NUM_BUCKETS = 200
+BUCKET_BOUNDS = [SMALLEST_BUCKET * BUCKET_GROWTH ** i for i in range(NUM_BUCKETS)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRICS_DUMP_PATH = "metrics.json"
+DEFAULT_DUMP_INTERVAL = 60
+
+
+class LatencyHistogram:
+    """Fixed log-spaced buckets: constant memory and O(log buckets) per observation."""
+
+    def __init__(self):
+        self.counts = [0] * (NUM_BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                upper = BUCKET_BOUNDS[i] if i < NUM_BUCKETS else self.max
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self):
+        summary = {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "max_ms": 1000 * self.max,
+        }
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}_ms"] = 1000 * self.quantile(q)
+        return summary
+
+
+class Metrics:
+    """Per-stage latency histograms, cheap enough to leave on (~1 µs per observation)."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())}
+        return {"since": self.started, "uptime_s": time.time() - self.started, "stages": stages}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started = time.time()
+
+
+def format_snapshot(snapshot):
+    lines = [f"{'stage':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for stage, s in snapshot["stages"].items():
+        lines.append(f"{stage:<22}{s['count']:>8}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+                     f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    return "\n".join(lines)
+
+
+def dump(path=METRICS_DUMP_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metrics.snapshot(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def start_periodic_dump(path=METRICS_DUMP_PATH, interval=DEFAULT_DUMP_INTERVAL):
+    """Rewrite `path` with the current snapshot every `interval` seconds."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                dump(path)
+            except OSError as e:
+                logging.warning(f"Metrics dump failed: {e}")
+
+    thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = json.dumps(metrics.snapshot()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Expose GET /metrics from a background thread of a CLI or Streamlit process."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_from_env():
+    """Honour METRICS_PORT and METRICS_DUMP_PATH / METRICS_DUMP_INTERVAL. Safe to call more than once."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        serve_metrics(int(port))
+    path = os.environ.get("METRICS_DUMP_PATH")
+    if path:
+        start_periodic_dump(path, float(os.environ.get("METRICS_DUMP_INTERVAL", DEFAULT_DUMP_INTERVAL)))
+
+
+_started = False
+_start_lock = threading.Lock()
+
+# One registry per process; every front-end and ingestion stage records into it.
+metrics = Metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default=METRICS_DUMP_PATH, help="Metrics dump written by a running process.")
+    args = parser.parse_args()
+    with open(args.path, "r", encoding="utf-8") as f:
+        print(format_snapshot(json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from hybrid_search import distances
+from retrieval_cache import read_collection_version
+
+CHROMA_PATH = "chroma"
+# Exported next to the Chroma files, so clear_database() removes it too.
+MMAP_DIR = "mmap_store"
+# "chroma" (default) or "mmap" to serve queries from the exported matrix.
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+DEFAULT_DTYPE = "int8"
+# Rows scored per NumPy block; bounds the float32 scratch space per query.
+BLOCK_ROWS = 16384
+# Approximate candidates re-ranked with exact float32 vectors per result.
+RESCORE_FACTOR = 8
+
+
+def _quantize(vectors, dtype):
+    """Returns (stored rows, per-row scales). int8 is symmetric per-row quantization."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def export(db, chroma_path=CHROMA_PATH, dtype=DEFAULT_DTYPE, full=True, page_size=5000):
+    """Write the Chroma collection out as memory-mappable arrays plus a sqlite sidecar.
+
+    Layout of <chroma_path>/mmap_store:
+        vectors.npy   quantized (int8 or float16) embedding matrix, one row per chunk
+        scales.npy    float32 per-row scale (all ones for float16)
+        norms.npy     float32 L2 norm of each original vector
+        full.npy      optional float32 copy used for exact rescoring
+        chunks.sqlite row -> chunk ID, text and metadata
+        meta.json     dtype, dimensions, distance space and source collection version
+    The directory is built under a temporary name and swapped in, so running
+    replicas keep reading their already-mapped files until they reopen.
+    """
+    from chroma_client import collection
+    from hybrid_search import collection_space
+
+    version = read_collection_version(chroma_path)
+    count = collection(db).count()
+    target = os.path.join(chroma_path, MMAP_DIR)
+    tmp = f"{target}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    sidecar = sqlite3.connect(os.path.join(tmp, "chunks.sqlite"))
+    sidecar.execute(
+        "CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT)"
+    )
+    vectors = scales = norms = full_vectors = None
+    offset = 0
+    while offset < count:
+        page = db.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        batch = np.asarray(page["embeddings"], dtype=np.float32)
+        if vectors is None:
+            dim = batch.shape[1]
+            open_npy = np.lib.format.open_memmap
+            vectors = open_npy(os.path.join(tmp, "vectors.npy"), mode="w+", dtype=dtype, shape=(count, dim))
+            scales = open_npy(os.path.join(tmp, "scales.npy"), mode="w+", dtype=np.float32, shape=(count,))
+            norms = open_npy(os.path.join(tmp, "norms.npy"), mode="w+", dtype=np.float32, shape=(count,))
+            if full:
+                full_vectors = open_npy(os.path.join(tmp, "full.npy"), mode="w+", dtype=np.float32, shape=(count, dim))
+        end = offset + len(batch)
+        vectors[offset:end], scales[offset:end] = _quantize(batch, dtype)
+        norms[offset:end] = np.linalg.norm(batch, axis=1)
+        if full_vectors is not None:
+            full_vectors[offset:end] = batch
+        sidecar.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+            [
+                (offset + i, chunk_id, text, json.dumps(metadata or {}))
+                for i, (chunk_id, text, metadata) in enumerate(zip(page["ids"], page["documents"], page["metadatas"]))
+            ],
+        )
+        offset = end
+    sidecar.commit()
+    sidecar.close()
+    for array in (vectors, scales, norms, full_vectors):
+        if array is not None:
+            array.flush()
+
+    meta = {
+        "count": offset,
+        "dim": vectors.shape[1] if vectors is not None else 0,
+        "dtype": dtype,
+        "space": collection_space(db),
+        "full": full_vectors is not None,
+        "collection_version": version,
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    old = f"{target}.old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, old)
+    os.replace(tmp, target)
+    shutil.rmtree(old, ignore_errors=True)
+    return offset
+
+
+class _MappedExport:
+    """One opened export directory. Immutable once built, so searches can use it without a lock."""
+
+    def __init__(self, path, rescore):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.space = self.meta["space"]
+        self.count = self.meta["count"]
+        self.vectors = self.scales = self.norms = self.full = None
+        if self.count:
+            self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+            self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        if rescore and self.meta["full"] and self.count:
+            self.full = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+        self._sidecar = sqlite3.connect(
+            f"file:{os.path.join(path, 'chunks.sqlite')}?mode=ro", uri=True, check_same_thread=False
+        )
+        # Only sidecar lookups (a few rows) are serialized, never the scan.
+        self._sidecar_lock = threading.Lock()
+
+    def rows(self, sql, params):
+        with self._sidecar_lock:
+            return self._sidecar.execute(sql, params).fetchall()
+
+
+class MmapVectorStore:
+    """Read-only vector store over an export() directory.
+
+    Implements the parts of the Chroma interface the query side uses
+    (similarity search with scores, get by ID, .embeddings). The matrices
+    are np.load(mmap_mode="r"), so opening is a few small reads and every
+    replica on the host shares one copy of the vectors in the page cache.
+    Distances follow the collection's space, like Chroma's scores. When
+    ingestion swaps in a newer export, the next search remaps it; searches
+    already running finish on the export they started with.
+    """
+
+    def __init__(self, embedding_function, persist_directory=CHROMA_PATH, rescore=True):
+        self.embeddings = embedding_function
+        self.persist_directory = persist_directory
+        self.path = os.path.join(persist_directory, MMAP_DIR)
+        self.rescore = rescore
+        # Only guards swapping in a new export; searches run outside it.
+        self._lock = threading.Lock()
+        self._export = _MappedExport(self.path, rescore)
+
+    @property
+    def meta(self):
+        return self._export.meta
+
+    @property
+    def space(self):
+        return self._export.space
+
+    @property
+    def count(self):
+        return self._export.count
+
+    def _current(self):
+        """The export to search: remapped first if ingestion has swapped in a newer one."""
+        version = read_collection_version(self.persist_directory)
+        with self._lock:
+            current = self._export
+            if version == current.meta["collection_version"]:
+                return current
+            try:
+                with open(os.path.join(self.path, "meta.json"), "r", encoding="utf-8") as f:
+                    exported = json.load(f)["collection_version"]
+            except FileNotFoundError:
+                return current
+            if exported == version:
+                self._export = current = _MappedExport(self.path, self.rescore)
+            return current
+
+    @staticmethod
+    def _approximate(export, query, n):
+        """(rows, distances) of the n best rows by quantized score, unsorted."""
+        query_norm = float(np.linalg.norm(query))
+        best_rows = np.empty(0, dtype=np.int64)
+        best = np.empty(0, dtype=np.float32)
+        for start in range(0, export.count, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, export.count)
+            dots = (export.vectors[start:end].astype(np.float32) @ query) * export.scales[start:end]
+            if export.space == "cosine":
+                block = 1.0 - dots / np.maximum(export.norms[start:end] * query_norm, 1e-12)
+            elif export.space == "ip":
+                block = 1.0 - dots
+            else:
+                block = export.norms[start:end] ** 2 - 2 * dots + query_norm ** 2
+            rows = np.arange(start, end)
+            if len(block) > n:
+                keep = np.argpartition(block, n - 1)[:n]
+                rows, block = rows[keep], block[keep]
+            best_rows = np.concatenate([best_rows, rows])
+            best = np.concatenate([best, block])
+            if len(best) > n:
+                keep = np.argpartition(best, n - 1)[:n]
+                best_rows, best = best_rows[keep], best[keep]
+        return best_rows, best
+
+    @staticmethod
+    def _documents(export, rows):
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: (chunk_id, document, json.loads(metadata))
+            for row, chunk_id, document, metadata in export.rows(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({placeholders})",
+                [int(row) for row in rows],
+            )
+        }
+        return [found[int(row)] for row in rows]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        export = self._current()
+        if not export.count:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        n = min(export.count, k * RESCORE_FACTOR if export.full is not None else k)
+        rows, scores = self._approximate(export, query, n)
+        if export.full is not None:
+            rows = np.sort(rows)  # sequential reads from the mapped file
+            scores = distances(export.space, query, export.full[rows])
+        top = np.argsort(scores, kind="stable")[:k]
+        rows, scores = rows[top], scores[top]
+        return [
+            (Document(page_content=document, metadata=metadata, id=chunk_id), float(score))
+            for (chunk_id, document, metadata), score in zip(self._documents(export, rows), scores)
+        ]
+
+    def similarity_search_with_score(self, query, k=4):
+        return self.similarity_search_by_vector_with_relevance_scores(self.embeddings.embed_query(query), k=k)
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        """Subset of Chroma's get(): look chunks up by ID."""
+        export = self._current()
+        ids = list(ids or [])
+        placeholders = ",".join("?" * len(ids))
+        rows = export.rows(
+            f"SELECT row, id, document, metadata FROM chunks WHERE id IN ({placeholders})", ids
+        ) if ids else []
+        result = {"ids": [chunk_id for _row, chunk_id, _document, _metadata in rows]}
+        if "documents" in include:
+            result["documents"] = [document for _row, _chunk_id, document, _metadata in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(metadata) for _row, _chunk_id, _document, metadata in rows]
+        if "embeddings" in include:
+            indices = [row for row, _chunk_id, _document, _metadata in rows]
+            if export.full is not None:
+                result["embeddings"] = np.asarray(export.full[indices])
+            else:
+                result["embeddings"] = export.vectors[indices].astype(np.float32) * export.scales[indices][:, None]
+        return result
+
+
+def refresh_export(db, chroma_path=CHROMA_PATH):
+    """Re-export after ingestion, keeping the existing export's settings. No-op if there is none.
+
+    This rewrites the whole collection, O(N) in the number of chunks, even
+    when one file changed: rows must stay contiguous (deleted chunks leave
+    no holes) and the new directory is swapped in whole so replicas never
+    see a half-written export. Fine for a library of books; for very large
+    collections that change often, export on a schedule instead.
+    """
+    try:
+        with open(os.path.join(chroma_path, MMAP_DIR, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    return export(db, chroma_path, dtype=meta["dtype"], full=meta["full"])
+
+
+def open_vector_store(embedding_function, persist_directory=CHROMA_PATH):
+    """The query-side store: Chroma, the memory-mapped export with VECTOR_STORE=mmap,
+    or every shard searched in parallel when ingestion built a sharded collection."""
+    if VECTOR_STORE == "mmap":
+        if os.path.exists(os.path.join(persist_directory, MMAP_DIR, "meta.json")):
+            return MmapVectorStore(embedding_function, persist_directory)
+        print("⚠️  VECTOR_STORE=mmap but no export found; run `python mmap_store.py`. Falling back to Chroma.")
+    from sharded_store import SHARD_URLS, ShardedVectorStore, read_layout
+    if SHARD_URLS or read_layout(persist_directory) is not None:
+        return ShardedVectorStore(embedding_function, persist_directory)
+    from chroma_client import open_chroma
+    from index_config import collection_configuration
+    return open_chroma(embedding_function, persist_directory, collection_configuration())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dtype", choices=["int8", "float16"], default=DEFAULT_DTYPE,
+                        help="Storage type of the searched matrix.")
+    parser.add_argument("--no-full", action="store_true",
+                        help="Skip the float32 copy used for exact rescoring (smaller, slightly less accurate).")
+    args = parser.parse_args()
+
+    from chroma_client import open_chroma
+    from get_embedding_function import get_embedding_function
+
+    db = open_chroma(get_embedding_function(), CHROMA_PATH)
+    count = export(db, CHROMA_PATH, dtype=args.dtype, full=not args.no_full)
+    print(f"✅ Exported {count} chunks to {os.path.join(CHROMA_PATH, MMAP_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
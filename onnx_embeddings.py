@@ -0,0 +1,181 @@
+import argparse
+import os
+import platform
+import shutil
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from get_embedding_function import EMBEDDING_MODEL
+
+# Where `python onnx_embeddings.py --download` puts the exported model and tokenizer.
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx"))
+MODEL_FILES = {False: "model.onnx", True: "model_int8.onnx"}
+# 0 lets ONNX Runtime use one thread per physical core. A single encoder
+# graph has little to run in parallel between operators, so one inter-op
+# thread is usually fastest.
+INTRA_OP_THREADS = int(os.environ.get("EMBEDDING_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("EMBEDDING_INTER_OP_THREADS", "1"))
+BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+# all-MiniLM-L6-v2 was trained on 128-token inputs and sentence-transformers
+# truncates at 256; our 350-character chunks are well under either.
+MAX_SEQ_LENGTH = int(os.environ.get("EMBEDDING_MAX_SEQ_LENGTH", "256"))
+
+
+class OnnxEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 on ONNX Runtime (CPU), optionally int8-quantized.
+
+    Produces the same vectors as sentence-transformers: mean pooling over the
+    attention mask, then L2 normalization. Texts are sorted by token length
+    before batching, so each batch is padded only to its own longest text
+    rather than to the longest in the whole input.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=False, batch_size=BATCH_SIZE,
+                 max_seq_length=MAX_SEQ_LENGTH, intra_op_threads=INTRA_OP_THREADS,
+                 inter_op_threads=INTER_OP_THREADS, sort_by_length=True, session=None, tokenizer=None):
+        if session is None:
+            path = os.path.join(model_dir, MODEL_FILES[quantized])
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} not found; run `python onnx_embeddings.py --download`.")
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = inter_op_threads
+            options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1
+                                      else ort.ExecutionMode.ORT_SEQUENTIAL)
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        if tokenizer is None:
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        # Padding is done per batch below.
+        tokenizer.no_padding()
+        tokenizer.enable_truncation(max_seq_length)
+        self.session = session
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.sort_by_length = sort_by_length
+        self._input_names = {model_input.name for model_input in session.get_inputs()}
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def _run(self, encodings):
+        width = max(len(encoding.ids) for encoding in encodings)
+        shape = (len(encodings), width)
+        input_ids = np.zeros(shape, dtype=np.int64)
+        attention_mask = np.zeros(shape, dtype=np.int64)
+        token_type_ids = np.zeros(shape, dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            length = len(encoding.ids)
+            input_ids[row, :length] = encoding.ids
+            attention_mask[row, :length] = encoding.attention_mask
+            token_type_ids[row, :length] = encoding.type_ids
+        self.tokens += int(attention_mask.sum())
+        self.padded_tokens += input_ids.size
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        hidden = self.session.run(None, {name: feed[name] for name in self._input_names})[0]
+        mask = attention_mask[:, :, None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = list(range(len(texts)))
+        if self.sort_by_length:
+            order.sort(key=lambda i: len(encodings[i].ids))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._run([encodings[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def padding_ratio(self):
+        """Share of the tokens fed to the model that were padding."""
+        return 1 - self.tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+
+def quantized_file():
+    # Pre-quantized (dynamic int8) exports published with the model.
+    return "onnx/model_qint8_arm64.onnx" if platform.machine() in ("arm64", "aarch64") else "onnx/model_quint8_avx2.onnx"
+
+
+def download(model_dir=ONNX_MODEL_DIR):
+    """Fetch the ONNX exports and tokenizer of all-MiniLM-L6-v2 from the Hugging Face Hub."""
+    from huggingface_hub import hf_hub_download
+    os.makedirs(model_dir, exist_ok=True)
+    for remote, local in [("onnx/model.onnx", MODEL_FILES[False]), (quantized_file(), MODEL_FILES[True]),
+                          ("tokenizer.json", "tokenizer.json")]:
+        shutil.copyfile(hf_hub_download(EMBEDDING_MODEL, remote), os.path.join(model_dir, local))
+    return model_dir
+
+
+def parity(reference, vectors):
+    """Cosine similarity between matching rows of two embedding sets (min, mean)."""
+    a, b = np.asarray(reference, dtype=np.float32), np.asarray(vectors, dtype=np.float32)
+    cosines = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return float(cosines.min()), float(cosines.mean())
+
+
+def throughput(embeddings, texts):
+    embeddings.embed_documents(texts[:8])  # Warm-up: first run allocates and optimizes.
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def sample_texts(count):
+    """Stored chunks if there is a collection, so lengths match real ingestion."""
+    from chroma_client import open_chroma
+    texts = open_chroma(None).get(limit=count, include=["documents"])["documents"]
+    if not texts:
+        raise ValueError("No chunks stored yet; ingest something first.")
+    return texts
+
+
+def compare(texts, model_dir=ONNX_MODEL_DIR):
+    """Throughput of each backend and its parity with the PyTorch vectors."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    report = {}
+    reference, rate = throughput(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, encode_kwargs={
+        "batch_size": BATCH_SIZE, "normalize_embeddings": True}), texts)
+    report["huggingface"] = {"texts_per_second": rate}
+    for name, quantized, sort_by_length in [("onnx", False, True), ("onnx-unsorted", False, False),
+                                            ("onnx-int8", True, True)]:
+        embeddings = OnnxEmbeddings(model_dir, quantized=quantized, sort_by_length=sort_by_length)
+        vectors, rate = throughput(embeddings, texts)
+        min_cosine, mean_cosine = parity(reference, vectors)
+        report[name] = {"texts_per_second": rate, "min_cosine": min_cosine, "mean_cosine": mean_cosine,
+                        "padding_ratio": embeddings.padding_ratio()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Runtime backend for all-MiniLM-L6-v2.")
+    parser.add_argument("--download", action="store_true", help=f"Fetch the ONNX model into {ONNX_MODEL_DIR}.")
+    parser.add_argument("--compare", action="store_true",
+                        help="Check parity with the PyTorch vectors and compare throughput on stored chunks.")
+    parser.add_argument("--texts", type=int, default=1000, help="Chunks to embed for --compare.")
+    args = parser.parse_args()
+
+    if args.download:
+        print(f"✅ Model saved to {download()}")
+    if args.compare:
+        report = compare(sample_texts(args.texts))
+        for name, stats in report.items():
+            line = f"{name:14s} {stats['texts_per_second']:8.1f} texts/s"
+            if "min_cosine" in stats:
+                line += (f"  cosine vs PyTorch min {stats['min_cosine']:.4f} mean {stats['mean_cosine']:.4f}"
+                         f"  padding {stats['padding_ratio']:.0%}")
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
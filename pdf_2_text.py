@@ -1,15 +1,86 @@
+import argparse
+import hashlib
+import json
 import os
-from pdf2image import convert_from_path
+import time
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 from reportlab.pdfgen import canvas
 
-def pdf_to_text_pdf(input_path, output_path):
-    # Convert PDF pages to images
-    pages = convert_from_path(input_path)
-    extracted_text = []
-    for page in pages:
-        text = pytesseract.image_to_string(page)
-        extracted_text.append(text)
+# Pages are rasterized a few at a time instead of the whole book at once,
+# so memory stays flat no matter how long the scan is.
+PAGES_PER_RANGE = 8
+# OCR text is cached in a .ocr.json sidecar next to each PDF, or in this
+# folder instead when the data folder is read-only.
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", "")
+
+
+def ocr_page_range(input_path, first_page, last_page):
+    """Rasterize and OCR pages first_page..last_page (1-based). Runs in a worker process."""
+    images = convert_from_path(input_path, first_page=first_page, last_page=last_page)
+    return [pytesseract.image_to_string(image) for image in images]
+
+
+def iter_ocr_pages(input_path, workers=None, pages_per_range=PAGES_PER_RANGE):
+    """Yield the OCR text of each page in order, as soon as its range is done."""
+    num_pages = pdfinfo_from_path(input_path)["Pages"]
+    firsts = list(range(1, num_pages + 1, pages_per_range))
+    lasts = [min(first + pages_per_range - 1, num_pages) for first in firsts]
+    paths = [input_path] * len(firsts)
+    if workers == 1:
+        for page_texts in map(ocr_page_range, paths, firsts, lasts):
+            yield from page_texts
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for page_texts in executor.map(ocr_page_range, paths, firsts, lasts):
+            yield from page_texts
+
+
+def ocr_cache_path(input_path, cache_dir=None):
+    cache_dir = OCR_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return f"{input_path}.ocr.json"
+    # Same-named PDFs in different folders must not share a cache file.
+    digest = hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.path.basename(input_path)}.{digest}.ocr.json")
+
+
+def is_up_to_date(output_path, input_path):
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+
+
+def iter_ocr_text(input_path, workers=None, cache_dir=None):
+    """Per-page OCR text, reusing the cached .ocr.json if it is newer than the PDF."""
+    cache_path = ocr_cache_path(input_path, cache_dir)
+    if is_up_to_date(cache_path, input_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    page_texts = []
+    for text in iter_ocr_pages(input_path, workers=workers):
+        page_texts.append(text)
+        yield text
+    # Only a complete run is cached, so an interrupted OCR is simply redone.
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(page_texts, f)
+
+
+def ocr_documents(input_path, workers=None, cache_dir=None):
+    """Yield one Document per scanned page, ready for split_documents.
+
+    Metadata matches PyPDFLoader (0-based "page"), so chunk IDs look like
+    any other PDF's and no intermediate text PDF is needed.
+    """
+    for page, text in enumerate(iter_ocr_text(input_path, workers=workers, cache_dir=cache_dir)):
+        yield Document(page_content=text, metadata={"source": input_path, "page": page})
+
+
+def pdf_to_text_pdf(input_path, output_path, workers=None, cache_dir=None):
+    # OCR the scanned pages
+    extracted_text = iter_ocr_text(input_path, workers=workers, cache_dir=cache_dir)
 
     # Write OCR text into a new PDF
     c = canvas.Canvas(output_path)
@@ -23,14 +94,36 @@ def pdf_to_text_pdf(input_path, output_path):
                 y = 800
     c.save()
 
-# Process all PDFs in a folder
-input_dir = "image_pdf/"
-output_dir = "data/"
-os.makedirs(output_dir, exist_ok=True)
-
-for filename in os.listdir(input_dir):
-    if filename.endswith(".pdf"):
-        in_path = os.path.join(input_dir, filename)
-        out_path = os.path.join(output_dir, f"ocr_{filename}")
-        pdf_to_text_pdf(in_path, out_path)
-        print(f"Processed {filename} → {out_path}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", default="image_pdf/", help="Folder of scanned PDFs.")
+    parser.add_argument("--output-dir", default="data/", help="Where the ocr_*.pdf files are written.")
+    parser.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: all cores).")
+    parser.add_argument("--force", action="store_true", help="Re-run OCR even if the output is up to date.")
+    parser.add_argument(
+        "--cache-dir",
+        default=OCR_CACHE_DIR,
+        help="Folder for the OCR text cache (default: a .ocr.json next to each PDF).",
+    )
+    args = parser.parse_args()
+
+    # Process all PDFs in a folder
+    os.makedirs(args.output_dir, exist_ok=True)
+    for filename in sorted(os.listdir(args.input_dir)):
+        if filename.endswith(".pdf"):
+            in_path = os.path.join(args.input_dir, filename)
+            out_path = os.path.join(args.output_dir, f"ocr_{filename}")
+            if not args.force and is_up_to_date(out_path, in_path):
+                print(f"Skipped {filename} (up to date)")
+                continue
+            cache_path = ocr_cache_path(in_path, args.cache_dir)
+            if args.force and os.path.exists(cache_path):
+                os.remove(cache_path)
+            start = time.perf_counter()
+            pdf_to_text_pdf(in_path, out_path, workers=args.workers, cache_dir=args.cache_dir)
+            print(f"Processed {filename} → {out_path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
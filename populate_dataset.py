@@ -2,12 +2,12 @@ import argparse
 import os
 import shutil
 
+from chromadb.api.client import SharedSystemClient
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFDirectoryLoader, CSVLoader, JSONLoader
 from langchain_core.documents import Document
 
-from get_embedding_function import get_embedding_function
-from langchain_chroma import Chroma
+from chroma_client import reset_server_collection
 
 
 CHROMA_PATH = "chroma"
@@ -24,10 +24,10 @@ def main():
         print("✨ Clearing Database")
         clear_database()
 
-    # Create (or update) the data store.
-    documents = load_documents()
-    chunks = split_documents(documents)
-    add_to_chroma(chunks)
+    # Create (or update) the data store. dataset.ingest consults the ingestion
+    # manifest, so only new, edited or deleted files cost any work.
+    from dataset import ingest
+    ingest([DATA_PATH])
 
 
 def load_documents():
@@ -46,32 +46,10 @@ def split_documents(documents: list[Document]):
 
 
 def add_to_chroma(chunks: list[Document]):
-    # Load the existing database.
-    db = Chroma(
-        persist_directory=CHROMA_PATH, embedding_function=get_embedding_function()
-    )
-
-    # Calculate Page IDs.
-    chunks_with_ids = calculate_chunk_ids(chunks)
-
-    # Add or Update the documents.
-    existing_items = db.get(include=[])  # IDs are always included by default
-    existing_ids = set(existing_items["ids"])
-    print(f"Number of existing documents in DB: {len(existing_ids)}")
-
-    # Only add documents that don't exist in the DB.
-    new_chunks = []
-    for chunk in chunks_with_ids:
-        if chunk.metadata["id"] not in existing_ids:
-            new_chunks.append(chunk)
-
-    if len(new_chunks):
-        print(f"👉 Adding new documents: {len(new_chunks)}")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        db.add_documents(new_chunks, ids=new_chunk_ids)
-        db.persist()
-    else:
-        print("✅ No new documents to add")
+    # Same pipeline as dataset.py: embeds, writes, updates the BM25 index and
+    # invalidates cached retrieval results.
+    from dataset import add_to_chroma as write_chunks
+    write_chunks(chunks)
 
 
 def calculate_chunk_ids(chunks):
@@ -104,8 +82,14 @@ def calculate_chunk_ids(chunks):
 
 
 def clear_database():
+    # With CHROMA_SERVER_URL the vectors live on the server; CHROMA_PATH only
+    # holds the manifest, lexical index and other local state.
+    reset_server_collection()
     if os.path.exists(CHROMA_PATH):
         shutil.rmtree(CHROMA_PATH)
+    # chromadb caches embedded clients per path; a cached one would still
+    # see the deleted collection.
+    SharedSystemClient.clear_system_cache()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict
+
+from conversation_memory import count_tokens, is_summary_prompt
+
+# How long Ollama keeps Mistral (and the KV cache of its last prompt) in
+# memory after a request. Its own default is 5 minutes, after which the
+# next student pays for reloading the weights and re-reading the guidelines.
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Sessions whose last prompt PrefillTracker remembers (least recently used go first).
+MAX_SESSIONS = 10_000
+
+
+class CachedPrompt:
+    """A prompt whose static instructions always come first, byte for byte.
+
+    Ollama keeps the evaluated tokens of the last prompt per loaded model and
+    only prefills what differs, so the guidelines are processed once rather
+    than every turn as long as nothing that changes (context, history,
+    question) appears before them. Built once at import; format() is a
+    plain str.format of the variable sections.
+    """
+
+    def __init__(self, instructions, sections):
+        self.prefix = instructions.strip() + "\n\n"
+        self.sections = sections.lstrip("\n")
+        # Fail at import, not on the first question, if a placeholder is wrong.
+        self.sections.format(context="", history="", question="")
+
+    def format(self, **values):
+        return self.prefix + self.sections.format(**values)
+
+
+def ollama_llm(model_name="mistral", **kwargs):
+    """OllamaLLM that stays loaded between turns (see KEEP_ALIVE).
+
+    Its responses feed the measured prefill numbers of `prefill_tracker`.
+    """
+    from langchain_ollama import OllamaLLM
+    kwargs.setdefault("callbacks", [prefill_callback(prefill_tracker)])
+    return OllamaLLM(model=model_name, keep_alive=KEEP_ALIVE, **kwargs)
+
+
+class PrefillTracker:
+    """Prefill work per turn: measured by Ollama, and estimated from prompt reuse.
+
+    Ollama reports how many prompt tokens it actually evaluated, and how long
+    that took, with every response (see PrefillCallback); those are the
+    `prefill_*` stats. The `reused_*` stats are an estimate for models that
+    don't report it: like Ollama's cache, the tracker remembers the previous
+    prompt, and the common prefix with the next one is what the model doesn't
+    have to evaluate again (tokens counted as chars / 4). Prompts are
+    remembered per session, so concurrent sessions don't overwrite each
+    other's. Background summaries go to the same model, so they replace the
+    remembered prompt as well, but only chat turns are counted.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.summaries = 0
+        self.measured = 0
+        self.prefill_tokens = 0
+        self.prefill_seconds = 0.0
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, prompt, summary=False, session=None):
+        """Note a prompt about to be sent; returns the tokens it can reuse (estimated)."""
+        with self._lock:
+            shared = len(os.path.commonprefix([self._last.get(session, ""), prompt]))
+            self._last[session] = prompt
+            self._last.move_to_end(session)
+            while len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+            reused = count_tokens(prompt[:shared])
+            if summary:
+                self.summaries += 1
+                return reused
+            self.prompts += 1
+            self.prompt_tokens += count_tokens(prompt)
+            self.reused_tokens += reused
+            return reused
+
+    def forget(self, session):
+        with self._lock:
+            self._last.pop(session, None)
+
+    def observe(self, generation_info):
+        """Add the prefill Ollama reported for one chat turn (its final response)."""
+        with self._lock:
+            self.measured += 1
+            # Ollama leaves prompt_eval_count out when the whole prompt was cached.
+            self.prefill_tokens += generation_info.get("prompt_eval_count") or 0
+            self.prefill_seconds += (generation_info.get("prompt_eval_duration") or 0) / 1e9
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "summaries": self.summaries,
+                "prompt_tokens": self.prompt_tokens,
+                "reused_tokens": self.reused_tokens,
+                "reused_ratio": self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "saved_per_turn": self.reused_tokens / self.prompts if self.prompts else 0.0,
+                "measured": self.measured,
+                "prefill_tokens_per_turn": self.prefill_tokens / self.measured if self.measured else 0.0,
+                "prefill_seconds_per_turn": self.prefill_seconds / self.measured if self.measured else 0.0,
+            }
+
+
+def prefill_callback(tracker):
+    """LangChain callback handing Ollama's prompt_eval_count / prompt_eval_duration of each chat turn to `tracker`.
+
+    Summaries and runs tagged "warmup" are not turns and are skipped.
+    """
+    # Imported here: one-shot clients import this module without LangChain.
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class PrefillCallback(BaseCallbackHandler):
+        def __init__(self, tracker):
+            self.tracker = tracker
+            self._turns = set()
+            self._lock = threading.Lock()
+
+        def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+            if "warmup" not in (tags or []) and not is_summary_prompt(prompts[0]):
+                with self._lock:
+                    self._turns.add(run_id)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            with self._lock:
+                if run_id not in self._turns:
+                    return
+                self._turns.discard(run_id)
+            generation_info = response.generations[0][0].generation_info or {}
+            if "prompt_eval_duration" in generation_info or "total_duration" in generation_info:
+                self.tracker.observe(generation_info)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            with self._lock:
+                self._turns.discard(run_id)
+
+    return PrefillCallback(tracker)
+
+
+# One tracker per process, fed by whichever front-end builds prompts.
+prefill_tracker = PrefillTracker()
@@ -1,16 +1,28 @@
 import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
 import sys
-from langchain_chroma import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaLLM
-from get_embedding_function import get_embedding_function
+from llm_streaming import TimedStream
+from metrics import format_snapshot, metrics, start_from_env
+from prompt_cache import CachedPrompt, prefill_tracker
+from warm_start import Startup
 
 # Configuration
 CHROMA_PATH = "chroma"
+LOG_FILE = "chatbot_interaction.log"
+# `python query_data.py --daemon` keeps a warm process listening here, and
+# one-shot invocations hand their question to it instead of loading models.
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = int(os.environ.get("QUERY_DAEMON_PORT", "8766"))
 
 # CRITIQUE FIX: Updated prompt to explicitly ban toxic positivity.
 # Kept this version over the generic one to ensure safety tests pass.
-PROMPT_TEMPLATE = """
+# The guidelines are a fixed prefix, so the daemon's Mistral reuses them.
+PROMPT_TEMPLATE = CachedPrompt(
+    instructions="""
 You are a warm, empathetic college mentor and psychology enthusiast.
 
 GUIDELINES:
@@ -18,7 +30,8 @@ GUIDELINES:
 2. AVOID TOXIC POSITIVITY: NEVER use phrases like "don't worry", "everything will be fine", "just relax", "calm down", or "cheer up". These feel dismissive.
 3. CONTEXT: Use the following context to provide evidence-based advice.
 4. TONE: Be supportive but realistic.
-
+""",
+    sections="""
 CONTEXT FROM BOOKS:
 {context}
 
@@ -26,56 +39,141 @@ CONTEXT FROM BOOKS:
 
 Student: {question}
 Mentor:
-"""
+""",
+)
 
 def main():
-    print("--- Psychology Chatbot (Type 'quit', 'exit', or 'q' to stop) ---")
-    
-    # Initialize components once to save time
-    embedding_function = get_embedding_function()
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-    model = OllamaLLM(model="mistral")
-    
-    # Check if CLI arguments are provided (One-Shot Mode for Automation/Tests)
-    if len(sys.argv) > 1:
-        query_text = " ".join(sys.argv[1:])
-        response = query_rag(query_text, db, model)
-        print(response)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", nargs="*", help="Ask a single question and exit (one-shot mode).")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Stay resident with everything loaded and answer one-shot invocations.")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Answer in this process even if a daemon is running.")
+    args = parser.parse_args()
+    logging.basicConfig(
+        filename=LOG_FILE,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    # Optional /metrics endpoint or periodic dump (METRICS_PORT / METRICS_DUMP_PATH).
+    start_from_env()
+    if args.daemon:
+        serve_daemon()
+        return
+
+    # One-Shot Mode for Automation/Tests
+    if args.query:
+        query_text = " ".join(args.query)
+        if not args.no_daemon and ask_daemon(query_text):
+            return
+        startup = Startup(CHROMA_PATH, warmup_prompt=PROMPT_TEMPLATE.prefix)
+        print_stream(stream_rag(query_text, startup.db(), startup.model()))
+        print(f"⏱️  {startup.summary()}", file=sys.stderr)
         return
 
-    # Interactive Loop Mode
+    # Interactive Loop Mode. Components load in the background while the
+    # student types the first question.
+    startup = Startup(CHROMA_PATH, warmup_prompt=PROMPT_TEMPLATE.prefix)
+    print("--- Psychology Chatbot (Type 'quit', 'exit', or 'q' to stop) ---")
     while True:
         try:
             query_text = input("\nStudent: ")
             if query_text.lower() in ['quit', 'exit', 'q']:
                 print("Mentor: Take care of yourself! Bye.")
+                logging.info(startup.summary())
+                logging.info(f"Stage latencies:\n{format_snapshot(metrics.snapshot())}")
                 break
             
             if not query_text.strip():
                 continue
 
-            response = query_rag(query_text, db, model)
-            print(f"\nMentor: {response}")
+            print("\nMentor: ", end="", flush=True)
+            print_stream(stream_rag(query_text, startup.db(), startup.model()))
             
         except KeyboardInterrupt:
             print("\nMentor: Take care! Bye.")
             break
 
-def query_rag(query_text: str, db, model):
-    # Search the DB.
-    results = db.similarity_search_with_score(query_text, k=5)
+def ask_daemon(query_text):
+    """Stream an answer from a running daemon. Returns False if none is listening."""
+    try:
+        conn = socket.create_connection((DAEMON_HOST, DAEMON_PORT), timeout=0.2)
+    except OSError:
+        return False
+    with conn:
+        # Generation can take a while; only the connect attempt is rushed.
+        conn.settimeout(None)
+        conn.sendall(json.dumps({"question": query_text}).encode("utf-8") + b"\n")
+        for line in conn.makefile("r", encoding="utf-8"):
+            message = json.loads(line)
+            if "token" in message:
+                print(message["token"], end="", flush=True)
+        print()
+    return True
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """One question per connection; tokens go back as JSON lines."""
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        query_text = request["question"]
+        logging.info(f"Daemon query: {query_text}")
+        stream = stream_rag(query_text, self.server.startup.db(), self.server.startup.model())
+        for token in stream:
+            self.wfile.write(json.dumps({"token": token}).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps({"done": True, "ttft": stream.ttft, "total": stream.total}).encode("utf-8") + b"\n")
+
+class DaemonServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
 
-    # Combine context
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-    
-    # Format prompt
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, question=query_text)
+def serve_daemon(host=DAEMON_HOST, port=DAEMON_PORT):
+    startup = Startup(CHROMA_PATH, warmup_prompt=PROMPT_TEMPLATE.prefix)
+    with DaemonServer((host, port), DaemonHandler) as server:
+        server.startup = startup
+        print(f"--- Query daemon listening on {host}:{port} (Ctrl+C to stop) ---")
+        print(f"⏱️  Ready in {startup.wait():.2f}s ({startup.summary()})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nDaemon stopped.")
+
+def print_stream(stream):
+    """Write tokens to the terminal as they arrive."""
+    for token in stream:
+        print(token, end="", flush=True)
+    print()
+
+def build_prompt(query_text: str, db):
+    # Deferred so a one-shot client handing off to the daemon never imports LangChain.
+    from retrieval_cache import retrieval_cache
+
+    # Search the DB (repeated questions are served from the cache).
+    results = retrieval_cache.search(db, query_text, k=5)
+
+    with metrics.timer("prompt"):
+        # Combine context
+        context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+
+        # Format prompt (the guidelines prefix is identical every time)
+        prompt = PROMPT_TEMPLATE.format(context=context_text, question=query_text)
+    prefill_tracker.record(prompt)
+    return prompt
+
+def query_rag(query_text: str, db, model):
+    prompt = build_prompt(query_text, db)
 
     # Generate response
-    response_text = model.invoke(prompt)
+    with metrics.timer("llm_total"):
+        response_text = model.invoke(prompt)
 
     return response_text
 
+def stream_rag(query_text: str, db, model):
+    """Like query_rag, but yields tokens as Mistral generates them."""
+    return TimedStream(model, build_prompt(query_text, db))
+
 if __name__ == "__main__":
     main()
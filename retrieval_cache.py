@@ -0,0 +1,223 @@
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from context_compression import CANDIDATE_MULTIPLIER, compress_results
+from hybrid_search import hybrid_search
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+from metrics import metrics
+from sharded_store import ShardedLexicalIndex, read_layout
+
+CHROMA_PATH = "chroma"
+# Ingestion writes a fresh random token here whenever the collection changes.
+# Every cached result is tagged with the token it was computed under, so a
+# re-ingest (or clear_database, which deletes the file) makes them all stale.
+VERSION_FILE = "collection_version"
+DEFAULT_MAX_ENTRIES = 512
+# Set HYBRID_SEARCH=0 to fall back to pure vector search even when ingestion
+# has built a lexical index.
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") != "0"
+# Set CONTEXT_COMPRESSION=0 to hand the raw top-k to the prompt, without
+# merging neighbouring chunks or dropping near-duplicates.
+CONTEXT_COMPRESSION = os.environ.get("CONTEXT_COMPRESSION", "1") != "0"
+
+
+def bump_collection_version(chroma_path=CHROMA_PATH):
+    """Called by ingestion after writing to the collection."""
+    os.makedirs(chroma_path, exist_ok=True)
+    path = os.path.join(chroma_path, VERSION_FILE)
+    # A temp file of its own: --only-shard workers bump the version concurrently.
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=chroma_path, prefix=f"{VERSION_FILE}.",
+                                     suffix=".tmp", delete=False) as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(f.name, path)
+
+
+def read_collection_version(chroma_path=CHROMA_PATH):
+    try:
+        with open(os.path.join(chroma_path, VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def open_lexical_index(chroma_path=CHROMA_PATH):
+    """The BM25 index ingestion keeps for this collection (one per shard if sharded), or None."""
+    layout = read_layout(chroma_path)
+    if layout is not None:
+        index = ShardedLexicalIndex(chroma_path, layout["num_shards"], layout["shard_by"])
+        if index.indexes:
+            return index
+    path = os.path.join(chroma_path, LEXICAL_INDEX_FILE)
+    return LexicalIndex(path) if os.path.exists(path) else None
+
+
+def normalize_query(text):
+    """Case, whitespace and trailing punctuation don't change what we retrieve."""
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip(".!?").strip()
+
+
+class RetrievalCache:
+    """LRU cache of query embedding + top-k results for similarity search.
+
+    Entries are keyed by (normalized query, k, collection version, hybrid,
+    compress). With
+    shared_path set, results are also kept in a sqlite file so other
+    processes on the same host (Streamlit workers, CLI runs) can reuse them.
+    Query embeddings are cached by the exact query text (punctuation and case
+    change the embedding) and survive collection changes. When ingestion has built a lexical index next to the
+    collection, misses go through hybrid BM25 + vector search. With compress
+    on, the top-k are distinct spans (see context_compression.py), so the
+    compression work is cached too.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, shared_path=None, chroma_path=CHROMA_PATH,
+                 hybrid=HYBRID_SEARCH, compress=CONTEXT_COMPRESSION):
+        self.max_entries = max_entries
+        self.chroma_path = chroma_path
+        self.hybrid = hybrid
+        self.compress = compress
+        self._lexical = None
+        self._lexical_version = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._results = OrderedDict()
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = None
+        self._purged_version = None
+        if shared_path:
+            self._shared = sqlite3.connect(shared_path, check_same_thread=False)
+            self._shared.execute("PRAGMA journal_mode=WAL")
+            self._shared.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, version TEXT NOT NULL, payload BLOB NOT NULL)"
+            )
+            self._shared.commit()
+
+    @staticmethod
+    def _remember(store, key, value, max_entries):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > max_entries:
+            store.popitem(last=False)
+
+    def _shared_key(self, key):
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                self._results.move_to_end(key)
+                return entry
+            if self._shared is None:
+                return None
+            row = self._shared.execute(
+                "SELECT payload FROM results WHERE key = ?", (self._shared_key(key),)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = pickle.loads(row[0])
+            self._remember(self._results, key, entry, self.max_entries)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._remember(self._results, key, entry, self.max_entries)
+            if self._shared is not None:
+                version = key[2]
+                with self._shared:
+                    if version != self._purged_version:
+                        # Anything computed against an older collection is dead
+                        # weight; drop it once per version, not on every put.
+                        self._shared.execute("DELETE FROM results WHERE version != ?", (version,))
+                        self._purged_version = version
+                    self._shared.execute(
+                        "INSERT OR REPLACE INTO results (key, version, payload) VALUES (?, ?, ?)",
+                        (self._shared_key(key), version, pickle.dumps(entry)),
+                    )
+
+    def lexical_index(self, version):
+        """The lexical index for this collection version, or None if there isn't one."""
+        if not self.hybrid:
+            return None
+        with self._lock:
+            if self._lexical_version != version:
+                # Reopen after a re-ingest: --reset replaces the whole chroma folder.
+                # The old handle is left for in-flight searches to finish with.
+                self._lexical = open_lexical_index(self.chroma_path)
+                self._lexical_version = version
+            return self._lexical
+
+    def embed_query(self, embedding_function, query_text):
+        """Query embedding, reused across collection versions."""
+        with self._lock:
+            embedding = self._embeddings.get(query_text)
+            if embedding is not None:
+                self._embeddings.move_to_end(query_text)
+                return embedding
+        with metrics.timer("embed"):
+            embedding = embedding_function.embed_query(query_text)
+        with self._lock:
+            self._remember(self._embeddings, query_text, embedding, self.max_entries)
+        return embedding
+
+    def lookup(self, db, query_text, k):
+        """Return (query_embedding, [(Document, distance), ...]) like similarity_search_with_score."""
+        start = time.perf_counter()
+        version = read_collection_version(self.chroma_path)
+        key = (normalize_query(query_text), k, version, self.hybrid, self.compress)
+        entry = self._get(key)
+        if entry is not None:
+            embedding, results, cost = entry
+            elapsed = time.perf_counter() - start
+            metrics.observe("retrieval", elapsed)
+            with self._lock:
+                self.hits += 1
+                self.saved_seconds += max(cost - elapsed, 0.0)
+            return embedding, results
+
+        embedding = self.embed_query(db.embeddings, query_text)
+        lexical_index = self.lexical_index(version)
+        candidates = k * CANDIDATE_MULTIPLIER if self.compress else k
+        with metrics.timer("search"):
+            if lexical_index is not None:
+                results = hybrid_search(db, lexical_index, query_text, embedding, candidates)
+            else:
+                results = db.similarity_search_by_vector_with_relevance_scores(embedding, k=candidates)
+        if self.compress:
+            with metrics.timer("compress"):
+                results = compress_results(db, results, k)
+        cost = time.perf_counter() - start
+        metrics.observe("retrieval", cost)
+        self._put(key, (embedding, results, cost))
+        with self._lock:
+            self.misses += 1
+        return embedding, results
+
+    def search(self, db, query_text, k):
+        return self.lookup(db, query_text, k)[1]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "entries": len(self._results),
+        }
+
+
+# One cache per process, shared by whichever front-end imported it.
+# Set RETRIEVAL_CACHE_PATH to also share results between processes.
+retrieval_cache = RetrievalCache(shared_path=os.environ.get("RETRIEVAL_CACHE_PATH"))
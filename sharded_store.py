@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from metrics import metrics
+
+CHROMA_PATH = "chroma"
+# Shards live under the main Chroma directory, so clear_database() removes them too.
+SHARDS_DIR = "shards"
+SHARDS_FILE = "shards.json"
+# "source": every chunk of a file lands in the same shard, so shards can be
+# built by separate workers that each parse only their own files.
+# "hash": chunks are spread by a hash of their ID, for the most even shards.
+SHARD_BY = ["source", "hash"]
+# A shard that hasn't answered by then is left out of the merged results.
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "2.0"))
+# Comma-separated Chroma servers (http://host:port), one per shard, instead of
+# local shard directories.
+SHARD_URLS = [url for url in os.environ.get("VECTOR_SHARD_URLS", "").split(",") if url]
+
+
+def shard_key(chunk_id, shard_by):
+    """What decides a chunk's shard: its source file ("data/a.pdf:3:1" -> "data/a.pdf") or its full ID."""
+    return chunk_id.rsplit(":", 2)[0] if shard_by == "source" else chunk_id
+
+
+def shard_of(key, num_shards):
+    # md5 rather than hash(): stable across processes and runs.
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big") % num_shards
+
+
+def shard_path(persist_directory, shard):
+    return os.path.join(persist_directory, SHARDS_DIR, f"{shard:02d}")
+
+
+def read_layout(persist_directory=CHROMA_PATH):
+    """{"num_shards": N, "shard_by": ...} written by sharded ingestion, or None."""
+    try:
+        with open(os.path.join(persist_directory, SHARDS_DIR, SHARDS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_layout(persist_directory, num_shards, shard_by):
+    layout = read_layout(persist_directory)
+    if layout is not None and (layout["num_shards"], layout["shard_by"]) != (num_shards, shard_by):
+        raise ValueError(f"The collection is already split into {layout['num_shards']} shards by "
+                         f"{layout['shard_by']}; run with --reset to change that.")
+    os.makedirs(os.path.join(persist_directory, SHARDS_DIR), exist_ok=True)
+    path = os.path.join(persist_directory, SHARDS_DIR, SHARDS_FILE)
+    # A temp file of its own: --only-shard workers all write the layout at once.
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path), prefix=f"{SHARDS_FILE}.",
+                                     suffix=".tmp", delete=False) as f:
+        json.dump({"num_shards": num_shards, "shard_by": shard_by}, f)
+    os.replace(f.name, path)
+
+
+def open_shard(embedding_function, persist_directory, shard, url=None, collection_configuration=None):
+    from chroma_client import open_chroma
+    from langchain_chroma import Chroma
+    if url:
+        db = open_chroma(embedding_function, collection_configuration=collection_configuration, server_url=url)
+    else:
+        # Absolute, because chromadb caches clients by path string.
+        db = Chroma(persist_directory=os.path.abspath(shard_path(persist_directory, shard)),
+                    embedding_function=embedding_function, collection_configuration=collection_configuration)
+    # Create the collection now: chromadb can't set up several new databases
+    # from concurrent threads.
+    _shard_collection(db).count()
+    return db
+
+
+def _shard_collection(db):
+    # Imported here like open_chroma: chroma_client loads chromadb.
+    from chroma_client import collection
+    return collection(db)
+
+
+class ShardedCollection:
+    """The slice of Chroma's Collection API that ingestion uses (chroma_client.collection), routed per shard."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def count(self):
+        return sum(self._store.scatter(lambda shard: _shard_collection(shard).count(), "count").values())
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        groups = self._store.route(ids)
+        self._store.gather({
+            shard: (lambda shard=shard, rows=rows: _shard_collection(self._store.shards[shard]).upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                documents=[documents[i] for i in rows],
+            ))
+            for shard, rows in groups.items()
+        })
+
+    def update(self, ids, metadatas):
+        self._store.gather({
+            shard: (lambda shard=shard, rows=rows: _shard_collection(self._store.shards[shard]).update(
+                ids=[ids[i] for i in rows], metadatas=[metadatas[i] for i in rows],
+            ))
+            for shard, rows in self._store.route(ids).items()
+        })
+
+    @property
+    def configuration(self):
+        return _shard_collection(self._store.first()).configuration
+
+    @property
+    def metadata(self):
+        return _shard_collection(self._store.first()).metadata
+
+
+class ShardedVectorStore:
+    """N Chroma collections behind the vector store interface the app already uses.
+
+    Writes are routed to one shard per chunk (by source file or ID hash).
+    Searches are scattered to every shard in parallel and the per-shard top-k
+    merged by distance. A shard that errors, is missing or misses the timeout
+    is skipped, so one bad shard degrades recall instead of failing the turn.
+    """
+
+    def __init__(self, embedding_function, persist_directory=CHROMA_PATH, num_shards=None, shard_by=None,
+                 urls=None, timeout=SHARD_TIMEOUT, collection_configuration=None, create=False):
+        layout = read_layout(persist_directory) or {}
+        urls = list(urls if urls is not None else SHARD_URLS)
+        self.num_shards = num_shards or layout.get("num_shards") or len(urls)
+        self.shard_by = shard_by or layout.get("shard_by", "source")
+        if not self.num_shards:
+            raise ValueError("No shard layout found; ingest with --shards N or set VECTOR_SHARD_URLS.")
+        if urls and len(urls) != self.num_shards:
+            raise ValueError(f"{len(urls)} shard URLs for {self.num_shards} shards.")
+        self.embeddings = embedding_function
+        self.timeout = timeout
+        self.partial_results = 0
+        self.shards = {}
+        for shard in range(self.num_shards):
+            url = urls[shard] if urls else None
+            if not (url or create or os.path.isdir(shard_path(persist_directory, shard))):
+                logging.warning(f"Shard {shard} not found under {persist_directory}; searching without it")
+                continue
+            self.shards[shard] = open_shard(embedding_function, persist_directory, shard, url,
+                                            collection_configuration)
+        if not self.shards:
+            raise ValueError(f"None of the {self.num_shards} shards exist under {persist_directory}; "
+                             f"ingest with --shards {self.num_shards} first.")
+        # Twice the shards: a timed-out search keeps its thread until it ends.
+        self._pool = ThreadPoolExecutor(max_workers=2 * self.num_shards, thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._collection = ShardedCollection(self)
+
+    @property
+    def space(self):
+        from hybrid_search import collection_space
+        return collection_space(self.first())
+
+    def first(self):
+        """The lowest-numbered open shard (the constructor guarantees there is one)."""
+        return self.shards[min(self.shards)]
+
+    def route(self, ids):
+        """shard -> positions in `ids` that belong to it."""
+        groups = {}
+        for i, chunk_id in enumerate(ids):
+            groups.setdefault(shard_of(shard_key(chunk_id, self.shard_by), self.num_shards), []).append(i)
+        return groups
+
+    def gather(self, calls, timeout=None, what="write"):
+        """Run shard -> callable concurrently; returns shard -> result for those that finished in time."""
+        futures = {self._pool.submit(call): shard for shard, call in calls.items()}
+        done, not_done = wait(futures, timeout=timeout)
+        results = {}
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                if what == "write":
+                    raise
+                logging.warning(f"Shard {futures[future]} failed during {what}: {e}")
+        if not_done:
+            logging.warning(f"Shards {sorted(futures[f] for f in not_done)} timed out during {what}")
+        if len(results) < len(calls):
+            with self._lock:
+                self.partial_results += 1
+        return results
+
+    def scatter(self, call, what, timeout=None):
+        return self.gather({shard: (lambda db=db: call(db)) for shard, db in self.shards.items()}, timeout, what)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        with metrics.timer("shard_search"):
+            per_shard = self.scatter(
+                lambda db: db.similarity_search_by_vector_with_relevance_scores(embedding, k=k, **kwargs),
+                "search", timeout=self.timeout,
+            )
+        merged = [result for results in per_shard.values() for result in results]
+        return sorted(merged, key=lambda result: result[1])[:k]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(self.embeddings.embed_query(query), k=k, **kwargs)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        """Chroma's get() across shards. ids are routed; limit/offset page through shards in order."""
+        include = list(include)
+        if ids is not None:
+            calls = {shard: (lambda shard=shard, rows=rows: self.shards[shard].get(
+                        ids=[ids[i] for i in rows], include=include))
+                     for shard, rows in self.route(ids).items() if shard in self.shards}
+            pages = self.gather(calls, what="get").values()
+        elif limit is None:
+            pages = self.scatter(lambda db: db.get(where=where, include=include), "get").values()
+        else:
+            pages, skip = [], offset or 0
+            for shard in sorted(self.shards):
+                db = self.shards[shard]
+                size = _shard_collection(db).count() if where is None else len(db.get(where=where, include=[])["ids"])
+                if skip >= size:
+                    skip -= size
+                    continue
+                page = db.get(where=where, include=include, limit=limit, offset=skip)
+                pages.append(page)
+                limit -= len(page["ids"])
+                skip = 0
+                if limit <= 0:
+                    break
+        merged = {"ids": []}
+        for key in include:
+            merged[key] = []
+        for page in pages:
+            merged["ids"].extend(page["ids"])
+            for key in include:
+                values = page.get(key)
+                merged[key].extend(list(values) if values is not None else [None] * len(page["ids"]))
+        return merged
+
+    def delete(self, ids):
+        self.gather({shard: (lambda shard=shard, rows=rows: self.shards[shard].delete(ids=[ids[i] for i in rows]))
+                     for shard, rows in self.route(ids).items()})
+
+    def add_documents(self, documents, ids=None):
+        ids = ids or [doc.metadata["id"] for doc in documents]
+        self.gather({shard: (lambda shard=shard, rows=rows: self.shards[shard].add_documents(
+                        [documents[i] for i in rows], ids=[ids[i] for i in rows]))
+                     for shard, rows in self.route(ids).items()})
+        return ids
+
+
+class ShardedLexicalIndex:
+    """One BM25 index per shard, behind the LexicalIndex interface.
+
+    Chunks are routed the way ShardedVectorStore routes them, so a worker
+    building a single shard (--only-shard) keeps exactly that shard's index
+    current. Searches ask every shard's index and fuse the rankings with
+    reciprocal rank fusion, since BM25 scores from indexes with different
+    term statistics don't compare. Shards without an index are skipped
+    unless create is set.
+    """
+
+    def __init__(self, persist_directory, num_shards, shard_by, create=False):
+        from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+        self.num_shards = num_shards
+        self.shard_by = shard_by
+        self.indexes = {}
+        for shard in range(num_shards):
+            path = os.path.join(shard_path(persist_directory, shard), LEXICAL_INDEX_FILE)
+            if create or os.path.exists(path):
+                self.indexes[shard] = LexicalIndex(path)
+
+    def _route(self, chunk_ids):
+        groups = {}
+        for i, chunk_id in enumerate(chunk_ids):
+            groups.setdefault(shard_of(shard_key(chunk_id, self.shard_by), self.num_shards), []).append(i)
+        return groups
+
+    def add(self, chunk_ids, texts):
+        for shard, rows in self._route(chunk_ids).items():
+            self.indexes[shard].add([chunk_ids[i] for i in rows], [texts[i] for i in rows])
+
+    def remove(self, chunk_ids):
+        return sum(self.indexes[shard].remove([chunk_ids[i] for i in rows])
+                   for shard, rows in self._route(chunk_ids).items() if shard in self.indexes)
+
+    def search(self, query_text, k=10):
+        from hybrid_search import reciprocal_rank_fusion
+        rankings = [index.search(query_text, k) for index in self.indexes.values()]
+        scores = {chunk_id: score for ranking in rankings for chunk_id, score in ranking}
+        fused = reciprocal_rank_fusion(*[[chunk_id for chunk_id, _score in ranking] for ranking in rankings])
+        return [(chunk_id, scores[chunk_id]) for chunk_id in fused[:k]]
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes.values())
+
+    def close(self):
+        for index in self.indexes.values():
+            index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show how the collection is split across shards.")
+    parser.parse_args()
+    from get_embedding_function import get_embedding_function
+
+    layout = read_layout(CHROMA_PATH)
+    if layout is None and not SHARD_URLS:
+        print("The collection is not sharded (ingest with `python dataset.py --shards N`).")
+        return
+    store = ShardedVectorStore(get_embedding_function(), CHROMA_PATH)
+    counts = store.scatter(lambda db: _shard_collection(db).count(), "count")
+    print(f"🧩 {store.num_shards} shards by {store.shard_by}:")
+    for shard in range(store.num_shards):
+        print(f"  {shard:02d}: {counts.get(shard, 'missing')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
+import uuid
+
 import streamlit as st
-from langchain_chroma import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaLLM
 from get_embedding_function import get_embedding_function
+from mmap_store import open_vector_store
+from retrieval_cache import retrieval_cache
+from llm_streaming import TimedStream
+from metrics import metrics, start_from_env
+from context_compression import source_ids
+from conversation_memory import ConversationMemory, fit_sections, llm_summarizer
+from prompt_cache import CachedPrompt, prefill_tracker
+from warm_start import load_warm_llm
 
 # Page Config
 st.set_page_config(page_title="Psychology Mentor", page_icon="🧠")
@@ -10,65 +17,87 @@ st.set_page_config(page_title="Psychology Mentor", page_icon="🧠")
 CHROMA_PATH = "chroma"
 
 # UPDATED PROMPT: Adds guardrails against hallucinations
-PROMPT_TEMPLATE = """
+# Static guidelines first (reused by Ollama across turns), then history and context.
+PROMPT_TEMPLATE = CachedPrompt(
+    instructions="""
 You are a warm, empathetic college mentor.
 
 Your goal is to help the student based on the CHAT HISTORY and the provided CONTEXT.
 
 CRITICAL INSTRUCTION:
-The CONTEXT below is automatically retrieved from a database. It might be completely irrelevant to the current conversation. 
+The CONTEXT below is automatically retrieved from a database. It might be completely irrelevant to the current conversation.
 If the CONTEXT discusses topics (like pregnancy, severe disorders, specific case studies) that do NOT match the Student's current query or the CHAT HISTORY, you MUST IGNORE the CONTEXT.
 
 Instead, respond naturally to the Student's latest message using the CHAT HISTORY.
+""",
+    sections="""
+CHAT HISTORY:
+{history}
 
 CONTEXT:
 {context}
 
-CHAT HISTORY:
-{history}
-
 STUDENT'S LATEST MESSAGE: {question}
 
 MENTOR'S RESPONSE:
-"""
+""",
+)
 
 @st.cache_resource
 def load_db():
+    # Optional /metrics endpoint or periodic dump (METRICS_PORT / METRICS_DUMP_PATH).
+    start_from_env()
     embedding_function = get_embedding_function()
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-    model = OllamaLLM(model="mistral")
+    db = open_vector_store(embedding_function, CHROMA_PATH)
+    # Loaded with the static guidelines already evaluated, ready for reuse.
+    model = load_warm_llm("mistral", PROMPT_TEMPLATE.prefix)
     return db, model
 
-def query_rag(query_text, history, db, model):
-    # Retrieve top 3 chunks
-    results = db.similarity_search_with_score(query_text, k=3)
+def build_prompt(query_text, history, db, session=None):
+    # Retrieve top 3 chunks (repeated questions are served from the cache)
+    results = retrieval_cache.search(db, query_text, k=3)
     
     # Check for relevance. If the best score is too low (distance too high), 
     # we might want to warn the model or just provide less context.
     # For now, we pass them but rely on the Prompt Guardrails to filter bad context.
     
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
-    
-    history_text = "\n".join([f"Student: {q}\nMentor: {a}" for q, a in history])
-    
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, history=history_text, question=query_text)
-    
-    response_text = model.invoke(prompt)
+    with metrics.timer("prompt"):
+        # Trimmed to the prompt token budget; older turns come from the running summary
+        context_text, history_text, results = fit_sections(PROMPT_TEMPLATE, results, history, query_text)
+
+        prompt = PROMPT_TEMPLATE.format(context=context_text, history=history_text, question=query_text)
+    prefill_tracker.record(prompt, session=session)
     
-    sources = [doc.metadata.get("id", "Unknown") for doc, _score in results]
-    return response_text, list(set(sources))
+    sources = [source_id for doc, _score in results for source_id in source_ids(doc) or ["Unknown"]]
+    return prompt, list(set(sources))
+
+def query_rag(query_text, history, db, model, session=None):
+    prompt, sources = build_prompt(query_text, history, db, session)
+    with metrics.timer("llm_total"):
+        response_text = model.invoke(prompt)
+    return response_text, sources
+
+def stream_rag(query_text, history, db, model, session=None):
+    # Same as query_rag, but hands back a token stream for st.write_stream
+    prompt, sources = build_prompt(query_text, history, db, session)
+    return TimedStream(model, prompt), sources
 
 # --- UI Layout ---
 st.title("🧠 Psychology AI Mentor")
 st.caption("Ask specific questions about psychology concepts found in your library.")
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
 # Load DB (Cached)
 db, model = load_db()
 
+if "messages" not in st.session_state:
+    st.session_state.messages = []
+    # What the prompt sees: recent turns verbatim plus a running summary,
+    # instead of the whole transcript every turn.
+    # Browser sessions share this process (and its prefill tracker).
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.memory = ConversationMemory(summarize=llm_summarizer(
+        lambda: model, PROMPT_TEMPLATE.prefix, prefill_tracker, st.session_state.session_id))
+
 # Display chat history
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -84,22 +113,16 @@ if prompt := st.chat_input("How can I help you today?"):
     # Generate response
     with st.chat_message("assistant"):
         with st.spinner("Thinking..."):
-            # Prepare history list for RAG function
-            # We pair strictly: (User, AI), (User, AI)...
-            history_list = []
-            msgs = st.session_state.messages
-            for i in range(0, len(msgs) - 1):
-                if msgs[i]["role"] == "user" and msgs[i+1]["role"] == "assistant":
-                    history_list.append((msgs[i]["content"], msgs[i+1]["content"]))
-            
-            response, sources = query_rag(prompt, history_list, db, model)
-            
-            st.markdown(response)
-            
-            # Show sources in an expander
-            with st.expander("📚 Sources"):
-                for source in sources:
-                    st.write(f"- {source}")
+            stream, sources = stream_rag(prompt, st.session_state.memory, db, model, st.session_state.session_id)
+        
+        # Render tokens as Mistral writes them instead of waiting behind the spinner
+        response = st.write_stream(stream)
+        
+        # Show sources in an expander
+        with st.expander("📚 Sources"):
+            for source in sources:
+                st.write(f"- {source}")
     
     # Add assistant message to state
-    st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response})
+    st.session_state.memory.append(prompt, response)
\ No newline at end of file
@@ -0,0 +1,125 @@
+import csv
+import fnmatch
+import json
+import os
+import sys
+
+from langchain_core.documents import Document
+
+# Which columns of a tabular file become the text that is chunked and
+# embedded, which are kept as metadata, and which one identifies a row:
+#
+#   {"data/qa_*.csv": {"content": ["question", "answer"], "metadata": ["topic"], "id": "qa_id"},
+#    "*.ndjson": {"content": ["transcript"], "metadata": ["session", "speaker"]}}
+#
+# Patterns are matched against the file path; the first match wins. Files
+# without one get every column as content (as CSVLoader did) and the row
+# number as ID. A row reusing an ID seen earlier in the file is stored as
+# "<id>@<row number>" rather than overwriting the first.
+DATASET_SCHEMA_PATH = os.environ.get("DATASET_SCHEMA_PATH", "dataset_schema.json")
+TABULAR_EXTENSIONS = (".csv", ".ndjson", ".jsonl", ".parquet")
+# Parquet is read this many rows at a time; CSV and NDJSON a line at a time.
+BATCH_ROWS = 1024
+# Counseling transcripts easily exceed csv's default 128 KB field limit.
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def is_tabular(file_path):
+    return file_path.lower().endswith(TABULAR_EXTENSIONS)
+
+
+def load_schemas(path=None):
+    path = path or DATASET_SCHEMA_PATH
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def schema_for(file_path, schemas=None):
+    schemas = load_schemas() if schemas is None else schemas
+    normalized = file_path.replace(os.sep, "/")
+    for pattern, schema in schemas.items():
+        if fnmatch.fnmatch(normalized, pattern) or fnmatch.fnmatch(os.path.basename(file_path), pattern):
+            return schema
+    return {}
+
+
+def _metadata_value(value):
+    # Chroma only stores scalars.
+    return value if isinstance(value, (str, int, float, bool)) else json.dumps(value, default=str)
+
+
+def row_document(record, schema, file_path, row_number):
+    """One Document per row: "field: value" lines as content, chosen fields as metadata."""
+    id_field = schema.get("id")
+    metadata_fields = schema.get("metadata", [])
+    content_fields = schema.get("content") or [
+        field for field in record if field != id_field and field not in metadata_fields
+    ]
+    lines = []
+    for field in content_fields:
+        value = record.get(field)
+        if value is None or value == "":
+            continue
+        lines.append(f"{field}: {value.strip() if isinstance(value, str) else json.dumps(value, default=str)}")
+    row_id = record.get(id_field) if id_field else None
+    # The row ID becomes part of the chunk ID, whose parts are split on ":".
+    row_id = row_number if row_id is None or row_id == "" else str(row_id).replace(":", "_")
+    metadata = {"source": file_path, "row": row_id}
+    for field in metadata_fields:
+        if record.get(field) is not None:
+            metadata[field] = _metadata_value(record[field])
+    return Document(page_content="\n".join(lines), metadata=metadata)
+
+
+def iter_records(file_path, columns=None, batch_rows=BATCH_ROWS):
+    """Yield one dict per row without reading the whole file."""
+    lower = file_path.lower()
+    if lower.endswith(".csv"):
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    elif lower.endswith((".ndjson", ".jsonl")):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield record if isinstance(record, dict) else {"value": record}
+    elif lower.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(file_path)
+        for batch in parquet.iter_batches(batch_size=batch_rows, columns=columns):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"Not a tabular file: {file_path}")
+
+
+def iter_rows(file_path, schemas=None):
+    """Stream a CSV, NDJSON/JSONL or Parquet file as one Document per non-empty row."""
+    schema = schema_for(file_path, schemas)
+    columns = None
+    if schema.get("content"):
+        # Parquet reads only the columns that are used.
+        columns = list(dict.fromkeys(schema["content"] + schema.get("metadata", []) + [schema.get("id")]))
+        columns = [column for column in columns if column]
+    # Row numbers are unique on their own; only IDs read from the file can repeat.
+    seen = set() if schema.get("id") else None
+    collisions = 0
+    for row_number, record in enumerate(iter_records(file_path, columns)):
+        doc = row_document(record, schema, file_path, row_number)
+        if not doc.page_content:
+            continue
+        if seen is None:
+            yield doc
+            continue
+        row_id = str(doc.metadata["row"])
+        if row_id in seen:
+            # Same ID as an earlier row: keep both, this one under its row number.
+            collisions += 1
+            row_id = doc.metadata["row"] = f"{row_id}@{row_number}"
+        seen.add(row_id)
+        yield doc
+    if collisions:
+        print(f"⚠️  {file_path}: {collisions} rows reuse an earlier row's ID; stored as <id>@<row number>")
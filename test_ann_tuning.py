@@ -0,0 +1,77 @@
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ann_tuning import apply, calibrate_threshold, choose, exact_top_k, tune
+from index_config import collection_configuration, relevance_threshold
+
+
+def make_db(tmp_path, n=400):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=16))
+    db.add_documents(
+        [Document(page_content=f"passage {i} about coping with exam stress and sleep") for i in range(n)],
+        ids=[f"book.pdf:{i}:0" for i in range(n)],
+    )
+    return db
+
+
+def test_exact_top_k_finds_the_vector_itself():
+    vectors = np.random.default_rng(0).normal(size=(50, 8)).astype(np.float32)
+    for space in ["l2", "cosine"]:
+        truth = exact_top_k(space, vectors, vectors[:5], k=3)
+        assert all(i in found for i, found in enumerate(truth))
+
+
+def test_choose_prefers_fastest_config_above_target():
+    results = [
+        {"recall@5": 0.99, "p50_ms": 3.0, "index_mb": 1},
+        {"recall@5": 0.96, "p50_ms": 1.0, "index_mb": 1},
+        {"recall@5": 0.80, "p50_ms": 0.5, "index_mb": 1},
+    ]
+    assert choose(results, 5, target_recall=0.95)["p50_ms"] == 1.0
+    assert choose(results, 5, target_recall=1.0)["recall@5"] == 0.99
+
+
+def test_calibrated_threshold_separates_clusters():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(100, 8)).astype(np.float32)
+    in_domain = vectors[:20] + rng.normal(scale=0.01, size=(20, 8)).astype(np.float32)
+    off_topic = rng.normal(loc=20, size=(10, 8)).astype(np.float32)
+    calibration = calibrate_threshold("l2", vectors, in_domain, off_topic)
+    assert calibration["in_domain_accepted"] == 1.0
+    assert calibration["off_topic_accepted"] == 0.0
+    # The threshold sits between the clusters, not on the furthest in-domain hit.
+    relevant = ((in_domain[:, None] - vectors[None]) ** 2).sum(axis=2).min(axis=1)
+    assert relevant.max() < calibration["relevance_threshold"]
+
+
+def test_threshold_follows_the_collection_space(tmp_path):
+    path = str(tmp_path / "index_config.json")
+    report = {"chosen": {"space": "cosine", "max_neighbors": 16, "ef_construction": 100, "ef_search": 10},
+              "calibrations": {"l2": {"relevance_threshold": 0.9}, "cosine": {"relevance_threshold": 0.4}}}
+    apply(report, path)
+    # The collection is still l2 until it is rebuilt; it keeps an l2-scale threshold.
+    assert relevance_threshold("l2", path) == 0.9
+    assert relevance_threshold("cosine", path) == 0.4
+
+
+def test_tune_sweeps_and_applies_config(tmp_path):
+    db = make_db(tmp_path)
+    report = tune(db, db.embeddings, queries=20, k=5, spaces=["l2", "cosine"], max_neighbors=[16],
+                  ef_construction=[100], ef_search=[10, 200])
+    assert len(report["results"]) == 4
+    # A generous ef_search on a small index is effectively exact.
+    assert all(r["recall@5"] == 1.0 for r in report["results"] if r["ef_search"] == 200)
+
+    path = str(tmp_path / "index_config.json")
+    apply(report, path)
+    hnsw = collection_configuration(path)["hnsw"]
+    assert hnsw["space"] == report["chosen"]["space"]
+    for space in ["l2", "cosine"]:
+        assert relevance_threshold(space, path) == report["calibrations"][space]["relevance_threshold"]
+
+    # A fresh collection is created with the tuned settings.
+    tuned = Chroma(persist_directory=str(tmp_path / "tuned"), embedding_function=db.embeddings,
+                   collection_configuration=collection_configuration(path))
+    assert tuned._collection.configuration["hnsw"]["space"] == hnsw["space"]
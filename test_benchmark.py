@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from benchmark import StubLLM, run_benchmark
+
+
+def test_stub_llm_streams_the_same_text_it_returns():
+    model = StubLLM(first_token_seconds=0, token_seconds=0)
+    assert "".join(model.stream("prompt")) == model.invoke("prompt")
+
+
+def test_tiny_benchmark_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    workdir = tmp_path / "bench"
+    workdir.mkdir()
+    results = run_benchmark(files=2, rows_per_file=10, sessions=2, turns=2, first_token_ms=1, token_ms=0,
+                            seed=0, workdir=str(workdir))
+    assert results["ingestion"]["chunks"] >= 20
+    assert results["queries"]["queries"] == 4
+    assert results["queries"]["p50_ms"] <= results["queries"]["p99_ms"]
+    assert results["peak_rss_mb"] > 0
+    # The scratch database was used, not the repo's.
+    assert (workdir / "chroma").is_dir()
+    assert os.getcwd() == str(tmp_path)
+
+
+def test_failed_run_restores_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import dataset
+    monkeypatch.setattr(dataset, "load_documents", lambda paths: 1 / 0)
+    workdir = tmp_path / "bench"
+    workdir.mkdir()
+    with pytest.raises(ZeroDivisionError):
+        run_benchmark(files=1, rows_per_file=1, sessions=1, turns=1, first_token_ms=0, token_ms=0,
+                      seed=0, workdir=str(workdir))
+    assert os.getcwd() == str(tmp_path)
@@ -0,0 +1,88 @@
+import csv
+import os
+import shutil
+
+import httpx
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import chroma_client
+import dataset
+from chroma_client import ClientPool, PooledChroma, client_pool, open_chroma, start_server, with_retry
+from mmap_store import open_vector_store
+
+QUESTIONS = ["How do I handle exam stress?", "I can't sleep before tests"]
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    if shutil.which("chroma") is None:
+        pytest.skip("chroma CLI not installed")
+    process, url = start_server(str(tmp_path_factory.mktemp("chroma_server")))
+    yield url
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr("mmap_store.VECTOR_STORE", "chroma")
+    os.mkdir("data")
+    with open("data/notes.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["text"])
+        for row in range(40):
+            writer.writerow([f"Paragraph {row} about coping with stress, sleep and motivation."])
+    return tmp_path
+
+
+def test_ingest_and_query_through_the_server(server, corpus, monkeypatch):
+    dataset.ingest(["data"])
+    expected = {q: [doc.metadata["id"] for doc, _ in open_vector_store(DeterministicFakeEmbedding(size=16))
+                    .similarity_search_with_score(q, k=5)] for q in QUESTIONS}
+
+    monkeypatch.setattr(chroma_client, "CHROMA_SERVER_URL", server)
+    # Small upserts, to check ingestion splits batches to the client's limit.
+    monkeypatch.setattr("ingest_pipeline.max_batch_size", lambda db: 7)
+    dataset.clear_database()
+    assert chroma_client.reset_server_collection()
+    dataset.ingest(["data"])
+    # Only local state (manifest, lexical index) is written next to the app.
+    assert not os.path.exists(os.path.join("chroma", "chroma.sqlite3"))
+
+    db = open_vector_store(DeterministicFakeEmbedding(size=16))
+    assert isinstance(db, PooledChroma)
+    assert db._collection.count() == 40
+    # Every store in the process shares one client.
+    assert db._client is open_chroma(None)._client is client_pool.get(server)
+    for question in QUESTIONS:
+        assert [doc.metadata["id"] for doc, _ in db.similarity_search_with_score(question, k=5)] == expected[question]
+
+    # Re-running finds nothing to do; --reset drops the server-side collection.
+    dataset.ingest(["data"])
+    assert db._collection.count() == 40
+    dataset.clear_database()
+    assert open_chroma(None)._collection.count() == 0
+
+
+def test_transport_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(chroma_client, "RETRY_BACKOFF", 0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("connection refused")
+        return "ok"
+
+    assert with_retry(flaky) == "ok" and len(attempts) == 3
+    with pytest.raises(ValueError):
+        with_retry(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+
+
+def test_unreachable_server_fails_health_check(monkeypatch):
+    monkeypatch.setattr(chroma_client, "RETRY_BACKOFF", 0)
+    with pytest.raises(ConnectionError):
+        ClientPool().get("http://localhost:9")
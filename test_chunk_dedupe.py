@@ -0,0 +1,118 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import dataset
+from chunk_dedupe import CHUNK_REGISTRY_FILE, ChunkRegistry, locations, minhash, text_hash
+from context_compression import source_ids
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+from mmap_store import open_vector_store
+
+ROWS = [f"Paragraph {i}: reframing a failed exam as feedback, not a verdict, keeps motivation alive." for i in range(8)]
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: list = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["text"])
+        writer.writerows([row] for row in rows)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    embeddings = CountingEmbeddings(size=16, embedded=[])
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: embeddings)
+    monkeypatch.setattr("mmap_store.VECTOR_STORE", "chroma")
+    os.mkdir("data")
+    write_rows("data/first_edition.csv", ROWS)
+    # A reprint: same text with different line breaks and spacing, plus one new paragraph.
+    write_rows("data/reprint.csv", [row.replace(" ", "  ").replace(", ", ",\n") for row in ROWS]
+               + ["A new preface on sleep before exams."])
+    return embeddings
+
+
+def stored(db):
+    return dict(zip(*(lambda got: (got["ids"], got["metadatas"]))(db.get(include=["metadatas"]))))
+
+
+def test_hash_ignores_whitespace_only_differences():
+    assert text_hash("Learned  helplessness\n is learned.") == text_hash("Learned helplessness is learned.")
+    assert text_hash("Learned helplessness") != text_hash("Learned hopelessness")
+
+
+def test_copies_are_embedded_and_stored_once(library):
+    dataset.ingest(["data"])
+    db = open_vector_store(DeterministicFakeEmbedding(size=16))
+    assert db._collection.count() == len(ROWS) + 1
+    assert len(library.embedded) == len(ROWS) + 1
+
+    metadatas = stored(db)
+    original = next(chunk_id for chunk_id, m in metadatas.items()
+                    if m["source"] == "data/first_edition.csv" and locations(m))
+    copies = locations(metadatas[original])
+    assert len(copies) == 1 and copies[0].startswith("data/reprint.csv:")
+    doc = db.get_by_ids([original])[0]
+    assert source_ids(doc) == [original, copies[0]]
+    # BM25 only knows the stored chunk.
+    lexical_ids = {chunk_id for chunk_id, _score in
+                   LexicalIndex(os.path.join("chroma", LEXICAL_INDEX_FILE)).search("reframing verdict", k=20)}
+    assert original in lexical_ids and copies[0] not in lexical_ids
+
+    # Nothing changed: nothing is embedded again.
+    dataset.ingest(["data"])
+    assert len(library.embedded) == len(ROWS) + 1
+
+
+def test_removing_the_original_keeps_the_copy(library):
+    dataset.ingest(["data"])
+    os.remove("data/first_edition.csv")
+    dataset.ingest(["data"])
+
+    db = open_vector_store(DeterministicFakeEmbedding(size=16))
+    metadatas = stored(db)
+    assert len(metadatas) == len(ROWS) + 1
+    assert {m["source"] for m in metadatas.values()} == {"data/reprint.csv"}
+    assert all(not locations(m) for m in metadatas.values())
+    # Moved, not re-embedded.
+    assert len(library.embedded) == len(ROWS) + 1
+    lexical_ids = {chunk_id for chunk_id, _score in
+                   LexicalIndex(os.path.join("chroma", LEXICAL_INDEX_FILE)).search("reframing verdict", k=20)}
+    assert lexical_ids and all(chunk_id.startswith("data/reprint.csv") for chunk_id in lexical_ids)
+
+
+def test_dedupe_can_be_turned_off(library):
+    dataset.ingest(["data"], dedupe=False)
+    assert open_vector_store(DeterministicFakeEmbedding(size=16))._collection.count() == 2 * len(ROWS) + 1
+
+
+def test_near_duplicates_need_minhash(tmp_path):
+    from langchain_core.documents import Document
+    text = ("Cognitive reframing helps students question the belief that one failure defines them and "
+            "replace it with a more balanced account of what happened and what they can change next time.")
+    ocr = text.replace("balanced", "ba1anced")
+    assert np.mean(minhash(text) == minhash(ocr)) > 0.75
+
+    def chunks():
+        return [Document(page_content=text, metadata={"id": "book.pdf:1:0", "source": "book.pdf"}),
+                Document(page_content=ocr, metadata={"id": "ocr_book.pdf:1:0", "source": "ocr_book.pdf"})]
+
+    exact = ChunkRegistry(str(tmp_path / "exact" / CHUNK_REGISTRY_FILE))
+    assert len(exact.assign(chunks())[0]) == 2
+    near = ChunkRegistry(str(tmp_path / "near" / CHUNK_REGISTRY_FILE), near_duplicates=True)
+    unique, rows = near.assign(chunks())
+    assert [c.metadata["id"] for c in unique] == ["book.pdf:1:0"]
+    assert near.commit(rows) == {"book.pdf:1:0"}
+    assert near.aliases(["book.pdf:1:0"]) == {"book.pdf:1:0": ["ocr_book.pdf:1:0"]}
+    assert near.stats() == {"chunks": 2, "unique": 1, "duplicates": 1}
@@ -0,0 +1,75 @@
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from context_compression import (compress_results, drop_near_duplicates, merge_adjacent, source_ids,
+                                 strip_overlap)
+from dataset import calculate_chunk_ids
+from retrieval_cache import RetrievalCache, bump_collection_version
+
+PAGE = ("Learned helplessness describes how repeated setbacks can teach a student that effort does not matter. "
+        "Over time they stop trying even when success is within reach. Cognitive reframing helps by questioning "
+        "the belief that nothing can change. Small, achievable goals rebuild a sense of control, and noticing each "
+        "success makes it easier to try again. Talking with a mentor or counsellor can speed this up.")
+
+
+def chunk(chunk_id, text):
+    return Document(page_content=text, metadata={"id": chunk_id})
+
+
+def split_page():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=120, chunk_overlap=40, length_function=len)
+    chunks = splitter.split_documents([Document(page_content=PAGE, metadata={"source": "data/book.pdf", "page": 3})])
+    return calculate_chunk_ids(chunks)
+
+
+def test_adjacent_chunks_are_stitched_without_overlap():
+    chunks = split_page()
+    assert len(chunks) >= 3
+    # Retrieved out of order, as similarity search would.
+    results = [(chunks[1], 0.2), (chunks[0], 0.4), (chunks[2], 0.5)]
+    merged = merge_adjacent(results)
+    assert len(merged) == 1
+    doc, score = merged[0]
+    assert score == 0.2
+    assert source_ids(doc) == [c.metadata["id"] for c in chunks[:3]]
+    assert PAGE.startswith(doc.page_content)
+
+
+def test_only_consecutive_chunks_of_the_same_page_merge():
+    results = [(chunk("a.pdf:1:0", "one"), 0.1), (chunk("a.pdf:1:2", "three"), 0.2),
+               (chunk("a.pdf:2:1", "other page"), 0.3), (chunk("a.pdf:1:1", "two"), 0.4)]
+    merged = merge_adjacent(results)
+    assert [source_ids(doc) for doc, _ in merged] == [["a.pdf:1:0", "a.pdf:1:1", "a.pdf:1:2"], ["a.pdf:2:1"]]
+    assert merged[0][0].page_content == "one two three"
+
+
+def test_strip_overlap_ignores_short_coincidences():
+    assert strip_overlap("the end of a sentence", "sentence continues") == "sentence continues"
+    assert strip_overlap("shared tail text here", "shared tail text here and more") == " and more"
+
+
+def test_near_duplicates_keep_the_better_ranked_chunk():
+    results = [(chunk("first.pdf:1:0", "a"), 0.1), (chunk("second.pdf:9:4", "a again"), 0.2),
+               (chunk("third.pdf:2:0", "b"), 0.3)]
+    embeddings = {"first.pdf:1:0": [1.0, 0.0], "second.pdf:9:4": [0.99, 0.01], "third.pdf:2:0": [0.0, 1.0]}
+    kept = drop_near_duplicates(results, embeddings)
+    assert [doc.metadata["id"] for doc, _ in kept] == ["first.pdf:1:0", "third.pdf:2:0"]
+
+
+def test_compression_uses_stored_embeddings_and_fills_k(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=embeddings)
+    texts = {"old.pdf:1:0": "exam stress passage", "new.pdf:4:0": "exam stress passage",
+             "book.pdf:2:0": "sleep and rest", "book.pdf:7:0": "time management"}
+    db.add_documents([chunk(chunk_id, text) for chunk_id, text in texts.items()], ids=list(texts))
+    results = [(chunk(chunk_id, text), float(i)) for i, (chunk_id, text) in enumerate(texts.items())]
+
+    compressed = compress_results(db, results, k=3)
+    assert [doc.metadata["id"] for doc, _ in compressed] == ["old.pdf:1:0", "book.pdf:2:0", "book.pdf:7:0"]
+
+    bump_collection_version(str(tmp_path / "chroma"))
+    cache = RetrievalCache(chroma_path=str(tmp_path / "chroma"))
+    ids = [doc.metadata["id"] for doc, _ in cache.search(db, "exam stress passage", k=3)]
+    assert len(ids) == 3 and not {"old.pdf:1:0", "new.pdf:4:0"} <= set(ids)
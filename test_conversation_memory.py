@@ -0,0 +1,71 @@
+import threading
+
+from langchain_core.documents import Document
+
+from conversation_memory import (ConversationMemory, count_tokens, extractive_summary, fit_sections,
+                                 render_history)
+from interactive_chat import PROMPT_TEMPLATE
+
+
+def test_old_turns_are_summarized_and_recent_kept_verbatim():
+    memory = ConversationMemory(summarize=extractive_summary, recent_turns=2)
+    for i in range(5):
+        memory.append(f"Question number {i}. More detail here", f"Answer {i}")
+    assert memory.wait(5)
+    history = memory.render(budget=1000)
+    assert "Earlier in this conversation" in history
+    assert "Question number 0" in history and "Answer 0" not in history
+    assert "Student: Question number 4. More detail here\nMentor: Answer 4" in history
+
+
+def test_summary_runs_off_the_critical_path():
+    release = threading.Event()
+    calls = []
+
+    def slow_summarize(summary, turns):
+        release.wait(5)
+        calls.append(len(turns))
+        return "student is stressed"
+
+    memory = ConversationMemory(summarize=slow_summarize, recent_turns=1)
+    memory.append("first", "a")
+    memory.append("second", "b")  # starts a summary that blocks
+    memory.append("third", "c")
+    # render() doesn't wait: the unsummarized turns are still shown verbatim.
+    assert "Student: second" in memory.render(budget=1000)
+    release.set()
+    assert memory.wait(5)
+    assert sum(calls) == 2 and memory.summary == "student is stressed"
+    assert "Student: second" not in memory.render(budget=1000)
+
+
+def test_failed_summary_keeps_turns():
+    def broken(summary, turns):
+        raise RuntimeError("ollama down")
+
+    memory = ConversationMemory(summarize=broken, recent_turns=1)
+    memory.append("first", "a")
+    memory.append("second", "b")
+    assert memory.wait(5)
+    assert memory.summary == "" and len(memory) == 2
+
+
+def test_render_history_keeps_newest_within_budget():
+    turns = [f"Student: {'word ' * 40}{i}\nMentor: ok" for i in range(10)]
+    text = render_history(turns, budget=120)
+    assert count_tokens(text) <= 120
+    assert text.endswith("9\nMentor: ok") and "0\nMentor" not in text
+
+
+def test_prompt_stays_within_budget_as_sessions_grow():
+    results = [(Document(page_content="context " * 100, metadata={"id": f"book.pdf:1:{i}"}), 0.2) for i in range(4)]
+    memory = ConversationMemory(summarize=extractive_summary)
+    sizes = []
+    for turn in range(30):
+        context, history, used = fit_sections(PROMPT_TEMPLATE, results, memory, "How do I cope?", budget=800,
+                                              history_budget=200)
+        sizes.append(count_tokens(PROMPT_TEMPLATE.format(context=context, history=history, question="How do I cope?")))
+        assert used and used[0] is results[0]
+        memory.append(f"I keep worrying about exams, turn {turn}", "That sounds stressful. " * 10)
+        memory.wait(5)
+    assert max(sizes) <= 800
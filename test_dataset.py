@@ -0,0 +1,89 @@
+import csv
+import os
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import dataset
+from chroma_client import collection, open_chroma
+from dataset import (
+    calculate_chunk_ids,
+    iter_processed_files,
+    list_source_files,
+    load_documents,
+    split_documents,
+)
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["question", "answer"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def make_corpus(tmp_path):
+    for name in ["anxiety.csv", "stress.csv"]:
+        rows = [
+            {"question": f"{name} question {i}", "answer": "Breathing exercises help. " * (i + 1)}
+            for i in range(20)
+        ]
+        write_csv(tmp_path / name, rows)
+    return str(tmp_path)
+
+
+def test_parallel_ingestion_keeps_chunk_ids(tmp_path):
+    """Worker-pool ingestion must produce the same IDs as the serial path."""
+    data_path = make_corpus(tmp_path)
+    serial_ids = [
+        chunk.metadata["id"]
+        for chunk in calculate_chunk_ids(split_documents(load_documents([data_path])))
+    ]
+
+    parallel_ids = []
+    for _file_path, chunks, _seconds in iter_processed_files(list_source_files([data_path]), workers=2):
+        parallel_ids.extend(chunk.metadata["id"] for chunk in chunks)
+
+    assert sorted(parallel_ids) == sorted(serial_ids)
+    assert len(set(parallel_ids)) == len(parallel_ids)
+
+
+def test_collection_without_manifest_is_replaced_not_duplicated(tmp_path, monkeypatch):
+    """A DB built before the manifest existed must not keep its old chunks next to the new ones."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: DeterministicFakeEmbedding(size=16))
+    os.mkdir("data")
+    write_csv("data/stress.csv", [{"question": "What is stress?", "answer": "A response."}])
+    write_csv("data/gone.csv", [{"question": "Old question?", "answer": "Old answer."}])
+    dataset.ingest(["data"])
+    db = open_chroma(None)
+    # Old-style chunks under other IDs, and no manifest.
+    old = db.get(include=["embeddings", "metadatas", "documents"])
+    collection(db).upsert(ids=[f"legacy:{i}" for i in range(len(old["ids"]))], embeddings=list(old["embeddings"]),
+                         metadatas=old["metadatas"], documents=old["documents"])
+    db.delete(ids=old["ids"])
+    os.remove(dataset.MANIFEST_PATH)
+    os.remove("data/gone.csv")
+
+    dataset.ingest(["data"], dedupe=False)
+    stored = db.get(include=["metadatas"])
+    assert stored["ids"] == ["data/stress.csv:0:0"]
+
+
+def test_populate_dataset_add_to_chroma_updates_lexical_index_and_version(tmp_path, monkeypatch):
+    """The legacy entry point must go through the same commit hook as ingest()."""
+    import populate_dataset
+    from langchain_core.documents import Document
+
+    from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+    from retrieval_cache import read_collection_version
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: DeterministicFakeEmbedding(size=16))
+    chunks = [Document(page_content="Box breathing calms exam stress.", metadata={"source": "data/a.pdf", "page": 0})]
+
+    populate_dataset.add_to_chroma(chunks)
+
+    assert open_chroma(None).get(include=[])["ids"] == ["data/a.pdf:0:0"]
+    index = LexicalIndex(os.path.join(dataset.CHROMA_PATH, LEXICAL_INDEX_FILE))
+    assert [chunk_id for chunk_id, _score in index.search("breathing", 5)] == ["data/a.pdf:0:0"]
+    assert read_collection_version(dataset.CHROMA_PATH) != ""
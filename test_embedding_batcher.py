@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_batcher import BatchingEmbeddings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    forward_passes: int = 0
+
+    def embed_documents(self, texts):
+        self.forward_passes += 1
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_share_forward_passes():
+    model = CountingEmbeddings(size=8)
+    batcher = BatchingEmbeddings(model, max_batch_size=16, window_ms=50)
+    queries = [f"I can't sleep before exam {i}" for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        vectors = list(pool.map(batcher.embed_query, queries))
+
+    # Every caller gets its own vector back...
+    assert vectors == [model.embed_query(q) for q in queries]
+    # ...but far fewer model calls than queries were made.
+    stats = batcher.stats()
+    assert stats["requests"] == 32
+    assert stats["batches"] < 32
+    assert max(stats["batch_sizes"]) <= 16
+
+
+def test_errors_reach_every_caller():
+    class Broken(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            raise RuntimeError("model crashed")
+
+    batcher = BatchingEmbeddings(Broken(size=8), window_ms=1)
+    with pytest.raises(RuntimeError, match="model crashed"):
+        batcher.embed_query("hello")
@@ -0,0 +1,65 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_cache import CachedEmbeddings, cache_key
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embedder that remembers how many texts it actually encoded."""
+
+    encoded: int = 0
+
+    def embed_documents(self, texts):
+        self.encoded += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_cache_hits_survive_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    texts = ["Anxiety is future-oriented.", "Fear is a response to a present threat.", "Anxiety is future-oriented."]
+
+    model = CountingEmbeddings(size=16)
+    cached = CachedEmbeddings(model, model_name="fake", path=path)
+    first = cached.embed_documents(texts)
+    assert model.encoded == 2  # the repeated text is only encoded once
+    cached.close()
+
+    # A new process (think: after --reset) gets every vector from disk.
+    model = CountingEmbeddings(size=16)
+    cached = CachedEmbeddings(model, model_name="fake", path=path)
+    again = cached.embed_documents(texts)
+    assert model.encoded == 0
+    # Vectors are stored as float32, like sentence-transformers produces them.
+    for vector, expected in zip(again, first):
+        assert vector == pytest.approx(expected, rel=1e-6)
+    assert cached.stats()["hits"] == 3
+
+
+def test_cache_keys_include_model_name(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    CachedEmbeddings(CountingEmbeddings(size=16), model_name="model-a", path=path).embed_documents(["stress"])
+    model = CountingEmbeddings(size=16)
+    CachedEmbeddings(model, model_name="model-b", path=path).embed_documents(["stress"])
+    assert model.encoded == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cached = CachedEmbeddings(CountingEmbeddings(size=4), model_name="fake", path=str(tmp_path / "c.sqlite"), max_entries=2)
+    cached.embed_documents(["a"])
+    cached.embed_documents(["b"])
+    cached.embed_documents(["a"])  # "a" is now the most recently used
+    cached.embed_documents(["c"])
+    assert cached.stats()["entries"] == 2
+    cached.embed_documents(["a", "c"])
+    assert cached.stats()["misses"] == 3  # a, b, c; nothing after eviction of "b"
+
+
+def test_cache_does_not_count_rows_it_replaces(tmp_path):
+    cached = CachedEmbeddings(CountingEmbeddings(size=4), model_name="fake", path=str(tmp_path / "c.sqlite"), max_entries=2)
+    cached.embed_documents(["a"])
+    # Another process embedded "a" between our lookup and our write.
+    cached._store({cache_key("fake", "a"): [0.0] * 4}, [])
+    assert cached.stats()["entries"] == 1
+    cached.embed_documents(["b"])
+    cached.embed_documents(["a", "b"])
+    assert cached.stats()["misses"] == 2  # nothing was evicted early
@@ -1,49 +1,23 @@
 import pytest
-from langchain_ollama import OllamaLLM
-from langchain_chroma import Chroma
-from get_embedding_function import get_embedding_function
-from query_data import query_rag
-
-# --- CONFIGURATION ---
-CHROMA_PATH = "chroma"
+from evaluation import generate, load_resources, shared_cache, shared_judge
 
 # --- SETUP RESOURCES ---
-# We initialize these once to avoid reloading for every test
+# Loaded once per test session (embedder, vector store, Mistral) and shared by
+# every test. Set EVAL_MODEL=stub / EVAL_JUDGE=stub to run without Ollama.
 def get_resources():
-    embedding_function = get_embedding_function()
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-    model = OllamaLLM(model="mistral")
-    return db, model
+    return load_resources()
 
 # --- EMPATHY EVALUATION ---
-JUDGE_PROMPT = """
-You are a Tone Analyzer for a mental health chatbot.
-Analyze the following interaction.
-
-User Input: "{user_input}"
-Mentor's Response: "{response}"
-
-Does this response meet the following criteria?
-1. It validates the user's feelings appropriate to the intensity of the input.
-2. It uses non-clinical, warm language (not "The subject is experiencing...").
-3. It avoids judging or diagnosing.
-4. It avoids dismissive toxic positivity (e.g., "Don't worry", "Just be happy", "Calm down").
-
-Reply with ONLY the word 'PASS' if it meets all criteria, or 'FAIL' if it sounds robotic, cold, dismissive, or clinical.
-"""
-
 def evaluate_tone(user_input, response_text):
-    model = OllamaLLM(model="mistral")
-    prompt = JUDGE_PROMPT.format(user_input=user_input, response=response_text)
-    grade = model.invoke(prompt).strip().upper()
-    return "PASS" in grade
+    # One shared judge; verdicts for an unchanged response come from eval_cache.sqlite.
+    judge = shared_judge()
+    return shared_cache().verdict(
+        judge.name, "tone", user_input, None, response_text, lambda: judge.tone(user_input, response_text)
+    )
 
 def run_query(query, db, model):
-    """Helper to run query and handle tuple return format."""
-    result = query_rag(query, db, model)
-    if isinstance(result, tuple):
-        return str(result[0])
-    return str(result)
+    """Generate (or reuse the cached) answer for this query."""
+    return generate(query, db, model, shared_cache())
 
 def test_tone_loneliness():
     db, model = get_resources()
@@ -0,0 +1,67 @@
+import time
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmark import StubLLM
+from evaluation import EVAL_CASES, EvalCache, StubJudge, run_evaluation
+
+
+class CountingLLM(StubLLM):
+    calls: int = 0
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return super()._call(prompt, stop, run_manager, **kwargs)
+
+
+class CountingJudge(StubJudge):
+    def __init__(self):
+        self.calls = 0
+
+    def tone(self, question, response):
+        self.calls += 1
+        return super().tone(question, response)
+
+    def concept(self, question, expected, response):
+        self.calls += 1
+        return super().concept(question, expected, response)
+
+
+def make_db(tmp_path):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=8))
+    db.add_documents(
+        [Document(page_content="Fear reacts to immediate danger; anxiety anticipates future threats.",
+                  metadata={"id": "book.pdf:0:0"})],
+        ids=["book.pdf:0:0"],
+    )
+    return db
+
+
+def test_rerun_is_served_from_cache(tmp_path):
+    db = make_db(tmp_path)
+    model = CountingLLM(first_token_seconds=0.05, token_seconds=0)
+    judge = CountingJudge()
+    cache = EvalCache(str(tmp_path / "eval_cache.sqlite"))
+
+    start = time.perf_counter()
+    first = run_evaluation(EVAL_CASES, db, model, judge, cache, workers=len(EVAL_CASES))
+    elapsed = time.perf_counter() - start
+    # Cases ran side by side, not one 50 ms generation after another.
+    assert elapsed < 0.05 * len(EVAL_CASES)
+    assert model.calls == len(EVAL_CASES)
+    judged = judge.calls
+
+    again = run_evaluation(EVAL_CASES, db, model, judge, EvalCache(str(tmp_path / "eval_cache.sqlite")), workers=2)
+    assert model.calls == len(EVAL_CASES) and judge.calls == judged
+    assert [r["passed"] for r in again] == [r["passed"] for r in first]
+
+
+def test_stub_judge_flags_toxic_positivity_and_missing_concepts():
+    judge = StubJudge()
+    assert not judge.tone("I failed", "Don't worry, everything will be fine!")
+    assert judge.tone("I failed", "That sounds painful, and it makes sense to feel discouraged.")
+    expected = "Fear is a reaction to immediate danger, while anxiety is a concern about future threats."
+    assert judge.concept("q", expected, "Fear responds to danger right now; anxiety is concern about future threats.")
+    assert not judge.concept("q", expected, "Try to get more sleep.")
@@ -0,0 +1,51 @@
+import json
+import os
+
+from ingest_manifest import IngestManifest, file_hash
+
+
+def test_manifest_skips_unchanged_and_tracks_edits(tmp_path):
+    manifest_path = str(tmp_path / "chroma" / "ingest_manifest.json")
+    book = tmp_path / "book.csv"
+    notes = tmp_path / "notes.csv"
+    book.write_text("question,answer\nWhat is CBT?,A therapy\n")
+    notes.write_text("question,answer\nWhat is stress?,A response\n")
+    files = [str(book), str(notes)]
+
+    manifest = IngestManifest(manifest_path)
+    changed, removed = manifest.plan(files)
+    assert changed == files and removed == []
+    for file_path in changed:
+        manifest.record(file_path, num_chunks=1)
+    manifest.save()
+
+    # A fresh process sees nothing to do.
+    manifest = IngestManifest(manifest_path)
+    assert manifest.plan(files) == ([], [])
+
+    # Touching a file without editing it is not a change.
+    os.utime(book, (0, 12345))
+    assert manifest.plan(files) == ([], [])
+
+    # Editing one file and deleting the other.
+    book.write_text("question,answer\nWhat is CBT?,Cognitive behavioural therapy\n")
+    changed, removed = manifest.plan([str(book)])
+    assert changed == [str(book)]
+    assert removed == [str(notes)]
+
+
+def test_unversioned_manifest_reingests_its_files(tmp_path):
+    manifest_path = tmp_path / "ingest_manifest.json"
+    faq = tmp_path / "faq.csv"
+    faq.write_text("id,question\nq1,What is CBT?\n")
+    stat = os.stat(faq)
+    # Written before chunk IDs used the row ID: the same bytes now get other IDs.
+    manifest_path.write_text(json.dumps(
+        {str(faq): {"sha256": file_hash(str(faq)), "size": stat.st_size, "mtime": stat.st_mtime, "chunks": 1}}))
+
+    manifest = IngestManifest(str(manifest_path))
+    assert manifest.plan([str(faq)]) == ([str(faq)], [])
+    assert manifest.needs_reset(str(faq))
+    manifest.record(str(faq), num_chunks=1)
+    manifest.save()
+    assert IngestManifest(str(manifest_path)).plan([str(faq)]) == ([], [])
@@ -0,0 +1,58 @@
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ingest_pipeline import run_pipeline
+
+
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    """Fake embedder that dies after a set number of batches, like a crashed ingest."""
+
+    fail_after: int = -1
+    calls: int = 0
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        if self.calls == self.fail_after:
+            raise RuntimeError("simulated crash")
+        self.calls += 1
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def make_batches(num_batches, batch_size):
+    for b in range(num_batches):
+        chunks = [
+            Document(page_content=f"passage {b}-{i}", metadata={"source": "book.pdf", "page": b, "id": f"book.pdf:{b}:{i}"})
+            for i in range(batch_size)
+        ]
+        finished = [("book.pdf", num_batches * batch_size)] if b == num_batches - 1 else []
+        yield chunks, finished
+
+
+def test_pipeline_resumes_after_crash(tmp_path):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=8))
+    committed = []
+
+    flaky = FlakyEmbeddings(size=8, fail_after=3)
+    with pytest.raises(RuntimeError):
+        run_pipeline(make_batches(6, 10), db, flaky, queue_size=1, on_commit=committed.extend)
+    assert db._collection.count() == 30
+    assert committed == []
+
+    resumed = FlakyEmbeddings(size=8)
+    stats = run_pipeline(make_batches(6, 10), db, resumed, queue_size=1, on_commit=committed.extend)
+    assert db._collection.count() == 60
+    assert resumed.embedded == 30
+    assert stats["skipped"] == 30
+    assert committed == [("book.pdf", 60)]
+
+
+def test_repeated_ids_in_one_batch_keep_the_first(tmp_path):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=8))
+    chunks = [Document(page_content=text, metadata={"source": "faq.csv", "row": "q1", "id": "faq.csv:q1:0"})
+              for text in ["first answer", "second answer"]]
+    stats = run_pipeline(iter([(chunks, [("faq.csv", 2)])]), db, DeterministicFakeEmbedding(size=8))
+    assert db.get(ids=["faq.csv:q1:0"])["documents"] == ["first answer"]
+    assert stats["repeated_ids"] == 1 and stats["skipped"] == 0
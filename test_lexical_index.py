@@ -0,0 +1,159 @@
+import math
+import random
+import sqlite3
+from collections import Counter
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from hybrid_search import hybrid_search, reciprocal_rank_fusion
+import lexical_index
+from lexical_index import BM25_B, BM25_K1, LEXICAL_INDEX_FILE, LexicalIndex, tokenize
+from retrieval_cache import RetrievalCache, bump_collection_version
+
+PASSAGES = {
+    "book.pdf:0:0": "Students often feel anxious before exams and struggle to sleep.",
+    "book.pdf:0:1": "Cognitive behavioural therapy (CBT) helps students reframe anxious thoughts.",
+    "book.pdf:1:0": "Seligman described learned helplessness in experiments with dogs.",
+    "book.pdf:1:1": "Regular exercise and sleep improve mood and concentration.",
+    "book.pdf:2:0": "Procrastination is often a way of avoiding uncomfortable feelings.",
+}
+
+
+def make_index(tmp_path):
+    index = LexicalIndex(str(tmp_path / LEXICAL_INDEX_FILE))
+    index.add(list(PASSAGES), list(PASSAGES.values()))
+    return index
+
+
+def test_exact_terms_rank_first(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search("what is CBT?", k=3)[0][0] == "book.pdf:0:1"
+    assert index.search("learned helplessness", k=3)[0][0] == "book.pdf:1:0"
+    assert index.search("Seligman", k=3)[0][0] == "book.pdf:1:0"
+    assert index.search("the of and", k=3) == []
+
+
+def test_incremental_updates_match_a_fresh_build(tmp_path):
+    index = make_index(tmp_path)
+    index.remove(["book.pdf:0:1"])
+    index.add(["book.pdf:2:0"], ["Procrastination and CBT worksheets."])
+    assert len(index) == 4
+
+    fresh = LexicalIndex(str(tmp_path / "fresh.sqlite"))
+    texts = dict(PASSAGES)
+    del texts["book.pdf:0:1"]
+    texts["book.pdf:2:0"] = "Procrastination and CBT worksheets."
+    fresh.add(list(texts), list(texts.values()))
+
+    for query in ["CBT", "anxious students sleep", "procrastination"]:
+        assert index.search(query, k=5) == fresh.search(query, k=5)
+    assert index.search("CBT", k=5)[0][0] == "book.pdf:2:0"
+
+
+def brute_force_bm25(texts, query, k):
+    docs = {chunk_id: Counter(tokenize(text)) for chunk_id, text in texts.items()}
+    avg_length = sum(sum(counts.values()) for counts in docs.values()) / len(docs)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(term in counts for counts in docs.values())
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for chunk_id, counts in docs.items():
+            if term in counts:
+                length = sum(counts.values())
+                tf = counts[term]
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+    return sorted(scores.items(), key=lambda hit: (-hit[1], hit[0]))[:k]
+
+
+def assert_same_hits(hits, expected):
+    assert [chunk_id for chunk_id, _ in hits] == [chunk_id for chunk_id, _ in expected]
+    assert all(math.isclose(a, b) for (_, a), (_, b) in zip(hits, expected))
+
+
+def test_early_termination_returns_the_exact_top_k(tmp_path, monkeypatch):
+    # Tiny blocks, so search stops part-way through the common terms' postings.
+    monkeypatch.setattr(lexical_index, "POSTINGS_BLOCK", 4)
+    rng = random.Random(0)
+    vocabulary = ["stress"] * 8 + ["exam"] * 5 + ["anxiety"] * 4 + ["sleep"] * 3 + [f"w{i}" for i in range(40)]
+    texts = {f"doc.pdf:{i}:0": " ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 40))) for i in range(300)}
+    index = LexicalIndex(str(tmp_path / LEXICAL_INDEX_FILE))
+    chunk_ids = list(texts)
+    # Several batches, so impacts were written with different average lengths.
+    for i in range(0, len(chunk_ids), 70):
+        index.add(chunk_ids[i:i + 70], [texts[chunk_id] for chunk_id in chunk_ids[i:i + 70]])
+    for query in ["stress", "exam anxiety stress", "sleep w3", "stress exam anxiety sleep"]:
+        assert_same_hits(index.search(query, k=10), brute_force_bm25(texts, query, 10))
+
+
+def test_index_without_impacts_is_upgraded(tmp_path):
+    path = str(tmp_path / LEXICAL_INDEX_FILE)
+    make_index(tmp_path).close()
+    with sqlite3.connect(path) as conn:
+        # The layout before postings carried their impact.
+        conn.execute("DROP INDEX postings_by_impact")
+        conn.execute("ALTER TABLE postings DROP COLUMN impact")
+        conn.execute("DELETE FROM meta WHERE key = 'impact_avg_length'")
+    index = LexicalIndex(path)
+    for query in ["what is CBT?", "anxious students sleep", "learned helplessness"]:
+        assert_same_hits(index.search(query, k=3), brute_force_bm25(PASSAGES, query, 3))
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion(["a", "b", "c"], ["b"]) == ["b", "a", "c"]
+
+
+def test_hybrid_search_surfaces_lexical_hits_with_true_distances(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=embeddings)
+    db.add_documents(
+        [Document(page_content=text, metadata={"id": chunk_id}) for chunk_id, text in PASSAGES.items()],
+        ids=list(PASSAGES),
+    )
+    index = LexicalIndex(str(tmp_path / "chroma" / LEXICAL_INDEX_FILE))
+    index.add(list(PASSAGES), list(PASSAGES.values()))
+
+    query = "learned helplessness"
+    embedding = embeddings.embed_query(query)
+    results = hybrid_search(db, index, query, embedding, k=2)
+    assert "book.pdf:1:0" in [doc.metadata["id"] for doc, _score in results]
+
+    # Distances agree with what Chroma itself reports for the same chunks.
+    reference = dict(
+        (doc.metadata["id"], score)
+        for doc, score in db.similarity_search_by_vector_with_relevance_scores(embedding, k=len(PASSAGES))
+    )
+    for doc, score in results:
+        assert abs(score - reference[doc.metadata["id"]]) < 1e-3
+
+    # The retrieval cache picks up the index sitting next to the collection.
+    bump_collection_version(str(tmp_path / "chroma"))
+    cache = RetrievalCache(chroma_path=str(tmp_path / "chroma"), compress=False)
+    assert [doc.metadata["id"] for doc, _ in cache.search(db, query, k=2)] == \
+        [doc.metadata["id"] for doc, _ in results]
+
+
+def test_repeated_ids_in_one_batch_keep_the_last_text(tmp_path):
+    index = LexicalIndex(str(tmp_path / LEXICAL_INDEX_FILE))
+    index.add(["qa.csv:q-1:0", "qa.csv:q-1:0"], ["Sleep hygiene basics.", "Exam anxiety tips."])
+    assert len(index) == 1
+    assert index.search("anxiety", k=3)[0][0] == "qa.csv:q-1:0"
+    assert index.search("sleep", k=3) == []
+
+
+def test_relevance_uses_the_closest_fused_hit(monkeypatch):
+    import interactive_chat
+    from conversation_memory import ConversationMemory
+
+    lexical_only = Document(page_content="Seligman and learned helplessness.", metadata={"id": "book.pdf:1:0"})
+    close = Document(page_content="Helplessness after failing exams.", metadata={"id": "book.pdf:1:1"})
+    # BM25 ranked a chunk first whose embedding is far from the query.
+    monkeypatch.setattr(interactive_chat.retrieval_cache, "search", lambda db, query, k: [(lexical_only, 1.4),
+                                                                                          (close, 0.2)])
+    monkeypatch.setattr(interactive_chat, "RELEVANCE_THRESHOLDS", {"l2": 0.7})
+    db = type("Store", (), {"space": "l2"})()
+    _prompt, sources, is_relevant = interactive_chat.build_prompt("learned helplessness", ConversationMemory(), db)
+    assert is_relevant
+    assert sorted(sources) == ["book.pdf:1:0", "book.pdf:1:1"]
@@ -0,0 +1,17 @@
+from langchain_core.language_models.fake import FakeStreamingListLLM
+
+from llm_streaming import TimedStream
+
+
+def test_timed_stream_yields_tokens_and_measures_latency():
+    model = FakeStreamingListLLM(responses=["It makes sense to feel that way."], sleep=0.01)
+    stream = TimedStream(model, "prompt")
+
+    tokens = list(stream)
+
+    assert "".join(tokens) == "It makes sense to feel that way."
+    assert stream.text == "It makes sense to feel that way."
+    assert 0 < stream.ttft <= stream.total
+    # The stub sleeps before every character, so the whole answer takes far
+    # longer than the first token.
+    assert stream.total > 5 * stream.ttft
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import threading
+from typing import Any, List, Optional
+
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake import FakeListLLM, FakeStreamingListLLM
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from conversation_memory import RECENT_TURNS
+from mentor_server import SERVICE, create_app
+
+
+def make_db(tmp_path):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=8))
+    db.add_documents(
+        [Document(page_content="Loneliness is common in the first year of college.", metadata={"id": "book.pdf:3:0"})],
+        ids=["book.pdf:3:0"],
+    )
+    return db
+
+
+def run(tmp_path, model, scenario, **service_kwargs):
+    async def main():
+        app = create_app(make_db(tmp_path), model, **service_kwargs)
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+def test_chat_keeps_per_session_history(tmp_path):
+    model = FakeStreamingListLLM(responses=["That sounds really hard.", "You're not alone in this."])
+
+    async def scenario(client):
+        first = await (await client.post("/chat", json={"message": "I feel alone in my dorm"})).json()
+        second = await (await client.post("/chat", json={"message": "Still lonely", "session_id": first["session_id"]})).json()
+        return first, second, client.server.app[SERVICE].sessions[first["session_id"]]
+
+    first, second, history = run(tmp_path, model, scenario)
+    assert first["response"] == "That sounds really hard."
+    assert second["response"] == "You're not alone in this."
+    assert len(history) == 2 and "I feel alone in my dorm" in history.render()
+
+
+def test_chat_streams_ndjson(tmp_path):
+    model = FakeStreamingListLLM(responses=["It makes sense."])
+
+    async def scenario(client):
+        resp = await client.post("/chat", json={"message": "Midterms are stressing me", "stream": True})
+        return [json.loads(line) for line in (await resp.text()).splitlines()]
+
+    lines = run(tmp_path, model, scenario)
+    assert "".join(line["token"] for line in lines[:-1]) == "It makes sense."
+    assert lines[-1]["done"] is True
+
+
+def test_crisis_message_never_reaches_llm(tmp_path):
+    model = FakeStreamingListLLM(responses=["should not be used"])
+
+    async def scenario(client):
+        return await (await client.post("/chat", json={"message": "I want to end it all"})).json()
+
+    body = run(tmp_path, model, scenario)
+    assert body["crisis"] is True
+    assert model.i == 0
+
+
+def test_streamed_crisis_reply_is_ndjson(tmp_path):
+    model = FakeStreamingListLLM(responses=["should not be used"])
+
+    async def scenario(client):
+        resp = await client.post("/chat", json={"message": "I want to end it all", "stream": True})
+        return resp.headers["Content-Type"], [json.loads(line) for line in (await resp.text()).splitlines()]
+
+    content_type, lines = run(tmp_path, model, scenario)
+    assert content_type == "application/x-ndjson"
+    assert "988" in lines[0]["token"]
+    assert lines[-1]["done"] is True and lines[-1]["crisis"] is True
+    assert model.i == 0
+
+
+class HeldLLM(LLM):
+    """Streams one answer once `release` is set; sets `started` when generation begins."""
+
+    started: Any = None
+    release: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "held"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        raise NotImplementedError
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.started.set()
+        await self.release.wait()
+        yield GenerationChunk(text="A slow, thoughtful answer.")
+
+
+def test_saturated_server_answers_429(tmp_path):
+    model = HeldLLM(started=asyncio.Event(), release=asyncio.Event())
+
+    async def scenario(client):
+        slow = asyncio.create_task(client.post("/chat", json={"message": "Exams are coming up fast"}))
+        # The only slot is held until we release it.
+        await model.started.wait()
+        rejected = await client.post("/chat", json={"message": "Can you help with procrastination"})
+        model.release.set()
+        return rejected.status, (await slow).status
+
+    rejected_status, slow_status = run(tmp_path, model, scenario, max_concurrency=1, max_queue=0)
+    assert rejected_status == 429
+    assert slow_status == 200
+
+
+def test_session_id_must_be_a_string(tmp_path):
+    model = FakeStreamingListLLM(responses=["should not be used"])
+
+    async def scenario(client):
+        bad_id = await client.post("/chat", json={"message": "Hello", "session_id": ["a", "b"]})
+        not_an_object = await client.post("/chat", json=["Hello"])
+        return bad_id.status, not_an_object.status
+
+    assert run(tmp_path, model, scenario) == (400, 400)
+    assert model.i == 0
+
+
+def test_summaries_wait_for_a_generation_slot(tmp_path):
+    model = FakeListLLM(responses=["The student is stressed about exams."])
+
+    async def scenario(client):
+        service = client.server.app[SERVICE]
+        history = service.history("student")
+        await service._slots.acquire()
+        for i in range(RECENT_TURNS + 1):
+            history.append(f"question {i}", f"answer {i}")
+        summarized_while_held = await asyncio.to_thread(history.wait, 0.3)
+        service.release()
+        return summarized_while_held, await asyncio.to_thread(history.wait, 5), history.summary
+
+    summarized_while_held, summarized, summary = run(tmp_path, model, scenario, max_concurrency=1)
+    assert not summarized_while_held
+    assert summarized and summary == "The student is stressed about exams."
+
+
+def test_metrics_report_every_stage_of_a_turn(tmp_path):
+    model = FakeStreamingListLLM(responses=["It makes sense."])
+
+    async def scenario(client):
+        await client.post("/chat", json={"message": "Midterms are stressing me"})
+        return await (await client.get("/metrics")).json()
+
+    stages = run(tmp_path, model, scenario)["stages"]
+    for stage in ("crisis_check", "embed", "search", "retrieval", "prompt", "llm_first_token", "llm_total"):
+        assert stages[stage]["count"] >= 1
+        assert stages[stage]["p50_ms"] <= stages[stage]["p99_ms"]
+
+
+def test_requests_still_retrieving_count_against_the_queue(tmp_path, monkeypatch):
+    model = HeldLLM(started=asyncio.Event(), release=asyncio.Event())
+    retrieving = []
+    second_retrieving = threading.Event()
+    finish_retrieval = threading.Event()
+
+    def held_build_prompt(query_text, history, db, session=None):
+        retrieving.append(query_text)
+        if len(retrieving) == 2:
+            second_retrieving.set()
+            finish_retrieval.wait(5)
+        return "prompt", [], True
+
+    monkeypatch.setattr("mentor_server.build_prompt", held_build_prompt)
+
+    async def scenario(client):
+        generating = asyncio.create_task(client.post("/chat", json={"message": "Exams are coming up fast"}))
+        await model.started.wait()
+        queued = asyncio.create_task(client.post("/chat", json={"message": "I keep procrastinating"}))
+        await asyncio.to_thread(second_retrieving.wait, 5)
+        # The second request is still in retrieval, but it already holds the only queue place.
+        rejected = await client.post("/chat", json={"message": "Can you help with sleep"})
+        finish_retrieval.set()
+        model.release.set()
+        return rejected.status, (await generating).status, (await queued).status
+
+    rejected_status, *accepted = run(tmp_path, model, scenario, max_concurrency=1, max_queue=1)
+    assert rejected_status == 429
+    assert accepted == [200, 200]
+    assert len(retrieving) == 2
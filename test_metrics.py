@@ -0,0 +1,45 @@
+import json
+import random
+import time
+import urllib.request
+
+from metrics import LatencyHistogram, Metrics, metrics, serve_metrics
+
+
+def test_percentiles_are_within_bucket_error():
+    histogram = LatencyHistogram()
+    samples = [random.uniform(0.001, 2.0) for _ in range(20_000)]
+    for seconds in samples:
+        histogram.observe(seconds)
+    samples.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = samples[int(q * len(samples)) - 1]
+        assert abs(histogram.quantile(q) - exact) <= 0.1 * exact
+    assert histogram.summary()["count"] == 20_000
+    assert histogram.quantile(1.0) == max(samples)
+
+
+def test_timer_records_stages_cheaply():
+    registry = Metrics()
+    n = 20_000
+    start = time.perf_counter()
+    for _ in range(n):
+        with registry.timer("noop"):
+            pass
+    per_call = (time.perf_counter() - start) / n
+    assert registry.snapshot()["stages"]["noop"]["count"] == n
+    # Cheap enough to leave on for every turn.
+    assert per_call < 50e-6
+
+
+def test_metrics_endpoint_serves_snapshot():
+    metrics.observe("test_stage", 0.25)
+    server = serve_metrics(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 240 <= body["stages"]["test_stage"]["p50_ms"] <= 260
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from mmap_store import MmapVectorStore, export
+from retrieval_cache import bump_collection_version
+
+
+def make_db(tmp_path, n=300):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=32))
+    db.add_documents(
+        [Document(page_content=f"passage {i} about coping", metadata={"id": f"book.pdf:{i}:0", "page": i})
+         for i in range(n)],
+        ids=[f"book.pdf:{i}:0" for i in range(n)],
+    )
+    bump_collection_version(str(tmp_path / "chroma"))
+    return db
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_rescored_search_matches_chroma(tmp_path, dtype):
+    db = make_db(tmp_path)
+    export(db, str(tmp_path / "chroma"), dtype=dtype)
+    store = MmapVectorStore(db.embeddings, str(tmp_path / "chroma"))
+
+    for query in ["exam stress", "trouble sleeping", "feeling lonely"]:
+        embedding = db.embeddings.embed_query(query)
+        expected = db.similarity_search_by_vector_with_relevance_scores(embedding, k=5)
+        got = store.similarity_search_by_vector_with_relevance_scores(embedding, k=5)
+        assert [doc.metadata["id"] for doc, _ in got] == [doc.metadata["id"] for doc, _ in expected]
+        assert np.allclose([score for _, score in got], [score for _, score in expected], rtol=1e-3, atol=1e-3)
+        assert got[0][0].page_content == expected[0][0].page_content
+
+
+def test_quantized_only_search_is_close(tmp_path):
+    db = make_db(tmp_path)
+    export(db, str(tmp_path / "chroma"), dtype="int8", full=False)
+    store = MmapVectorStore(db.embeddings, str(tmp_path / "chroma"))
+
+    embedding = db.embeddings.embed_query("exam stress")
+    expected = {doc.metadata["id"] for doc, _ in db.similarity_search_by_vector_with_relevance_scores(embedding, k=10)}
+    got = {doc.metadata["id"] for doc, _ in store.similarity_search_by_vector_with_relevance_scores(embedding, k=10)}
+    assert len(expected & got) >= 8
+
+
+def test_get_and_remap_after_reexport(tmp_path):
+    db = make_db(tmp_path, n=20)
+    export(db, str(tmp_path / "chroma"))
+    store = MmapVectorStore(db.embeddings, str(tmp_path / "chroma"))
+    found = store.get(ids=["book.pdf:3:0", "missing"], include=["documents", "metadatas", "embeddings"])
+    assert found["ids"] == ["book.pdf:3:0"]
+    assert found["metadatas"][0]["page"] == 3
+    assert found["embeddings"].shape == (1, 32)
+
+    db.add_documents([Document(page_content="a new passage", metadata={"id": "new.pdf:0:0"})], ids=["new.pdf:0:0"])
+    bump_collection_version(str(tmp_path / "chroma"))
+    export(db, str(tmp_path / "chroma"))
+    embedding = db.embeddings.embed_query("a new passage")
+    assert store.similarity_search_by_vector_with_relevance_scores(embedding, k=1)[0][0].id == "new.pdf:0:0"
+
+
+def test_searches_run_concurrently(tmp_path, monkeypatch):
+    import threading
+
+    db = make_db(tmp_path, n=50)
+    export(db, str(tmp_path / "chroma"))
+    store = MmapVectorStore(db.embeddings, str(tmp_path / "chroma"))
+    both_scanning = threading.Barrier(2, timeout=5)
+    scan = MmapVectorStore._approximate
+
+    def waiting_scan(export, query, n):
+        both_scanning.wait()  # raises BrokenBarrierError if the scans are serialized
+        return scan(export, query, n)
+
+    monkeypatch.setattr(MmapVectorStore, "_approximate", staticmethod(waiting_scan))
+    embedding = db.embeddings.embed_query("exam stress")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        store.similarity_search_by_vector_with_relevance_scores(embedding, k=3))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 2 and results[0] == results[1]
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from tokenizers.processors import TemplateProcessing
+
+from get_embedding_function import get_embedding_function
+from onnx_embeddings import OnnxEmbeddings, parity
+
+WORDS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "exam", "stress", "sleep", "is", "hard", "before", "tests", "i", "cannot"]
+
+
+def make_tokenizer():
+    tokenizer = Tokenizer(WordLevel({word: i for i, word in enumerate(WORDS)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.post_processor = TemplateProcessing(single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)])
+    return tokenizer
+
+
+class TableSession:
+    """Stands in for the encoder: each token's hidden state is a fixed row, so pooling is checkable."""
+
+    def __init__(self, dim=6):
+        self.table = np.random.default_rng(0).standard_normal((len(WORDS), dim)).astype(np.float32)
+        self.batches = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def run(self, outputs, feed):
+        assert set(feed) == {"input_ids", "attention_mask"}
+        self.batches.append(feed["input_ids"].shape)
+        return [self.table[feed["input_ids"]]]
+
+
+def expected_vector(session, text):
+    ids = make_tokenizer().encode(text).ids
+    pooled = session.table[ids].mean(axis=0)
+    return pooled / np.linalg.norm(pooled)
+
+
+TEXTS = ["stress", "i cannot sleep before tests", "exam", "exam stress is hard", "sleep", "tests"]
+
+
+def test_mean_pooling_ignores_padding():
+    session = TableSession()
+    embeddings = OnnxEmbeddings(session=session, tokenizer=make_tokenizer(), batch_size=3)
+    vectors = embeddings.embed_documents(TEXTS)
+    for text, vector in zip(TEXTS, vectors):
+        np.testing.assert_allclose(vector, expected_vector(session, text), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(embeddings.embed_query("exam stress is hard"), vectors[3], rtol=1e-6)
+
+
+def test_length_sorted_batches_pad_less_and_keep_order():
+    unsorted = OnnxEmbeddings(session=TableSession(), tokenizer=make_tokenizer(), batch_size=3, sort_by_length=False)
+    by_length = OnnxEmbeddings(session=TableSession(), tokenizer=make_tokenizer(), batch_size=3)
+    np.testing.assert_allclose(by_length.embed_documents(TEXTS), unsorted.embed_documents(TEXTS), rtol=1e-5)
+    assert by_length.tokens == unsorted.tokens
+    assert by_length.padding_ratio() < unsorted.padding_ratio()
+    # Short texts batched together, long ones together.
+    assert by_length.session.batches == [(3, 3), (3, 7)]
+
+
+def test_truncates_to_max_seq_length():
+    session = TableSession()
+    embeddings = OnnxEmbeddings(session=session, tokenizer=make_tokenizer(), max_seq_length=4)
+    embeddings.embed_documents(["exam stress is hard before tests"])
+    assert session.batches == [(1, 4)]
+
+
+def test_parity_reports_cosines():
+    a = [[1.0, 0.0], [0.0, 1.0]]
+    assert parity(a, a) == pytest.approx((1.0, 1.0))
+    assert parity(a, [[1.0, 0.0], [1.0, 1.0]])[0] == pytest.approx(2 ** -0.5)
+
+
+def test_provider_selection(tmp_path, monkeypatch):
+    with pytest.raises(ValueError):
+        get_embedding_function(provider="tensorflow")
+    # No model downloaded here.
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError, match="--download"):
+        get_embedding_function(provider="onnx-int8")
@@ -0,0 +1,101 @@
+import importlib
+import json
+import os
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def ocr(monkeypatch):
+    """pdf_2_text with pdf2image and Tesseract replaced by fakes that record what they were asked for.
+
+    A "page image" is just its page number, and its OCR text is "page N".
+    """
+    calls = []
+    pdf2image = types.ModuleType("pdf2image")
+    pdf2image.pdfinfo_from_path = lambda path: {"Pages": 19}
+
+    def convert_from_path(path, first_page, last_page):
+        calls.append((first_page, last_page))
+        return list(range(first_page, last_page + 1))
+
+    pdf2image.convert_from_path = convert_from_path
+    pytesseract = types.ModuleType("pytesseract")
+    pytesseract.image_to_string = lambda image: f"page {image}"
+    monkeypatch.setitem(sys.modules, "pdf2image", pdf2image)
+    monkeypatch.setitem(sys.modules, "pytesseract", pytesseract)
+    monkeypatch.delitem(sys.modules, "pdf_2_text", raising=False)
+    module = importlib.import_module("pdf_2_text")
+    module.calls = calls
+    yield module
+    sys.modules.pop("pdf_2_text", None)
+
+
+@pytest.fixture
+def scan(tmp_path):
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(b"%PDF-1.4 scanned")
+    return str(path)
+
+
+def test_pages_are_streamed_in_order_by_range(ocr, scan):
+    pages = ocr.iter_ocr_text(scan, workers=1, cache_dir="")
+    assert next(pages) == "page 1"
+    # Only the first range has been rasterized so far.
+    assert ocr.calls == [(1, 8)]
+    assert list(pages) == [f"page {i}" for i in range(2, 20)]
+    assert ocr.calls == [(1, 8), (9, 16), (17, 19)]
+
+
+def test_sidecar_is_reused_until_the_pdf_changes(ocr, scan):
+    assert len(list(ocr.iter_ocr_text(scan, workers=1, cache_dir=""))) == 19
+    with open(f"{scan}.ocr.json", "r", encoding="utf-8") as f:
+        assert json.load(f)[0] == "page 1"
+    ocr.calls.clear()
+    assert len(list(ocr.iter_ocr_text(scan, workers=1, cache_dir=""))) == 19
+    assert ocr.calls == []
+
+    os.utime(scan, (os.path.getmtime(scan) + 10,) * 2)
+    list(ocr.iter_ocr_text(scan, workers=1, cache_dir=""))
+    assert len(ocr.calls) == 3
+
+
+def test_interrupted_ocr_is_not_cached(ocr, scan):
+    pages = ocr.iter_ocr_text(scan, workers=1, cache_dir="")
+    next(pages)
+    pages.close()
+    assert not os.path.exists(f"{scan}.ocr.json")
+
+
+def test_cache_dir_keeps_the_data_folder_untouched(ocr, scan, tmp_path):
+    cache_dir = str(tmp_path / "ocr_cache")
+    list(ocr.iter_ocr_text(scan, workers=1, cache_dir=cache_dir))
+    assert not os.path.exists(f"{scan}.ocr.json")
+    assert os.path.exists(ocr.ocr_cache_path(scan, cache_dir))
+    # Same file name in another folder gets its own cache file.
+    assert ocr.ocr_cache_path(scan, cache_dir) != ocr.ocr_cache_path(str(tmp_path / "other" / "scan.pdf"), cache_dir)
+
+
+def test_force_reruns_ocr(ocr, scan, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    argv = ["pdf_2_text.py", "--input-dir", str(tmp_path), "--output-dir", str(output_dir), "--workers", "1",
+            "--cache-dir", ""]
+    monkeypatch.setattr(sys, "argv", argv)
+    ocr.main()
+    assert os.path.exists(output_dir / "ocr_scan.pdf") and len(ocr.calls) == 3
+
+    ocr.calls.clear()
+    ocr.main()
+    assert ocr.calls == []  # up to date
+    monkeypatch.setattr(sys, "argv", argv + ["--force"])
+    ocr.main()
+    assert len(ocr.calls) == 3
+
+
+def test_documents_carry_source_and_zero_based_pages(ocr, scan):
+    docs = list(ocr.ocr_documents(scan, workers=1, cache_dir=""))
+    assert [doc.metadata for doc in docs[:2]] == [{"source": scan, "page": 0}, {"source": scan, "page": 1}]
+    assert docs[0].page_content == "page 1"
+    assert docs[-1].metadata["page"] == 18
@@ -0,0 +1,132 @@
+from typing import Any, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, LLMResult
+
+import interactive_chat
+import query_data
+from benchmark import StubLLM
+from conversation_memory import ConversationMemory, count_tokens, is_summary_prompt, llm_summarizer
+from prompt_cache import CachedPrompt, PrefillTracker, prefill_callback
+from retrieval_cache import retrieval_cache
+
+
+def fake_search(db, query_text, k):
+    # Different evidence every turn, as real retrieval would return.
+    return [(Document(page_content=f"passage about {query_text}", metadata={"id": f"book.pdf:1:{len(query_text)}"}),
+             0.1)]
+
+
+def test_prefix_is_fixed_and_first():
+    prompt = CachedPrompt("Be kind.\n", "CONTEXT:\n{context}\n\nQ: {question}")
+    assert prompt.format(context="a", question="b") == "Be kind.\n\nCONTEXT:\na\n\nQ: b"
+    assert prompt.format(context="c", question="d").startswith(prompt.prefix)
+
+
+def test_tracker_counts_shared_prefix():
+    tracker = PrefillTracker()
+    assert tracker.record("GUIDELINES" * 10 + "first question") == 0
+    assert tracker.record("GUIDELINES" * 10 + "second question") == count_tokens("GUIDELINES" * 10)
+    assert tracker.stats()["prompts"] == 2
+
+
+class FakeStore:
+    space = "l2"
+
+
+def test_chat_turns_reuse_the_guideline_prefix(monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "search", fake_search)
+    model = StubLLM(first_token_seconds=0, token_seconds=0)
+    history = ConversationMemory()
+    for question in ["I failed my exam", "How do I stop procrastinating?", "I can't sleep"]:
+        response, _sources, _relevant = interactive_chat.query_rag(question, history, FakeStore(), model)
+        history.append(question, response)
+
+    prefix = interactive_chat.PROMPT_TEMPLATE.prefix
+    assert all(prompt.startswith(prefix) for prompt in model.prompts)
+    # After the first turn the stub never re-reads the guidelines.
+    assert model.cached_tokens[0] == 0
+    assert all(cached >= count_tokens(prefix) - 1 for cached in model.cached_tokens[1:])
+
+
+def test_one_shot_prompts_share_the_prefix(monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "search", fake_search)
+    model = StubLLM(first_token_seconds=0, token_seconds=0)
+    query_data.query_rag("What is anxiety?", None, model)
+    query_data.query_rag("What is burnout?", None, model)
+    assert model.prompts[1].startswith(query_data.PROMPT_TEMPLATE.prefix)
+    assert model.cached_tokens[1] >= count_tokens(query_data.PROMPT_TEMPLATE.prefix) - 1
+
+
+def test_tracker_keeps_summaries_out_of_turn_stats():
+    tracker = PrefillTracker()
+    tracker.record("GUIDELINES" * 10 + "first question")
+    # A summary replaces the cached prompt but is not a turn.
+    assert tracker.record("NOTES" * 10, summary=True) == 0
+    assert tracker.record("GUIDELINES" * 10 + "second question") == 0
+    stats = tracker.stats()
+    assert stats["prompts"] == 2 and stats["summaries"] == 1
+
+
+def test_summaries_keep_the_guideline_prefix_cached(monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "search", fake_search)
+    model = StubLLM(first_token_seconds=0, token_seconds=0)
+    tracker = PrefillTracker()
+    prefix = interactive_chat.PROMPT_TEMPLATE.prefix
+    history = ConversationMemory(summarize=llm_summarizer(lambda: model, prefix, tracker), recent_turns=1)
+    for question in ["I failed my exam", "How do I stop procrastinating?", "I can't sleep"]:
+        response, _sources, _relevant = interactive_chat.query_rag(question, history, FakeStore(), model)
+        history.append(question, response)
+        assert history.wait(5)
+
+    summaries = [prompt for prompt in model.prompts if is_summary_prompt(prompt)]
+    assert summaries and all(prompt.startswith(prefix) for prompt in summaries)
+    # Every prompt after the first, summary or turn, found the guidelines cached.
+    assert all(cached >= count_tokens(prefix) - 1 for cached in model.cached_tokens[1:])
+    assert tracker.stats()["summaries"] == len(summaries)
+
+
+def test_tracker_remembers_the_last_prompt_per_session():
+    tracker = PrefillTracker()
+    tracker.record("GUIDELINES" * 10 + "alice 1", session="alice")
+    # Another session's turn in between doesn't evict alice's prompt.
+    tracker.record("OTHER" * 10, session="bob")
+    assert tracker.record("GUIDELINES" * 10 + "alice 2", session="alice") == count_tokens("GUIDELINES" * 10 + "alice ")
+    tracker.forget("alice")
+    assert tracker.record("GUIDELINES" * 10 + "alice 3", session="alice") == 0
+
+
+class ReportingLLM(LLM):
+    """Reports prefill the way Ollama's final response does."""
+
+    prompt_eval_count: Optional[int] = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "reporting"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        raise NotImplementedError
+
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs):
+        info = {"done": True, "total_duration": 9_000_000_000, "prompt_eval_duration": 500_000_000}
+        if self.prompt_eval_count is not None:
+            info["prompt_eval_count"] = self.prompt_eval_count
+        return LLMResult(generations=[[Generation(text="ok", generation_info=info)]])
+
+
+def test_callback_records_what_ollama_reports_for_turns_only():
+    tracker = PrefillTracker()
+    model = ReportingLLM(callbacks=[prefill_callback(tracker)])
+    model.invoke("GUIDELINES first question")
+    model.invoke("Hello", config={"tags": ["warmup"]})
+    summarize = llm_summarizer(lambda: model, "GUIDELINES ")
+    summarize("", [("I failed my exam", "That sounds hard.")])
+    # Fully cached prompt: Ollama leaves prompt_eval_count out.
+    ReportingLLM(prompt_eval_count=None, callbacks=[prefill_callback(tracker)]).invoke("GUIDELINES again")
+
+    stats = tracker.stats()
+    assert stats["measured"] == 2
+    assert stats["prefill_tokens_per_turn"] == 20
+    assert stats["prefill_seconds_per_turn"] == 0.5
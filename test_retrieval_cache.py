@@ -0,0 +1,81 @@
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval_cache import RetrievalCache, bump_collection_version
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    queries: int = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+def make_db(tmp_path, embeddings):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=embeddings)
+    db.add_documents(
+        [Document(page_content=f"passage {i} about exam anxiety", metadata={"id": f"book.pdf:0:{i}"}) for i in range(6)],
+        ids=[f"book.pdf:0:{i}" for i in range(6)],
+    )
+    return db
+
+
+def test_repeated_query_is_served_from_cache(tmp_path):
+    embeddings = CountingEmbeddings(size=8)
+    db = make_db(tmp_path, embeddings)
+    cache = RetrievalCache(chroma_path=str(tmp_path / "chroma"), compress=False)
+
+    first = cache.search(db, "I feel anxious about exams", k=3)
+    again = cache.search(db, "  i feel anxious about EXAMS!  ", k=3)
+    assert again == first
+    assert first == db.similarity_search_with_score("I feel anxious about exams", k=3)
+    assert cache.stats()["hits"] == 1
+    # One embed_query for our first lookup, one for the reference search above.
+    assert embeddings.queries == 2
+
+
+def test_reingest_invalidates_results_but_keeps_embedding(tmp_path):
+    embeddings = CountingEmbeddings(size=8)
+    db = make_db(tmp_path, embeddings)
+    cache = RetrievalCache(chroma_path=str(tmp_path / "chroma"))
+
+    cache.search(db, "I feel anxious about exams", k=3)
+    bump_collection_version(str(tmp_path / "chroma"))
+    cache.search(db, "I feel anxious about exams", k=3)
+    assert cache.stats()["misses"] == 2
+    assert embeddings.queries == 1
+
+
+def test_results_are_shared_between_processes(tmp_path):
+    db = make_db(tmp_path, CountingEmbeddings(size=8))
+    shared_path = str(tmp_path / "retrieval_cache.sqlite")
+    chroma_path = str(tmp_path / "chroma")
+
+    RetrievalCache(shared_path=shared_path, chroma_path=chroma_path).search(db, "exam stress", k=2)
+    other_process = RetrievalCache(shared_path=shared_path, chroma_path=chroma_path)
+    other_process.search(db, "exam stress", k=2)
+    assert other_process.stats()["hits"] == 1
+
+
+def test_query_embeddings_are_keyed_by_exact_text(tmp_path):
+    embeddings = CountingEmbeddings(size=8)
+    cache = RetrievalCache(chroma_path=str(tmp_path / "chroma"))
+    assert cache.embed_query(embeddings, "Am I failing?") != cache.embed_query(embeddings, "am i failing")
+    cache.embed_query(embeddings, "Am I failing?")
+    assert embeddings.queries == 2
+
+
+def test_old_versions_are_purged_once(tmp_path):
+    db = make_db(tmp_path, CountingEmbeddings(size=8))
+    chroma_path = str(tmp_path / "chroma")
+    cache = RetrievalCache(shared_path=str(tmp_path / "retrieval_cache.sqlite"), chroma_path=chroma_path)
+    cache.search(db, "exam stress", k=2)
+    bump_collection_version(chroma_path)
+    statements = []
+    cache._shared.set_trace_callback(statements.append)
+    for query in ["exam stress", "sleep", "motivation"]:
+        cache.search(db, query, k=2)
+    assert sum(statement.startswith("DELETE") for statement in statements) == 1
+    assert cache._shared.execute("SELECT COUNT(*) FROM results").fetchone() == (3,)
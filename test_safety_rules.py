@@ -1,4 +1,12 @@
+import re
+import time
+import zlib
+
 import pytest
+from langchain_core.embeddings import Embeddings
+
+from crisis_screening import (HELD_OUT_BENIGN, HELD_OUT_CRISIS, TARGET_RECALL, CrisisScreener, calibrate_threshold,
+                              semantic_threshold)
 from interactive_chat import check_for_crisis, CRISIS_KEYWORDS
 
 # CRITIQUE FIX: Rule-Based Evaluation.
@@ -15,7 +23,11 @@ def test_crisis_detection_context():
     dangerous_inputs = [
         "I am thinking about suicide today",
         "It would be better if I just end it all",
-        "I have been cutting myself lately"
+        "I have been cutting myself lately",
+        "I started cutting again",
+        "I have been cutting",
+        "I cut my wrists last night",
+        "I keep cutting down my arm",
     ]
     for text in dangerous_inputs:
         assert check_for_crisis(text) is True, f"Failed to detect danger in: {text}"
@@ -39,12 +51,153 @@ def test_false_positives():
         if check_for_crisis(text):
             print(f"⚠️ Warning: False Positive detected for '{text}'")
 
+def test_word_boundaries():
+    """Keywords only match whole words and phrases, so everyday slang stays safe."""
+    safe_inputs = [
+        "I keep cutting class to sleep in",
+        "My professor is cutting the curve this semester",
+        "I'm cutting back on caffeine",
+        "We're cutting it close with this deadline",
+        "The movie was killer",
+        "I want to kill this exam",
+    ]
+    for text in safe_inputs:
+        assert check_for_crisis(text) is False, f"False positive for: {text}"
+
+def test_keyword_variants():
+    """Spacing, hyphens and case must not let a crisis phrase slip through."""
+    for text in ["I've had SUICIDAL thoughts", "thinking about self harm", "i keep  hurting myself"]:
+        assert check_for_crisis(text) is True, f"Failed to detect danger in: {text}"
+
+# --- SEMANTIC LAYER ---
+# A deterministic bag-of-words stand-in for the sentence-transformer, so the
+# centroid logic can be tested without downloading a model.
+STOP_WORDS = {"i", "i'm", "to", "the", "my", "a", "of", "on", "in", "when", "me", "am", "be",
+              "it", "and", "about", "keep", "feel", "want", "don't", "lately", "honestly", "how", "can", "do"}
+
+class BagOfWordsEmbeddings(Embeddings):
+    def __init__(self, size=256):
+        self.size = size
+
+    def _vector(self, text):
+        vector = [0.0] * self.size
+        for word in re.findall(r"[a-z']+", text.lower()):
+            if word not in STOP_WORDS:
+                vector[zlib.crc32(word.encode()) % self.size] += 1
+        vector[-1] += 0.01  # never all zeros
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+def test_semantic_screen_catches_paraphrases():
+    """Paraphrases with no crisis keyword are caught via exemplar centroids."""
+    embeddings = BagOfWordsEmbeddings()
+    screener = CrisisScreener(embeddings, threshold=0.35)
+    paraphrases = [
+        "Honestly I don't want to be alive anymore",
+        "lately I keep thinking about ending my life",
+        "I took a bottle of pills",
+        "I swallowed all of my medication last night",
+    ]
+    for text in paraphrases:
+        assert check_for_crisis(text) is False  # the keyword floor misses these...
+        assert screener.screen(embeddings.embed_query(text)), f"Semantic layer missed: {text}"  # ...this doesn't
+
+    safe_inputs = ["I am worried about my grades", "How can I stop procrastinating on my essay",
+                   "My roommate keeps me up at night", "I'm thinking about changing my major"]
+    for text in safe_inputs:
+        assert screener.screen(embeddings.embed_query(text)) is None, f"Semantic false positive: {text}"
+
+def test_calibration_keeps_recall_and_reports_precision():
+    embeddings = BagOfWordsEmbeddings()
+    screener = CrisisScreener(embeddings, threshold=0.0)
+    crisis = ["I don't want to be alive", "thinking about ending my life", "I took all my pills",
+              "I cut my arms again"]
+    benign = ["I am worried about my grades", "my pills are in my bag", "I want to change my life"]
+    calibration = calibrate_threshold(screener, embeddings, crisis, benign, target_recall=0.75)
+
+    flagged = [bool(screener.similarities(embeddings.embed_documents([text]))[0] >= calibration["threshold"])
+               for text in crisis + benign]
+    assert calibration["recall"] == sum(flagged[:len(crisis)]) / len(crisis) >= 0.75
+    true_positives, false_positives = sum(flagged[:len(crisis)]), sum(flagged[len(crisis):])
+    assert calibration["precision"] == true_positives / (true_positives + false_positives)
+
+
+def test_threshold_comes_from_the_recorded_calibration(tmp_path, monkeypatch):
+    monkeypatch.delenv("CRISIS_SEMANTIC_THRESHOLD", raising=False)
+    path = tmp_path / "index_config.json"
+    path.write_text('{"crisis_screening": {"threshold": 0.42, "precision": 0.9, "recall": 1.0}}')
+    assert semantic_threshold(path) == 0.42
+    monkeypatch.setenv("CRISIS_SEMANTIC_THRESHOLD", "0.5")
+    assert semantic_threshold(path) == 0.5
+
+
+def real_embeddings():
+    pytest.importorskip("sentence_transformers")
+    from get_embedding_function import get_embedding_function
+    try:
+        return get_embedding_function()
+    except Exception as e:  # no network and no cached model
+        pytest.skip(f"embedding model unavailable: {e}")
+
+
+def test_threshold_separates_the_held_out_set_with_the_real_model():
+    """The configured threshold keeps recall on held-out paraphrases the exemplars don't contain."""
+    embeddings = real_embeddings()
+    screener = CrisisScreener(embeddings)
+    flagged = screener.similarities(embeddings.embed_documents(HELD_OUT_CRISIS)) >= screener.threshold
+    false_alarms = screener.similarities(embeddings.embed_documents(HELD_OUT_BENIGN)) >= screener.threshold
+    recall = flagged.mean()
+    precision = flagged.sum() / (flagged.sum() + false_alarms.sum())
+    print(f"\nThreshold {screener.threshold:.3f}: precision {precision:.2f}, recall {recall:.2f}")
+    assert recall >= TARGET_RECALL, "recalibrate with `python crisis_screening.py --apply`"
+    assert precision >= 0.8
+
+# --- BENCHMARKS ---
+# Screening runs on every single turn, so both layers must stay sub-millisecond.
+BENCH_MESSAGE = (
+    "I've been really stressed about midterms and I keep cutting class to catch up on sleep, "
+    "my roommate is loud and I feel like nobody in my program actually likes me. "
+) * 3
+
+def test_keyword_screening_is_sub_millisecond():
+    runs = 5000
+    start = time.perf_counter()
+    for _ in range(runs):
+        check_for_crisis(BENCH_MESSAGE)
+    per_call = (time.perf_counter() - start) / runs
+    print(f"\nKeyword screening: {per_call * 1e6:.1f} µs/turn")
+    assert per_call < 1e-3
+
+def test_semantic_screening_is_sub_millisecond():
+    # Same width as all-MiniLM-L6-v2 output. The embedding itself is reused
+    # from retrieval, so only the centroid comparison is on the hot path.
+    embeddings = BagOfWordsEmbeddings(size=384)
+    screener = CrisisScreener(embeddings)
+    query_embedding = embeddings.embed_query(BENCH_MESSAGE)
+    runs = 5000
+    start = time.perf_counter()
+    for _ in range(runs):
+        screener.screen(query_embedding)
+    per_call = (time.perf_counter() - start) / runs
+    print(f"\nSemantic screening: {per_call * 1e6:.1f} µs/turn")
+    assert per_call < 1e-3
+
 if __name__ == "__main__":
     # Simple manual run if pytest is not installed
     try:
         test_crisis_detection_keywords()
         test_crisis_detection_context()
         test_false_positives()
+        test_word_boundaries()
+        test_keyword_variants()
+        test_semantic_screen_catches_paraphrases()
+        test_keyword_screening_is_sub_millisecond()
+        test_semantic_screening_is_sub_millisecond()
         print("✅ All Safety Rule Tests Passed!")
     except AssertionError as e:
         print(f"❌ Safety Test Failed: {e}")
\ No newline at end of file
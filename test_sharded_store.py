@@ -0,0 +1,132 @@
+import csv
+import os
+import time
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import dataset
+from mmap_store import open_vector_store
+from sharded_store import ShardedVectorStore, shard_key, shard_of, shard_path
+
+QUESTIONS = ["How do I handle exam stress?", "I can't sleep before tests", "What is learned helplessness?"]
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: DeterministicFakeEmbedding(size=16))
+    monkeypatch.setattr("mmap_store.VECTOR_STORE", "chroma")
+    os.mkdir("data")
+    for i in range(6):
+        with open(f"data/topic_{i}.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["text"])
+            for row in range(10):
+                writer.writerow([f"Topic {i} paragraph {row} about coping with stress, sleep and motivation."])
+    return tmp_path
+
+
+def reference_results(tmp_path):
+    """The same corpus in one unsharded collection."""
+    from langchain_chroma import Chroma
+    chunks = dataset.calculate_chunk_ids(dataset.split_documents(dataset.load_documents(["data"])))
+    db = Chroma(persist_directory=str(tmp_path / "single"), embedding_function=DeterministicFakeEmbedding(size=16))
+    db.add_documents(chunks, ids=[chunk.metadata["id"] for chunk in chunks])
+    return {q: [doc.metadata["id"] for doc, _ in db.similarity_search_with_score(q, k=5)] for q in QUESTIONS}
+
+
+@pytest.mark.parametrize("shard_by", ["source", "hash"])
+def test_scatter_gather_matches_a_single_collection(corpus, shard_by):
+    dataset.ingest(["data"], shards=3, shard_by=shard_by)
+    store = open_vector_store(DeterministicFakeEmbedding(size=16), "chroma")
+    assert isinstance(store, ShardedVectorStore)
+
+    counts = store.scatter(lambda db: db._collection.count(), "count")
+    assert sum(counts.values()) == store._collection.count() == 60
+    assert sum(1 for count in counts.values() if count) > 1
+    for shard, db in store.shards.items():
+        assert all(shard_of(shard_key(chunk_id, shard_by), 3) == shard for chunk_id in db.get(include=[])["ids"])
+
+    expected = reference_results(corpus)
+    for question in QUESTIONS:
+        assert [doc.metadata["id"] for doc, _ in store.similarity_search_with_score(question, k=5)] == expected[question]
+
+
+def test_shards_built_by_separate_workers(corpus):
+    for shard in range(2):
+        dataset.ingest(["data"], shards=2, shard_by="source", only_shard=shard)
+        assert os.path.exists(os.path.join(shard_path("chroma", shard), "ingest_manifest.json"))
+    store = ShardedVectorStore(DeterministicFakeEmbedding(size=16), "chroma")
+    assert store._collection.count() == 60
+    # Re-running a worker finds its files unchanged.
+    dataset.ingest(["data"], shards=2, shard_by="source", only_shard=0)
+    assert store._collection.count() == 60
+
+
+def test_slow_or_missing_shard_is_skipped(corpus):
+    dataset.ingest(["data"], shards=3, shard_by="hash")
+    store = ShardedVectorStore(DeterministicFakeEmbedding(size=16), "chroma", timeout=0.3)
+    slow = store.shards[0]
+    search = slow.similarity_search_by_vector_with_relevance_scores
+
+    def stalled(*args, **kwargs):
+        time.sleep(1)
+        return search(*args, **kwargs)
+
+    slow.similarity_search_by_vector_with_relevance_scores = stalled
+    start = time.perf_counter()
+    results = store.similarity_search_with_score("exam stress", k=5)
+    assert time.perf_counter() - start < 0.9
+    assert len(results) == 5 and store.partial_results == 1
+    assert all(shard_of(doc.metadata["id"], 3) != 0 for doc, _ in results)
+
+    import shutil
+    shutil.rmtree(shard_path("chroma", 2))
+    degraded = ShardedVectorStore(DeterministicFakeEmbedding(size=16), "chroma")
+    assert sorted(degraded.shards) == [0, 1]
+    assert len(degraded.similarity_search_with_score("exam stress", k=5)) == 5
+
+
+def test_worker_shards_keep_their_lexical_indexes_current(corpus):
+    from retrieval_cache import open_lexical_index
+    for shard in range(2):
+        dataset.ingest(["data"], shards=2, shard_by="source", only_shard=shard)
+    index = open_lexical_index("chroma")
+    assert len(index) == 60
+    # Both shards' indexes answer.
+    hits = index.search("Topic paragraph stress", k=20)
+    assert {shard_of(chunk_id.rsplit(":", 2)[0], 2) for chunk_id, _ in hits} == {0, 1}
+
+    # A later run of one worker is visible without any manual rebuild.
+    with open("data/topic_0.csv", "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(["Seligman described learned helplessness."])
+    dataset.ingest(["data"], shards=2, shard_by="source", only_shard=shard_of("data/topic_0.csv", 2))
+    index = open_lexical_index("chroma")
+    assert index.search("Seligman helplessness", k=1)[0][0].startswith("data/topic_0.csv:")
+
+
+def test_sharded_ingest_writes_one_lexical_index_per_shard(corpus):
+    dataset.ingest(["data"], shards=3, shard_by="hash")
+    assert not os.path.exists(os.path.join("chroma", "lexical_index.sqlite"))
+    assert sum(os.path.exists(os.path.join(shard_path("chroma", shard), "lexical_index.sqlite"))
+               for shard in range(3)) == 3
+
+
+def test_store_without_any_shard_fails_clearly(corpus):
+    from sharded_store import write_layout
+    write_layout("chroma", 2, "source")
+    with pytest.raises(ValueError, match="None of the 2 shards"):
+        ShardedVectorStore(DeterministicFakeEmbedding(size=16), "chroma")
+
+
+def test_concurrent_writers_use_their_own_temp_files(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor as Pool
+    from retrieval_cache import bump_collection_version, read_collection_version
+    from sharded_store import read_layout, write_layout
+    with Pool(max_workers=8) as pool:
+        list(pool.map(lambda _: (write_layout(str(tmp_path), 4, "source"), bump_collection_version(str(tmp_path))),
+                      range(200)))
+    assert read_layout(str(tmp_path)) == {"num_shards": 4, "shard_by": "source"}
+    assert read_collection_version(str(tmp_path))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,106 @@
+import csv
+import json
+import os
+import tracemalloc
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import dataset
+from chroma_client import open_chroma
+from tabular_loaders import iter_rows, schema_for
+
+SCHEMAS = {"qa_*.csv": {"content": ["question", "answer"], "metadata": ["topic"], "id": "qa_id"}}
+
+
+def write_qa(path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["qa_id", "topic", "question", "answer", "internal_notes"])
+        writer.writeheader()
+        writer.writerow({"qa_id": "q-17", "topic": "sleep", "question": "I can't sleep before exams.",
+                         "answer": "Keep a wind-down routine.", "internal_notes": "reviewed"})
+        writer.writerow({"qa_id": "legacy:4", "topic": "stress", "question": "Exams overwhelm me.",
+                         "answer": "", "internal_notes": ""})
+
+
+def test_schema_picks_content_metadata_and_id(tmp_path):
+    path = str(tmp_path / "qa_sleep.csv")
+    write_qa(path)
+    assert schema_for(path, SCHEMAS) == SCHEMAS["qa_*.csv"]
+    first, second = iter_rows(path, SCHEMAS)
+    assert first.page_content == "question: I can't sleep before exams.\nanswer: Keep a wind-down routine."
+    assert first.metadata == {"source": path, "row": "q-17", "topic": "sleep"}
+    # Empty fields are left out; ":" can't appear in a chunk ID part.
+    assert second.page_content == "question: Exams overwhelm me."
+    assert second.metadata["row"] == "legacy_4"
+
+
+def test_ndjson_defaults_to_every_field(tmp_path):
+    path = str(tmp_path / "transcripts.ndjson")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"speaker": "student", "text": "I keep procrastinating.", "tags": ["focus"]}) + "\n\n")
+        f.write(json.dumps("a bare string line") + "\n")
+    docs = list(dataset.load_ndjson(path))
+    assert [doc.metadata["row"] for doc in docs] == [0, 1]
+    assert docs[0].page_content == 'speaker: student\ntext: I keep procrastinating.\ntags: ["focus"]'
+    assert docs[1].page_content == "value: a bare string line"
+
+
+def test_rows_are_streamed(tmp_path):
+    path = str(tmp_path / "big.ndjson")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(50_000):
+            f.write(json.dumps({"id": i, "text": f"Row {i} about study habits and motivation. " * 3}) + "\n")
+    assert os.path.getsize(path) > 5_000_000
+    tracemalloc.start()
+    count = sum(1 for _doc in iter_rows(path, {}))
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert count == 50_000
+    assert peak < 1_000_000
+
+
+def test_parquet_reads_only_used_columns(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    path = str(tmp_path / "qa.parquet")
+    pq.write_table(pa.table({"qa_id": ["a", "b"], "question": ["Why study?", "How to rest?"],
+                             "blob": ["x" * 100, "y" * 100]}), path)
+    docs = list(iter_rows(path, {"*.parquet": {"content": ["question"], "id": "qa_id"}}))
+    assert [(doc.page_content, doc.metadata["row"]) for doc in docs] == [("question: Why study?", "a"),
+                                                                          ("question: How to rest?", "b")]
+
+
+def test_ingest_gives_rows_stable_ids(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: DeterministicFakeEmbedding(size=16))
+    os.mkdir("data")
+    with open("data/chats.jsonl", "w", encoding="utf-8") as f:
+        for i in range(3):
+            f.write(json.dumps({"session": f"s{i}", "text": f"Session {i}: talking through exam nerves."}) + "\n")
+    with open("dataset_schema.json", "w", encoding="utf-8") as f:
+        json.dump({"*.jsonl": {"content": ["text"], "id": "session"}}, f)
+
+    assert dataset.list_source_files(["data"]) == [os.path.join("data", "chats.jsonl")]
+    for workers in [1, 2]:
+        dataset.clear_database()
+        dataset.ingest(["data"], workers=workers)
+        ids = sorted(open_chroma(None).get(include=[])["ids"])
+        assert ids == [f"data/chats.jsonl:s{i}:0" for i in range(3)]
+
+
+def test_rows_with_a_repeated_id_are_all_kept(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset, "get_embedding_function", lambda **kwargs: DeterministicFakeEmbedding(size=16))
+    os.mkdir("data")
+    with open("data/chats.jsonl", "w", encoding="utf-8") as f:
+        for i, session in enumerate(["s1", "s2", "s1", "s1"]):
+            f.write(json.dumps({"session": session, "text": f"Turn {i}: talking through exam nerves."}) + "\n")
+    with open("dataset_schema.json", "w", encoding="utf-8") as f:
+        json.dump({"*.jsonl": {"content": ["text"], "id": "session"}}, f)
+
+    dataset.ingest(["data"])
+    ids = sorted(open_chroma(None).get(include=[])["ids"])
+    assert ids == ["data/chats.jsonl:s1:0", "data/chats.jsonl:s1@2:0", "data/chats.jsonl:s1@3:0",
+                   "data/chats.jsonl:s2:0"]
+    assert "2 rows reuse an earlier row's ID" in capsys.readouterr().out
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake import FakeStreamingListLLM
+
+import query_data
+from warm_start import Startup
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    pass
+
+
+def test_components_load_concurrently(tmp_path, monkeypatch):
+    def load_embeddings():
+        time.sleep(0.3)
+        return SlowEmbeddings(size=8)
+
+    warmed = []
+
+    def load_model(model_name, warmup_prompt):
+        warmed.append(warmup_prompt)
+        time.sleep(0.3)
+        return FakeStreamingListLLM(responses=["ok"])
+
+    monkeypatch.setattr(Startup, "_load_embeddings", staticmethod(load_embeddings))
+    monkeypatch.setattr(Startup, "_load_model", staticmethod(load_model))
+    monkeypatch.setattr("mmap_store.VECTOR_STORE", "chroma")
+
+    started = time.perf_counter()
+    startup = Startup(str(tmp_path / "chroma"), screener=True, warmup_prompt="GUIDELINES")
+    # The main thread is free right away, e.g. to print the disclaimer.
+    assert time.perf_counter() - started < 0.1
+
+    db = startup.db()
+    assert db.embeddings.embed_query("hello") == SlowEmbeddings(size=8).embed_query("hello")
+    assert startup.screener() is not None
+    elapsed = startup.wait()
+    # Embedding model and LLM loaded side by side, not one after the other.
+    assert elapsed < 0.55
+    assert {"embedding model", "vector store", "llm warm-up", "crisis screener"} <= set(startup.timings)
+    assert warmed == ["GUIDELINES"]
+
+
+class ReadyStartup:
+    def __init__(self, db, model):
+        self._db, self._model = db, model
+
+    def db(self):
+        return self._db
+
+    def model(self):
+        return self._model
+
+
+def test_one_shot_is_answered_by_daemon(tmp_path, monkeypatch, capsys):
+    db = Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=8))
+    db.add_documents([Document(page_content="Sleep helps memory.", metadata={"id": "a.pdf:0:0"})], ids=["a.pdf:0:0"])
+    model = FakeStreamingListLLM(responses=["Rest well before the exam."])
+
+    server = query_data.DaemonServer(("127.0.0.1", 0), query_data.DaemonHandler)
+    server.startup = ReadyStartup(db, model)
+    monkeypatch.setattr(query_data, "DAEMON_PORT", server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert query_data.ask_daemon("How do I prepare for exams?")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert capsys.readouterr().out.strip() == "Rest well before the exam."
+
+    # Nobody listening: the caller falls back to answering in-process.
+    assert not query_data.ask_daemon("How do I prepare for exams?")
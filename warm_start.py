@@ -0,0 +1,106 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_MODEL = "mistral"
+# One generated token is enough to make Ollama load the weights. Front-ends
+# pass their static prompt prefix instead, so it is already evaluated (and
+# reused) when the first real question arrives.
+WARMUP_PROMPT = "Hello"
+
+
+def load_warm_llm(model_name=LLM_MODEL, warmup_prompt=WARMUP_PROMPT):
+    """An Ollama LLM that has already been loaded and has seen `warmup_prompt`."""
+    from prompt_cache import ollama_llm
+    model = ollama_llm(model_name)
+    try:
+        # Ollama loads a model on its first request; pay for that now,
+        # not on the student's first question.
+        model.invoke(warmup_prompt, options={"num_predict": 1}, config={"tags": ["warmup"]})
+    except Exception as e:
+        logging.warning(f"LLM warm-up failed: {e}")
+    return model
+
+
+class LazyEmbeddings:
+    """Stands in for an embedding model that is still loading in the background.
+
+    The vector store can be opened with it right away; the first embed call
+    waits for the real model. Deliberately not a langchain Embeddings
+    subclass: importing langchain_core alone costs more than half a second.
+    """
+
+    def __init__(self, future):
+        self._future = future
+
+    def embed_query(self, text):
+        return self._future.result().embed_query(text)
+
+    def embed_documents(self, texts):
+        return self._future.result().embed_documents(texts)
+
+
+class Startup:
+    """Loads the CLI's heavy components in background threads.
+
+    The embedding model, the vector store handle and the warmed-up LLM load
+    concurrently while the disclaimer is on screen and the student types;
+    each accessor blocks only until its own component is ready. Per-phase
+    timings are logged and available from summary().
+    """
+
+    def __init__(self, chroma_path, model_name=LLM_MODEL, screener=False, warmup_prompt=WARMUP_PROMPT):
+        self.timings = {}
+        self._start = time.perf_counter()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup")
+        self._embeddings = self._pool.submit(self._timed, "embedding model", self._load_embeddings)
+        self.embedding_function = LazyEmbeddings(self._embeddings)
+        self._db = self._pool.submit(self._timed, "vector store", self._open_store, chroma_path)
+        self._model = self._pool.submit(self._timed, "llm warm-up", self._load_model, model_name, warmup_prompt)
+        self._screener = self._pool.submit(self._timed, "crisis screener", self._load_screener) if screener else None
+        self._pool.shutdown(wait=False)
+
+    def _timed(self, phase, load, *args):
+        start = time.perf_counter()
+        result = load(*args)
+        self.timings[phase] = time.perf_counter() - start
+        logging.info(f"Startup: {phase} ready in {self.timings[phase]:.2f}s")
+        return result
+
+    @staticmethod
+    def _load_embeddings():
+        from get_embedding_function import get_embedding_function
+        return get_embedding_function()
+
+    def _open_store(self, chroma_path):
+        from mmap_store import open_vector_store
+        return open_vector_store(self.embedding_function, chroma_path)
+
+    @staticmethod
+    def _load_model(model_name, warmup_prompt):
+        return load_warm_llm(model_name, warmup_prompt)
+
+    def _load_screener(self):
+        from crisis_screening import CrisisScreener
+        return CrisisScreener(self._embeddings.result())
+
+    def db(self):
+        return self._db.result()
+
+    def model(self):
+        return self._model.result()
+
+    def screener(self):
+        return self._screener.result() if self._screener else None
+
+    def wait(self):
+        """Block until every component is loaded."""
+        for future in (self._embeddings, self._db, self._model, self._screener):
+            if future is not None:
+                future.result()
+        return time.perf_counter() - self._start
+
+    def summary(self):
+        """Timings of the phases finished so far; never blocks."""
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.timings.items())
+        return f"Startup: {phases or 'nothing loaded yet'}"